@@ -1,14 +1,31 @@
 """Классы для настройки админки."""
-import openpyxl
+import re
+from functools import reduce
+from operator import and_
+
+from django.conf import settings
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
-from django.forms import forms
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Q
+from django.contrib.admin.helpers import ACTION_CHECKBOX_NAME
+from django.forms import IntegerField, ModelChoiceField, forms
 from django.shortcuts import redirect, render
-from django.urls import path
+from django.urls import path, reverse
+from django.utils.html import format_html, format_html_join
+from django.utils.safestring import mark_safe
+from django.utils.functional import cached_property
 from django.utils.translation import gettext_lazy as _
 
+from api.autocomplete import Autocomplete
+from api.bulk import add_competence, add_tag, extend_subscriptions
+from api.exports import EXPORTS
 from api.models import (City, Competence, Event, EventPhoto, Tags, User,
-                        SMSAuth, Participation)
+                        SMSAuth, Participation, ImportJob, CrmSync)
+from api.search import normalize, search_events
+
+re_phone = re.compile(r'\+?\d+')
 
 
 class FileForm(forms.Form):
@@ -17,8 +34,138 @@ class FileForm(forms.Form):
     xlsx_file = forms.FileField()
 
 
+class EstimatedCountPaginator(Paginator):
+    """Пагинатор с оценкой числа строк таблицы без фильтров.
+
+    Для большой таблицы COUNT(*) читает ее целиком, поэтому для списка
+    без фильтров берется оценка из статистики postgres.
+    """
+
+    @cached_property
+    def count(self):
+        """Оценка числа строк или точный COUNT для выборки с фильтрами."""
+        query = getattr(self.object_list, 'query', None)
+        if query is not None and not query.where:
+            estimate = estimated_count(self.object_list)
+            if estimate > settings.ADMIN_ESTIMATED_COUNT_THRESHOLD:
+                return estimate
+        return super().count
+
+
+def estimated_count(queryset) -> int:
+    """Число строк таблицы из статистики postgres, -1 если оценки нет."""
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return -1
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT reltuples FROM pg_class '
+                       'WHERE oid = %s::regclass',
+                       [queryset.model._meta.db_table])
+        row = cursor.fetchone()
+    return int(row[0]) if row else -1
+
+
+def phone_lookup(term: str):
+    """Телефон с плюсом, если строка поиска похожа на телефон."""
+    if re_phone.fullmatch(term):
+        return term if term.startswith('+') else f'+{term}'
+    return None
+
+
+class LargeTableMixin:
+    """Список большой таблицы без полного COUNT(*) на каждой странице."""
+
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+
+class ReferenceSearchMixin:
+    """Поиск справочника по индексу подсказок, затем по уникальному имени."""
+
+    autocomplete_kind = None
+
+    def get_search_results(self, request, queryset, search_term):
+        """Имена из индекса в памяти, в БД только запрос по name IN."""
+        if not search_term.strip():
+            return queryset, False
+        names = Autocomplete.search(self.autocomplete_kind, search_term,
+                                    settings.ADMIN_REFERENCE_SEARCH_LIMIT)
+        return queryset.filter(name__in=names), False
+
+
+def export_action(name, description, fmt):
+    """Действие админки с выгрузкой выбранных записей."""
+    def action(modeladmin, request, queryset):
+        export = EXPORTS[name](queryset)
+        return getattr(export, f'{fmt}_response')()
+
+    action.__name__ = f'export_{name}_{fmt}'
+    action.short_description = description
+    return action
+
+
+class SubscriptionForm(forms.Form):
+    """Параметры продления подписки."""
+
+    days = IntegerField(label='Продлить на дней', min_value=1)
+
+
+class CompetenceForm(forms.Form):
+    """Выбор компетенции для пользователей."""
+
+    competence = ModelChoiceField(Competence.objects.all(),
+                                  label='Компетенция')
+
+
+class TagForm(forms.Form):
+    """Выбор тега для событий."""
+
+    tag = ModelChoiceField(Tags.objects.all(), label='Тег')
+
+
+def bulk_action(form_class, description):
+    """Действие админки с формой параметров перед применением."""
+    def decorator(func):
+        def action(modeladmin, request, queryset):
+            form = form_class(request.POST if 'apply' in request.POST
+                              else None)
+            if form.is_valid():
+                count = func(queryset, **form.cleaned_data)
+                modeladmin.message_user(request,
+                                        f'{description}: {count} записей')
+                return None
+            return render(request, 'admin/bulk_action_form.html', {
+                **modeladmin.admin_site.each_context(request),
+                'title': description, 'form': form,
+                'action': action.__name__, 'count': queryset.count(),
+                'selected': request.POST.getlist(ACTION_CHECKBOX_NAME),
+                'select_across': request.POST.get('select_across', '0')})
+
+        action.__name__ = func.__name__
+        action.short_description = description
+        return action
+    return decorator
+
+
+class ImportJobMixin:
+    """Загрузка файла из админки через фоновую задачу."""
+
+    def queue_import(self, request, kind):
+        """Форма файла, по отправке файл сохраняется в очередь загрузки."""
+        if request.method == 'POST':
+            job = ImportJob.objects.create(kind=kind,
+                                           file=request.FILES['xlsx_file'])
+            url = reverse('admin:api_importjob_change', args=[job.pk])
+            self.message_user(request, format_html(
+                'Файл поставлен в очередь загрузки, '
+                '<a href="{}">статус загрузки</a>', url))
+            return redirect('..')
+        return render(request, 'admin/import_file_form.html',
+                      {'form': FileForm()})
+
+
 @admin.register(User)
-class CustomUserAdmin(UserAdmin):
+class CustomUserAdmin(LargeTableMixin, ImportJobMixin, UserAdmin):
     """Класс для настроек админки модели Пользователь."""
 
     change_list_template = 'admin/import_users_changelist.html'
@@ -40,9 +187,16 @@ class CustomUserAdmin(UserAdmin):
     list_display = ('phone', 'subscription_expiration_date', 'first_name',
                     'last_name', 'is_superuser')
     list_filter = ('subscription_expiration_date', 'is_superuser')
-    filter_horizontal = ('competences', 'groups',
-                         'user_permissions')
+    filter_horizontal = ('groups', 'user_permissions')
+    autocomplete_fields = ('city', 'competences')
     search_fields = ('phone', 'first_name', 'last_name')
+    date_hierarchy = 'date_of_registration'
+    actions = (export_action('users', 'Выгрузить в CSV', 'csv'),
+               export_action('users', 'Выгрузить в XLSX', 'xlsx'),
+               bulk_action(SubscriptionForm,
+                           'Продлить подписку')(extend_subscriptions),
+               bulk_action(CompetenceForm,
+                           'Добавить компетенцию')(add_competence))
 
     def get_urls(self):
         """Добавление кастомных запросов в админку."""
@@ -51,33 +205,24 @@ class CustomUserAdmin(UserAdmin):
         ] + super().get_urls()
 
     def import_users(self, request):
-        """Обработчик загрузки пользователей из файла."""
-        if request.method == 'POST':
-            book = openpyxl.load_workbook(request.FILES['xlsx_file'],
-                                          read_only=True, data_only=True)
-            sheet = book.get_sheet_by_name(book.get_sheet_names()[0])
-            head = [cell.value for cell in sheet['A1':'D1'][0]]
-
-            for row in sheet['A2':f'D{sheet.max_row}']:
-                item = self._prepare_row(head, row)
-                user, _ = User.objects.get_or_create(phone=item['Телефон'],
-                                                     username=item['Телефон'])
-                user.last_name = item['Фамилия']
-                user.first_name = item['Имя']
-                user.subscription_expiration_date = item['Подписка']
-                user.save()
-            self.message_user(request, 'Пользователи загружены')
-            return redirect('..')
-        return render(request, 'admin/import_file_form.html',
-                      {'form': FileForm()})
-
-    def _prepare_row(self, head, row):
-        """Обработка строки с пользователем из файла."""
-        item = {head[cell.column - 1]: cell.value for cell in row}
-        item['Телефон'] = str(item['Телефон'])
-        if not item['Телефон'].startswith('+'):
-            item['Телефон'] = '+' + item['Телефон']
-        return item
+        """Постановка файла в очередь загрузки."""
+        return self.queue_import(request, 'users')
+
+    def get_search_results(self, request, queryset, search_term):
+        """Поиск по префиксу телефона или поисковому тексту.
+
+        Префикс телефона ищется по индексу varchar_pattern_ops уникального
+        поля, слова - по триграммному индексу search_document.
+        """
+        term = search_term.strip()
+        if not term:
+            return queryset, False
+        phone = phone_lookup(term)
+        if phone:
+            return queryset.filter(phone__startswith=phone), False
+        words = normalize(term).split()
+        return queryset.filter(reduce(and_, (
+            Q(search_document__contains=word) for word in words))), False
 
     def save_model(self, request, obj, form, change):
         """Замена пустого поля phone номером телефона."""
@@ -93,25 +238,42 @@ class EventPhotoInline(admin.TabularInline):
     model = EventPhoto
 
 
-class ParticipationInline(admin.StackedInline):
-    """Класс настройки участия в событии."""
+@admin.register(Participation)
+class ParticipationAdmin(LargeTableMixin, admin.ModelAdmin):
+    """Участники события постранично вместо встроенного списка."""
+
+    list_display = ('event', 'user')
+    list_select_related = ('event', 'user')
+    autocomplete_fields = ('event', 'user')
+    search_fields = ('user__phone',)
 
-    model = Participation
-    exclude = ('user', )
-    extra = 0
+    def get_search_results(self, request, queryset, search_term):
+        """Поиск участника по префиксу телефона."""
+        phone = phone_lookup(search_term.strip())
+        if phone:
+            return queryset.filter(user__phone__startswith=phone), False
+        return super().get_search_results(request, queryset, search_term)
 
 
 @admin.register(Event)
-class CustomEventAdmin(admin.ModelAdmin):
+class CustomEventAdmin(LargeTableMixin, ImportJobMixin, admin.ModelAdmin):
     """Класс для настроек админки модели События."""
 
     fields = ('title', 'description', 'start_date', 'end_date',
-              'address', 'tags')
+              'address', 'tags', 'participants')
+    readonly_fields = ('participants',)
     list_display = ('title', 'start_date', 'end_date', 'address')
     list_filter = ('start_date',)
     search_fields = ['title', 'address']
-    filter_horizontal = ('tags',)
-    inlines = [EventPhotoInline, ParticipationInline]
+    autocomplete_fields = ('tags',)
+    date_hierarchy = 'start_date'
+    inlines = [EventPhotoInline]
+    actions = (
+        export_action('participants', 'Выгрузить участников в CSV', 'csv'),
+        export_action('participants', 'Выгрузить участников в XLSX', 'xlsx'),
+        export_action('favorites', 'Выгрузить избранное в CSV', 'csv'),
+        export_action('favorites', 'Выгрузить избранное в XLSX', 'xlsx'),
+        bulk_action(TagForm, 'Добавить тег')(add_tag))
     change_list_template = 'admin/import_events_changelist.html'
 
     def get_urls(self):
@@ -121,44 +283,45 @@ class CustomEventAdmin(admin.ModelAdmin):
         ] + super().get_urls()
 
     def import_events(self, request):
-        """Обработчик загрузки событий из файла."""
-        if request.method == 'POST':
-            book = openpyxl.load_workbook(request.FILES['xlsx_file'],
-                                          data_only=True)
-            sheet = book.get_sheet_by_name(book.get_sheet_names()[0])
-            head = [cell.value for cell in sheet['A1':'D1'][0]]
-            for row in sheet['A2':'D26']:
-                item = self._prepare_row(head, row)
-                event, _ = (Event.objects.get_or_create
-                            (title=item['Название'],
-                             description=item['Описание'],
-                             start_date=item['Дата начала события'],
-                             end_date=item['Дата окончания события']))
+        """Постановка файла в очередь загрузки."""
+        return self.queue_import(request, 'events')
 
-            return redirect('..')
-        return render(request, 'admin/import_file_form.html',
-                      {'form': FileForm()})
+    def get_search_results(self, request, queryset, search_term):
+        """Полнотекстовый поиск по индексу события."""
+        if not search_term.strip():
+            return queryset, False
+        return search_events(queryset, search_term), False
 
-    def _prepare_row(self, head, row):
-        item = {head[cell.column - 1]: cell.value for cell in row}
-        if item['Описание'] is None:
-            item['Описание'] = ''
-        return item
+    def participants(self, obj):
+        """Ссылка на постраничный список участников события."""
+        if not obj.pk:
+            return '-'
+        url = reverse('admin:api_participation_changelist')
+        count = obj.participation_set.count()
+        return format_html('<a href="{}?event__id__exact={}">'
+                           'Участники: {}</a>', url, obj.pk, count)
+
+    participants.short_description = 'Участники'
 
 
 @admin.register(Tags)
-class CustomTagsAdmin(admin.ModelAdmin):
+class CustomTagsAdmin(ReferenceSearchMixin, admin.ModelAdmin):
     """Класс для настроек админки модели Теги."""
 
+    autocomplete_kind = 'tags'
     list_display = ('name', 'city')
+    list_select_related = ('city',)
+    autocomplete_fields = ('city',)
     list_filter = ('name',)
     search_fields = ('name',)
 
 
 @admin.register(City)
-class CustomCityAdmin(admin.ModelAdmin):
+class CustomCityAdmin(ReferenceSearchMixin, ImportJobMixin,
+                      admin.ModelAdmin):
     """Класс для настроек админки модели Города."""
 
+    autocomplete_kind = 'cities'
     ordering = ('name', )
     search_fields = ('name',)
     change_list_template = 'admin/import_cities_changelist.html'
@@ -171,23 +334,16 @@ class CustomCityAdmin(admin.ModelAdmin):
         ] + super().get_urls()
 
     def import_cities(self, request):
-        """Обработчик загрузки городов из файла."""
-        if request.method == 'POST':
-            uploaded_file = request.FILES['xlsx_file']
-            cities = uploaded_file.read().decode('utf-8').splitlines()
-
-            for city in cities:
-                City.objects.get_or_create(name=city)
-            self.message_user(request, 'Города загружены')
-            return redirect('..')
-        return render(request, 'admin/import_file_form.html',
-                      {'form': FileForm()})
+        """Постановка файла в очередь загрузки."""
+        return self.queue_import(request, 'cities')
 
 
 @admin.register(Competence)
-class CustomCompetenceAdmin(admin.ModelAdmin):
+class CustomCompetenceAdmin(ReferenceSearchMixin, ImportJobMixin,
+                            admin.ModelAdmin):
     """Класс для настроек админки модели Компетенции."""
 
+    autocomplete_kind = 'competences'
     search_fields = ('name',)
     change_list_template = 'admin/import_competences_changelist.html'
 
@@ -199,22 +355,93 @@ class CustomCompetenceAdmin(admin.ModelAdmin):
         ] + super().get_urls()
 
     def import_competences(self, request):
-        """Обработчик загрузки компетенций из файла."""
-        if request.method == 'POST':
-            book = openpyxl.load_workbook(request.FILES['xlsx_file'],
-                                          read_only=True, data_only=True)
-            sheet = book.get_sheet_by_name(book.get_sheet_names()[0])
-            for row in sheet['A1':f'A{sheet.max_row}']:
-                for name in row:
-                    Competence.objects.get_or_create(name=name.value)
-            self.message_user(request, 'Компетенции загружены')
-            return redirect('..')
-        return render(request, 'admin/import_file_form.html',
-                      {'form': FileForm()})
+        """Постановка файла в очередь загрузки."""
+        return self.queue_import(request, 'competences')
 
 
 @admin.register(SMSAuth)
-class CustomSMSAuthAdmin(admin.ModelAdmin):
+class CustomSMSAuthAdmin(LargeTableMixin, admin.ModelAdmin):
     """Класс для настроек админки модели Смс."""
 
     list_display = ('phone', 'code', 'attempts', 'send_at', 'is_used')
+    search_fields = ('phone',)
+    date_hierarchy = 'send_at'
+
+    def get_search_results(self, request, queryset, search_term):
+        """Поиск по точному телефону, индекс (phone, send_at)."""
+        phone = phone_lookup(search_term.strip())
+        if phone:
+            return queryset.filter(phone=phone), False
+        return queryset.none() if search_term.strip() else queryset, False
+
+
+@admin.register(ImportJob)
+class ImportJobAdmin(admin.ModelAdmin):
+    """Статус фоновых загрузок файлов."""
+
+    list_display = ('__str__', 'status', 'progress', 'error_count',
+                    'throughput', 'updated_at')
+    list_filter = ('status', 'kind')
+    readonly_fields = ('kind', 'file', 'status', 'progress', 'error_count',
+                       'throughput', 'error', 'error_rows', 'created_at',
+                       'updated_at', 'finished_at')
+    exclude = ('total_rows', 'processed_rows', 'processed_seconds', 'errors')
+    actions = ('restart',)
+
+    def has_add_permission(self, request):
+        """Задачи создаются формами загрузки."""
+        return False
+
+    def progress(self, obj):
+        """Обработанные строки из общего числа."""
+        if not obj.total_rows:
+            return obj.processed_rows
+        percent = 100 * obj.processed_rows // obj.total_rows
+        return f'{obj.processed_rows} из {obj.total_rows} ({percent}%)'
+
+    progress.short_description = 'Обработано'
+
+    def throughput(self, obj):
+        """Скорость обработки."""
+        return f'{obj.rows_per_second:.0f}'
+
+    throughput.short_description = 'Строк в секунду'
+
+    def error_rows(self, obj):
+        """Список строк с ошибками."""
+        return format_html_join(
+            mark_safe('<br>'), 'Строка {}: {}',
+            ((error['row'], error['error']) for error in obj.errors))
+
+    error_rows.short_description = 'Ошибки строк'
+
+    def restart(self, request, queryset):
+        """Возврат упавших загрузок в очередь с последней пачки."""
+        count = (queryset.filter(status=ImportJob.FAILED)
+                 .update(status=ImportJob.PENDING))
+        self.message_user(request, f'Загрузок в очереди: {count}')
+
+    restart.short_description = 'Продолжить загрузку'
+
+
+@admin.register(CrmSync)
+class CrmSyncAdmin(admin.ModelAdmin):
+    """Очередь отправки в CRM с ошибками отправки."""
+
+    list_display = ('user', 'attempts', 'error', 'locked_until',
+                    'created_at')
+    list_select_related = ('user',)
+    readonly_fields = ('user', 'attempts', 'error', 'locked_until',
+                       'created_at')
+    actions = ('retry',)
+
+    def has_add_permission(self, request):
+        """Строки ставятся в очередь изменениями пользователей."""
+        return False
+
+    def retry(self, request, queryset):
+        """Повтор отправки без ожидания и с новым счетчиком попыток."""
+        count = queryset.update(attempts=0, error='', locked_until=None)
+        self.message_user(request, f'Пользователей в очереди: {count}')
+
+    retry.short_description = 'Повторить отправку'
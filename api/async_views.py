@@ -0,0 +1,88 @@
+"""View DRF с асинхронными обработчиками для ASGI.
+
+Разбор запроса, аутентификация, проверка прав и синхронные обработчики
+выполняются через run_sync в потоке Django, как и ORM внутри async
+обработчиков. Запросы к провайдерам в async обработчиках не занимают
+поток, поэтому один процесс ASGI держит много запросов, ждущих
+медленного провайдера. Под WSGI Django выполняет такие view через
+async_to_sync в цикле событий на запрос, и клиент httpx этого цикла
+закрывается вместе с ответом.
+"""
+import asyncio
+import functools
+
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+from rest_framework.views import APIView
+
+from api.http_client import close_http_client
+
+# синхронный код в общем потоке Django: соединения с базой этого потока
+# закрываются сигналами начала и конца запроса
+run_sync = functools.partial(sync_to_async, thread_sensitive=True)
+
+
+async def concurrently(awaitable, *coroutines):
+    """Результат awaitable и результаты coroutines, выполняемых параллельно.
+
+    В asgiref 3.2 run_sync внутри новой задачи asyncio, например из
+    asyncio.gather, под async_to_sync выполняется не в потоке Django,
+    поэтому ORM ждется в текущей задаче, в awaitable, а в отдельных
+    задачах идут только запросы к провайдерам.
+    """
+    tasks = [asyncio.ensure_future(coroutine) for coroutine in coroutines]
+    try:
+        result = await awaitable
+    except BaseException:
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+    return (result, *await asyncio.gather(*tasks))
+
+
+class AsyncAPIView(APIView):
+    """APIView, обработчики которого могут быть async def."""
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        """Async view для Django, атрибуты как у APIView.as_view."""
+        sync_view = super().as_view(**initkwargs)
+
+        async def view(request, *args, **kwargs):
+            self = cls(**initkwargs)
+            self.setup(request, *args, **kwargs)
+            try:
+                return await self.dispatch_async(request, *args, **kwargs)
+            finally:
+                if not isinstance(request, ASGIRequest):
+                    await close_http_client()
+
+        # csrf_exempt оборачивает view в синхронную функцию, поэтому
+        # отметка ставится напрямую
+        for name in ('view_class', 'view_initkwargs', 'cls', 'initkwargs',
+                     'csrf_exempt'):
+            setattr(view, name, getattr(sync_view, name))
+        view.__name__ = sync_view.__name__
+        view.__doc__ = cls.__doc__
+        return view
+
+    async def dispatch_async(self, request, *args, **kwargs):
+        """APIView.dispatch с ожиданием async обработчика."""
+        self.args = args
+        self.kwargs = kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+        try:
+            await run_sync(self.initial)(request, *args, **kwargs)
+            handler = self.http_method_not_allowed
+            if request.method.lower() in self.http_method_names:
+                handler = getattr(self, request.method.lower(), handler)
+            if asyncio.iscoroutinefunction(handler):
+                response = await handler(request, *args, **kwargs)
+            else:
+                response = await run_sync(handler)(request, *args, **kwargs)
+        except Exception as exc:
+            response = self.handle_exception(exc)
+        self.response = self.finalize_response(request, response, *args,
+                                               **kwargs)
+        return self.response
@@ -0,0 +1,73 @@
+"""Подсказки по префиксу для справочников без запросов к БД."""
+import re
+from bisect import bisect_left
+
+from api.cache_service import ReferenceCache
+from api.instrumentation import cache_result
+from api.models import City, Competence, Tags
+from api.search import normalize
+
+re_word_start = re.compile(r'(?<![\w])\w')
+
+
+class PrefixIndex:
+    """Отсортированные массивы ключей для поиска подсказок по префиксу.
+
+    Сначала ищутся имена, начинающиеся с префикса, затем имена,
+    в которых с префикса начинается одно из следующих слов.
+    """
+
+    def __init__(self, names) -> None:
+        """Построение индекса по списку имен."""
+        self.names = sorted(set(names), key=lambda name: (normalize(name),
+                                                          name))
+        starts, words = [], []
+        for position, name in enumerate(self.names):
+            key = normalize(name)
+            starts.append((key, position))
+            for match in re_word_start.finditer(key):
+                if match.start():
+                    words.append((key[match.start():], position))
+        starts.sort()
+        words.sort()
+        self.starts = [key for key, _ in starts], [pos for _, pos in starts]
+        self.words = [key for key, _ in words], [pos for _, pos in words]
+
+    def search(self, prefix: str, limit: int) -> list[str]:
+        """Первые limit имен по префиксу."""
+        prefix = normalize(prefix).strip()
+        if not prefix:
+            return []
+        found = []
+        for keys, positions in (self.starts, self.words):
+            index = bisect_left(keys, prefix)
+            while (len(found) < limit and index < len(keys)
+                   and keys[index].startswith(prefix)):
+                if positions[index] not in found:
+                    found.append(positions[index])
+                index += 1
+        return [self.names[position] for position in found]
+
+
+class Autocomplete:
+    """Индексы справочников в памяти процесса, сверяются с версией таблицы."""
+
+    models = {'cities': City, 'competences': Competence, 'tags': Tags}
+    indexes = {}
+
+    @classmethod
+    def get_index(cls, kind: str) -> PrefixIndex:
+        """Индекс справочника, перестраивается при смене версии таблицы."""
+        model = cls.models[kind]
+        version = ReferenceCache(model).get_version()
+        cached_version, index = cls.indexes.get(kind, (None, None))
+        cache_result('autocomplete', cached_version == version)
+        if cached_version != version:
+            index = PrefixIndex(model.objects.values_list('name', flat=True))
+            cls.indexes[kind] = (version, index)
+        return index
+
+    @classmethod
+    def search(cls, kind: str, prefix: str, limit: int) -> list[str]:
+        """Подсказки для справочника."""
+        return cls.get_index(kind).search(prefix, limit)
@@ -0,0 +1,399 @@
+"""Замеры маршрутов API: задержки, пропускная способность, запросы к БД."""
+import json
+import os
+import re
+import socket
+import subprocess
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from socketserver import ThreadingMixIn
+from urllib.parse import urlencode
+from wsgiref.simple_server import WSGIRequestHandler, WSGIServer, make_server
+
+import numpy as np
+import requests
+from django.db import connection
+from django.test import Client
+from django.utils import timezone
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from api.models import City, Event, Participation, User
+from api.urls import urlpatterns
+
+API_PREFIX = '/api/'
+QUERIES_HEADER = 'X-Bench-Queries'
+ROUTE_PARAM = re.compile(r'<(?:\w+:)?(\w+)>')
+PERCENTILES = (50, 95, 99)
+
+# маршруты без безопасного повторяемого запроса: отправляют смс и
+# расходуют попытки входа
+SKIPPED_ROUTES = {
+    'token/': 'выдача токена расходует код из смс',
+    'send-sms/': 'отправка смс',
+}
+
+
+class Target:
+    """Запрос к маршруту, который повторяется при замере."""
+
+    def __init__(self, route: str, path: str, method: str = 'get',
+                 data=None, headers: dict = None) -> None:
+        """Инициализатор класса."""
+        self.route = route
+        self.path = path
+        self.method = method
+        self.data = data
+        self.headers = headers or {}
+
+
+class Sample:
+    """Значения параметров маршрутов из данных базы."""
+
+    def __init__(self, user: User = None) -> None:
+        """Инициализатор класса, по умолчанию первый активный пользователь."""
+        self.user = user or (User.objects
+                             .filter(is_active=True, is_superuser=False)
+                             .order_by('pk').first())
+        if self.user is None:
+            raise ValueError('Нет пользователя для замеров, запустите seed')
+        participation = (Participation.objects
+                         .filter(event__isnull=False, user__isnull=False)
+                         .order_by('pk').first())
+        event = (participation.event if participation
+                 else Event.objects.order_by('pk').first())
+        if event is None:
+            raise ValueError('Нет событий для замеров, запустите seed')
+        self.event = event
+        self.city = (self.user.city.order_by('pk').first()
+                     or City.objects.order_by('pk').first())
+
+    def kwargs(self, route: str) -> dict:
+        """Параметры пути маршрута."""
+        kwargs = {}
+        if '<int:pk>' in route:
+            kwargs['pk'] = (self.user.pk if route.startswith('users/')
+                            else self.event.pk)
+        if '<str:kind>' in route:
+            kwargs['kind'] = 'cities'
+        return kwargs
+
+    def query(self, route: str) -> dict:
+        """Параметры строки запроса маршрута."""
+        if route == 'users/search/':
+            return {'q': self.user.last_name or self.user.phone[:6]}
+        if route == 'events/search/':
+            return {'q': self.event.title.split()[0]}
+        if route.startswith('autocomplete/'):
+            return {'q': self.city.name[:2] if self.city else ''}
+        return {}
+
+    def access_token(self) -> str:
+        """Свежий access токен пользователя."""
+        return str(RefreshToken.for_user(self.user).access_token)
+
+
+def api_targets(sample: Sample):
+    """Запросы ко всем маршрутам api.urls и пропущенные маршруты."""
+    targets, skipped = [], {}
+    for pattern in urlpatterns:
+        route = str(pattern.pattern)
+        if route in SKIPPED_ROUTES:
+            skipped[route] = SKIPPED_ROUTES[route]
+            continue
+        kwargs = sample.kwargs(route)
+        path = API_PREFIX + ROUTE_PARAM.sub(
+            lambda match: str(kwargs[match.group(1)]), route)
+        query = sample.query(route)
+        if query:
+            path += '?' + urlencode(query)
+        if route == 'token/refresh/':
+            # refresh токен берется из куки; черный список токенов не
+            # подключен, поэтому один токен годится для всех повторов
+            refresh = str(RefreshToken.for_user(sample.user))
+            targets.append(Target(route, path, 'post', {},
+                                  {'Cookie': f'refresh={refresh}'}))
+        else:
+            targets.append(Target(route, path))
+    return targets, skipped
+
+
+class QueryCounter:
+    """Счетчик SQL запросов соединения через execute_wrapper."""
+
+    def __init__(self) -> None:
+        """Инициализатор класса."""
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        """Подсчет запроса и его выполнение."""
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+def count_queries(app):
+    """WSGI приложение с числом SQL запросов в заголовке ответа.
+
+    Заголовки отправляются после отработки view, поэтому к этому
+    моменту запросы обычного (не потокового) ответа уже посчитаны.
+    """
+    def wrapped(environ, start_response):
+        counter = QueryCounter()
+
+        def start(status, headers, exc_info=None):
+            headers.append((QUERIES_HEADER, str(counter.count)))
+            return start_response(status, headers, exc_info)
+
+        with connection.execute_wrapper(counter):
+            return app(environ, start)
+    return wrapped
+
+
+class ThreadingWSGIServer(ThreadingMixIn, WSGIServer):
+    """WSGI сервер с потоком на соединение."""
+
+    daemon_threads = True
+
+
+class QuietHandler(WSGIRequestHandler):
+    """Обработчик без строки лога на каждый запрос."""
+
+    def log_message(self, format, *args):  # noqa: A002
+        """Лог запросов отключен."""
+
+
+def serve_wsgi(host: str = '127.0.0.1', port: int = 0):
+    """WSGI сервер проекта в фоновом потоке, возвращает сервер и адрес."""
+    from django.core.wsgi import get_wsgi_application
+    server = make_server(host, port, count_queries(get_wsgi_application()),
+                         server_class=ThreadingWSGIServer,
+                         handler_class=QuietHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://{host}:{server.server_port}'
+
+
+def serve_asgi(host: str = '127.0.0.1', port: int = 0, timeout: int = 30,
+               env: dict = None):
+    """ASGI сервер daphne в отдельном процессе, возвращает процесс и адрес.
+
+    env - переменные окружения процесса поверх текущих, например адреса
+    заглушек провайдеров.
+    """
+    if not port:
+        with socket.socket() as sock:
+            sock.bind((host, 0))
+            port = sock.getsockname()[1]
+    process = subprocess.Popen(  # noqa: S603, S607
+        ['daphne', '-b', host, '-p', str(port), 'app.asgi:application'],
+        env=os.environ | (env or {}),
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection((host, port), timeout=1).close()
+            return process, f'http://{host}:{port}'
+        except OSError:
+            if process.poll() is not None:
+                break
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError('daphne не запустился')
+
+
+def wsgi_headers(headers: dict) -> dict:
+    """Заголовки HTTP в виде ключей WSGI environ."""
+    return {'HTTP_' + name.upper().replace('-', '_'): value
+            for name, value in headers.items()}
+
+
+class ClientRunner:
+    """Запросы через тестовый клиент Django, без сети."""
+
+    mode = 'client'
+
+    def __init__(self, headers: dict = None) -> None:
+        """Инициализатор класса, headers - дополнительные заголовки."""
+        self.headers = wsgi_headers(headers or {})
+        self.local = threading.local()
+
+    def authorize(self, token: str) -> None:
+        """Авторизация последующих запросов по access токену."""
+        self.headers['HTTP_AUTHORIZATION'] = f'Bearer {token}'
+
+    def request(self, target: Target):
+        """Статус, размер ответа в байтах и число SQL запросов."""
+        if not hasattr(self.local, 'client'):
+            self.local.client = Client()
+        client = self.local.client
+        headers = self.headers | wsgi_headers(target.headers)
+        counter = QueryCounter()
+        with connection.execute_wrapper(counter):
+            if target.data is None:
+                response = client.generic(target.method.upper(), target.path,
+                                          **headers)
+            else:
+                response = client.generic(
+                    target.method.upper(), target.path,
+                    json.dumps(target.data), 'application/json', **headers)
+            content = (b''.join(response.streaming_content)
+                       if response.streaming else response.content)
+        return response.status_code, len(content), counter.count
+
+
+class HTTPRunner:
+    """Запросы к запущенному серверу по HTTP."""
+
+    mode = 'http'
+
+    def __init__(self, base_url: str, headers: dict = None) -> None:
+        """Инициализатор класса, headers - дополнительные заголовки."""
+        self.base_url = base_url.rstrip('/')
+        self.headers = dict(headers or {})
+        self.local = threading.local()
+
+    def authorize(self, token: str) -> None:
+        """Авторизация последующих запросов по access токену."""
+        self.headers['Authorization'] = f'Bearer {token}'
+
+    def request(self, target: Target):
+        """Статус, размер ответа в байтах и число SQL запросов.
+
+        Размер берется из Content-Length, то есть после сжатия. Число
+        запросов известно только для serve_wsgi.
+        """
+        if not hasattr(self.local, 'session'):
+            self.local.session = requests.Session()
+        response = self.local.session.request(
+            target.method, self.base_url + target.path, json=target.data,
+            headers=self.headers | target.headers)
+        size = int(response.headers.get('Content-Length',
+                                        len(response.content)))
+        queries = response.headers.get(QUERIES_HEADER)
+        return (response.status_code, size,
+                int(queries) if queries is not None else None)
+
+
+def run_target(runner, target: Target, requests_count: int,
+               concurrency: int = 1, warmup: int = 1) -> dict:
+    """Замер маршрута: прогрев и запросы в concurrency потоков."""
+    for _ in range(warmup):
+        runner.request(target)
+
+    def measure(_):
+        started = time.perf_counter()
+        status, size, queries = runner.request(target)
+        return time.perf_counter() - started, status, size, queries
+
+    started = time.perf_counter()
+    if concurrency > 1:
+        with ThreadPoolExecutor(concurrency) as executor:
+            results = list(executor.map(measure, range(requests_count)))
+    else:
+        results = [measure(index) for index in range(requests_count)]
+    wall = time.perf_counter() - started
+    return summarize(target, results, wall)
+
+
+def summarize(target: Target, results, wall: float) -> dict:
+    """Перцентили задержки в мс, запросов в секунду, SQL и байты."""
+    latencies = np.array([result[0] for result in results]) * 1000
+    statuses = Counter(str(result[1]) for result in results)
+    sizes = [result[2] for result in results]
+    queries = [result[3] for result in results if result[3] is not None]
+    summary = {
+        'method': target.method.upper(),
+        'path': target.path,
+        'requests': len(results),
+        'statuses': dict(statuses),
+        'errors': sum(count for status, count in statuses.items()
+                      if not status.startswith('2')),
+        'mean': round(float(latencies.mean()), 3),
+        'throughput': round(len(results) / wall, 2) if wall else None,
+        'bytes': int(np.median(sizes)),
+        # максимум, чтобы N+1 на части запросов не терялся
+        'queries': max(queries) if queries else None,
+    }
+    summary.update(percentiles(latencies))
+    return summary
+
+
+def percentiles(latencies) -> dict:
+    """Перцентили PERCENTILES задержек в мс."""
+    return {f'p{percentile}': round(float(value), 3)
+            for percentile, value in zip(
+                PERCENTILES, np.percentile(latencies, PERCENTILES))}
+
+
+def run_benchmark(runner, sample: Sample, targets, requests_count: int,
+                  concurrency: int = 1, warmup: int = 1, log=None) -> dict:
+    """Замер всех маршрутов, результат в формате базовой линии."""
+    routes = {}
+    for target in targets:
+        # access токен живет минуты, поэтому свежий на каждый маршрут
+        runner.authorize(sample.access_token())
+        routes[target.route] = run_target(runner, target, requests_count,
+                                          concurrency, warmup)
+        if log:
+            log(target.route, routes[target.route])
+    return {
+        'commit': git_commit(),
+        'created_at': timezone.now().isoformat(),
+        'mode': runner.mode,
+        'concurrency': concurrency,
+        'requests': requests_count,
+        'counts': {'users': User.objects.count(),
+                   'events': Event.objects.count()},
+        'routes': routes,
+    }
+
+
+def git_commit():
+    """Текущий коммит, если замер идет в рабочей копии git."""
+    try:
+        return subprocess.run(  # noqa: S603, S607
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+            text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def save_baseline(result: dict, path: str) -> None:
+    """Сохранение результата в JSON."""
+    with open(path, 'w', encoding='utf-8') as file:
+        json.dump(result, file, ensure_ascii=False, indent=2)
+
+
+def load_baseline(path: str) -> dict:
+    """Чтение сохраненного результата."""
+    with open(path, encoding='utf-8') as file:
+        return json.load(file)
+
+
+def compare_results(baseline: dict, result: dict,
+                    tolerance: float = 0.2) -> list:
+    """Сравнение с базовой линией, строки с флагом регрессии.
+
+    Регрессия - p95 выше базовой больше чем на долю tolerance или
+    больше SQL запросов на ответ.
+    """
+    rows = []
+    for route, current in result['routes'].items():
+        base = baseline['routes'].get(route)
+        if base is None:
+            continue
+        p95_ratio = current['p95'] / base['p95'] if base['p95'] else None
+        queries_delta = (current['queries'] - base['queries']
+                         if None not in (current['queries'], base['queries'])
+                         else None)
+        rows.append({
+            'route': route,
+            'p95': current['p95'],
+            'base_p95': base['p95'],
+            'p95_ratio': p95_ratio,
+            'queries_delta': queries_delta,
+            'bytes_delta': current['bytes'] - base['bytes'],
+            'regression': bool((p95_ratio and p95_ratio > 1 + tolerance)
+                               or (queries_delta and queries_delta > 0)),
+        })
+    return rows
@@ -0,0 +1,90 @@
+"""Массовые изменения из админки одним запросом на набор записей.
+
+Выбранные записи не загружаются в Python: UPDATE и INSERT ... SELECT
+получают выборку админки подзапросом, даже при выборе всей таблицы.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import (DateTimeField, ExpressionWrapper, IntegerField,
+                              TextField, Value)
+from django.db.models.functions import Coalesce, Greatest, Now
+from django.utils import timezone
+
+from api.city_feed import rebuild_city_events
+from api.models import CrmSync, Event, User
+from api.search import update_user_search_documents
+from api.signals import mark_people_changed
+
+
+def insert_select(model, fields, queryset) -> int:
+    """INSERT ... SELECT строк из values queryset, повторы пропускаются.
+
+    Столбцы queryset идут в порядке fields, возвращает число новых строк.
+    """
+    connection = connections[queryset.db]
+    ops = connection.ops
+    columns = ', '.join(ops.quote_name(model._meta.get_field(name).column)
+                        for name in fields)
+    select, params = (queryset.order_by().query
+                      .get_compiler(queryset.db).as_sql())
+    sql = (f'{ops.insert_statement(ignore_conflicts=True)} '
+           f'{ops.quote_name(model._meta.db_table)} ({columns}) {select}'
+           f'{ops.ignore_conflicts_suffix_sql(ignore_conflicts=True)}')
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return cursor.rowcount
+
+
+def queue_crm_sync(queryset) -> None:
+    """Постановка пользователей выборки в очередь CRM одним INSERT."""
+    if not settings.AUTH_TOKEN_CQ:
+        return
+    insert_select(CrmSync, ('user', 'created_at', 'attempts', 'error'),
+                  queryset.values(
+                      'pk',
+                      created=Value(timezone.now(),
+                                    output_field=DateTimeField()),
+                      retries=Value(0, output_field=IntegerField()),
+                      message=Value('', output_field=TextField())))
+
+
+def extend_subscriptions(queryset, days: int) -> int:
+    """Продление подписки одним UPDATE, истекшая продлевается от сегодня."""
+    users = User.objects.filter(pk__in=queryset.values('pk'))
+    start = Greatest(Coalesce('subscription_expiration_date', Now()), Now())
+    with transaction.atomic(using=queryset.db):
+        count = users.update(subscription_expiration_date=ExpressionWrapper(
+            start + timedelta(days=days), output_field=DateTimeField()))
+        queue_crm_sync(users)
+    return count
+
+
+def add_competence(queryset, competence) -> int:
+    """Добавление компетенции пользователям без m2m сигнала на каждого."""
+    users = User.objects.filter(pk__in=queryset.values('pk'))
+    with transaction.atomic(using=queryset.db):
+        count = insert_select(
+            User.competences.through, ('user', 'competence'),
+            users.values('pk', competence_pk=Value(
+                competence.pk, output_field=IntegerField())))
+        update_user_search_documents(users)
+        mark_people_changed(users.values('pk'))
+        queue_crm_sync(users)
+    return count
+
+
+def add_tag(queryset, tag) -> int:
+    """Добавление тега событиям без m2m сигнала на каждое."""
+    events = Event.objects.filter(pk__in=queryset.values('pk'))
+    with transaction.atomic(using=queryset.db):
+        count = insert_select(
+            Event.tags.through, ('event', 'tags'),
+            events.values('pk', tag_pk=Value(tag.pk,
+                                             output_field=IntegerField())))
+        if tag.city_id:
+            # индекс пересчитывается пачками id внутри rebuild_city_events
+            rebuild_city_events(events.values_list('pk', flat=True)
+                                .iterator())
+    return count
@@ -0,0 +1,55 @@
+"""Кэширование справочников: городов, компетенций и тегов."""
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from api.instrumentation import cache_result
+from api.renderers import ORJSONRenderer
+
+
+class ReferenceCache:
+    """Версионированный кэш предсобранного ответа для таблицы справочника.
+
+    Версия таблицы хранится в общем кэше и меняется при каждом изменении
+    данных, поэтому ETag ответа однозначно определяется версией, а сам
+    ответ собирается один раз на версию.
+    """
+
+    def __init__(self, model) -> None:
+        """Инициализатор класса."""
+        self.label = model._meta.label_lower
+
+    @property
+    def version_key(self) -> str:
+        """Ключ версии таблицы."""
+        return f'reference:version:{self.label}'
+
+    def get_version(self) -> str:
+        """Текущая версия таблицы, создается при первом обращении."""
+        version = cache.get(self.version_key)
+        if version is None:
+            cache.add(self.version_key, uuid.uuid4().hex, timeout=None)
+            version = cache.get(self.version_key)
+        return version
+
+    def get_etag(self, version: str) -> str:
+        """Строгий ETag для версии таблицы."""
+        return f'"{self.label}-{version}"'
+
+    def get_payload(self, version: str, get_data) -> bytes:
+        """Собранный ответ для версии, get_data вызывается при промахе."""
+        key = f'reference:payload:{self.label}:{version}'
+        payload = cache.get(key)
+        cache_result('reference', payload is not None)
+        if payload is None:
+            payload = ORJSONRenderer().render(get_data())
+            cache.set(key, payload, timeout=settings.REFERENCE_CACHE_TIMEOUT)
+        return payload
+
+    def invalidate(self) -> None:
+        """Смена версии таблицы после фиксации транзакции."""
+        transaction.on_commit(
+            lambda: cache.set(self.version_key, uuid.uuid4().hex,
+                              timeout=None))
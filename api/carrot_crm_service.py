@@ -1,15 +1,30 @@
 """Модуль для работы с Carrot quest."""
+import logging
+
+import httpx
 import requests
 from django.conf import settings
 
+from api.http_client import http_client
+from api.instrumentation import phase
+
+logger = logging.getLogger(__name__)
+
 
 class CarrotQuest:
     """Класс для работы с сервисом Carrot quest."""
 
-    def __init__(self, user_id: int) -> None:
-        """Инициализатор класса."""
+    def __init__(self, user_id: int, session=None,
+                 raise_errors: bool = False) -> None:
+        """Инициализатор класса.
+
+        session - общая сессия для пакета, raise_errors - ошибки запросов
+        пробрасываются для повтора, а не только пишутся в лог.
+        """
         self.user_id = f'{settings.CARROT_ID_PREFIX}-{user_id}'
         self.token = settings.AUTH_TOKEN_CQ
+        self.session = session or requests
+        self.raise_errors = raise_errors
 
     def send_props(self, operations: list[dict]) -> None:
         """Запрос с данными для аналитики."""
@@ -19,12 +34,41 @@ class CarrotQuest:
         """Запрос с данными для аналитики."""
         self.__request('events', {'event': event})
 
+    async def send_event_async(self, event: str) -> None:
+        """Запрос с данными для аналитики без блокировки потока."""
+        if not self.token:
+            return
+        # аналитика не должна ломать запрос пользователя
+        try:
+            with phase('carrot', {'carrot.uri': 'events'}):
+                response = await http_client().post(
+                    self.__url('events'), json=self.__data({'event': event}),
+                    timeout=settings.PROVIDER_TIMEOUT)
+                response.raise_for_status()
+        except httpx.HTTPError:
+            logger.warning('carrot quest events request failed',
+                           exc_info=True)
+
+    def __url(self, uri):
+        return f'{settings.CARROT_API}/users/{self.user_id}/{uri}'
+
+    def __data(self, data):
+        return data | {'auth_token': self.token, 'by_user_id': True}
+
     def __request(self, uri, data):
         if not self.token:
             return
-        url = f'https://api.carrotquest.io/v1/users/{self.user_id}/{uri}'
-        data |= {'auth_token': self.token, 'by_user_id': True}
-        requests.post(url, json=data)
+        # аналитика не должна ломать запрос пользователя
+        try:
+            with phase('carrot', {'carrot.uri': uri}):
+                self.session.post(self.__url(uri), json=self.__data(data),
+                                  timeout=settings.PROVIDER_TIMEOUT
+                                  ).raise_for_status()
+        except requests.RequestException:
+            if self.raise_errors:
+                raise
+            logger.warning('carrot quest %s request failed', uri,
+                           exc_info=True)
 
     def send_update(self, dict_data: dict[str, str]) -> None:
         """Формат update операции для carrot."""
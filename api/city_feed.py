@@ -0,0 +1,32 @@
+"""Индекс событий по городам для ленты."""
+from django.db import transaction
+
+from api.models import CityEvent, Event
+
+CITY_EVENTS_CHUNK_SIZE = 1000
+
+
+def rebuild_city_events(event_ids) -> None:
+    """Пересчет строк индекса для событий по городам их тегов."""
+    event_ids = list(event_ids)
+    tags_through = Event.tags.through
+    for start in range(0, len(event_ids), CITY_EVENTS_CHUNK_SIZE):
+        chunk = event_ids[start:start + CITY_EVENTS_CHUNK_SIZE]
+        rows = (tags_through.objects
+                .filter(event_id__in=chunk, tags__city__isnull=False)
+                .values_list('tags__city_id', 'event_id',
+                             'event__start_date')
+                .distinct())
+        with transaction.atomic():
+            CityEvent.objects.filter(event_id__in=chunk).delete()
+            CityEvent.objects.bulk_create(
+                CityEvent(city_id=city_id, event_id=event_id,
+                          start_date=start_date)
+                for city_id, event_id, start_date in rows)
+
+
+def city_event_ids(city_ids, since):
+    """Подзапрос id событий городов, начинающихся не раньше since."""
+    return (CityEvent.objects
+            .filter(city_id__in=city_ids, start_date__gte=since)
+            .values('event_id'))
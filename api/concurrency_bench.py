@@ -0,0 +1,219 @@
+"""Замер запросов, ждущих медленного провайдера, на один процесс.
+
+Просмотр события ждет Carrot quest, отправка смс - smstraffic, оба через
+заглушку с задержкой. Режим asgi выполняет запросы в одном цикле событий
+через ASGI приложение Django, как один процесс daphne. Режим wsgi -
+в threads потоках тестового клиента, как процесс gunicorn с потоками:
+запрос занимает поток все время ожидания провайдера.
+"""
+import asyncio
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+from django.core.handlers.asgi import ASGIHandler
+from django.db import connections
+from django.test import override_settings
+from django.utils import timezone
+
+from api.benchmark import (API_PREFIX, ClientRunner, Target, git_commit,
+                           percentiles)
+from api.http_client import close_http_client
+from api.models import SMSAuth, User
+from api.stress import stress_phones
+
+MODES = ('asgi', 'wsgi')
+# маршрут и провайдер, ответа которого он ждет
+ROUTES = {'events': 'carrot', 'send-sms': 'sms'}
+
+
+async def asgi_request(application, target: Target, headers: dict) -> dict:
+    """Статус, заголовки и тело ответа ASGI приложения на запрос."""
+    url = urlsplit(target.path)
+    headers = headers | target.headers
+    body = b''
+    if target.data is not None:
+        body = json.dumps(target.data).encode()
+        headers = headers | {'Content-Type': 'application/json',
+                             'Content-Length': str(len(body))}
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1',
+        'method': target.method.upper(), 'scheme': 'http', 'path': url.path,
+        'raw_path': url.path.encode(), 'query_string': url.query.encode(),
+        'root_path': '',
+        'headers': [(name.lower().encode(), value.encode())
+                    for name, value in headers.items()],
+        'client': ('127.0.0.1', 0), 'server': ('testserver', 80),
+    }
+    messages = [{'type': 'http.request', 'body': body, 'more_body': False}]
+    response = {'status': None, 'headers': {}, 'body': b''}
+
+    async def receive():
+        if messages:
+            return messages.pop()
+        return {'type': 'http.disconnect'}
+
+    async def send(message):
+        if message['type'] == 'http.response.start':
+            response['status'] = message['status']
+            response['headers'] = {name.decode().lower(): value.decode()
+                                   for name, value in message['headers']}
+        elif message['type'] == 'http.response.body':
+            response['body'] += message.get('body', b'')
+
+    await application(scope, receive, send)
+    return response
+
+
+class ASGIRunner:
+    """Запросы к ASGI приложению Django без сети."""
+
+    mode = 'asgi'
+
+    def __init__(self) -> None:
+        """Инициализатор класса, middleware загружаются сразу."""
+        self.application = ASGIHandler()
+        self.headers = {}
+
+    def authorize(self, token: str) -> None:
+        """Авторизация последующих запросов по access токену."""
+        self.headers['Authorization'] = f'Bearer {token}'
+
+    async def request(self, target: Target):
+        """Статус и размер ответа в байтах."""
+        response = await asgi_request(self.application, target, self.headers)
+        return response['status'], len(response['body'])
+
+
+def run_asgi(runner: ASGIRunner, targets, concurrency: int):
+    """Задержки и статусы запросов в одном цикле событий и время замера."""
+    async def measure(semaphore, target):
+        async with semaphore:
+            started = time.perf_counter()
+            status, _ = await runner.request(target)
+            return time.perf_counter() - started, status
+
+    async def main():
+        semaphore = asyncio.Semaphore(concurrency)
+        try:
+            return await asyncio.gather(*(measure(semaphore, target)
+                                          for target in targets))
+        finally:
+            await close_http_client()
+
+    started = time.perf_counter()
+    results = asyncio.run(main())
+    return results, time.perf_counter() - started
+
+
+def run_wsgi(runner: ClientRunner, targets, concurrency: int, threads: int):
+    """Задержки и статусы запросов, обработчиков не больше threads.
+
+    Клиенты ждут ответа пула из threads потоков обработчика, задержка
+    считается с ожиданием свободного потока.
+    """
+    with ThreadPoolExecutor(threads) as server:
+        def measure(target):
+            started = time.perf_counter()
+            status, _, _ = server.submit(runner.request, target).result()
+            return time.perf_counter() - started, status
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(concurrency) as clients:
+            results = list(clients.map(measure, targets))
+        wall = time.perf_counter() - started
+        # соединения с базой потоков обработчика
+        for _ in range(threads):
+            server.submit(connections.close_all)
+    return results, wall
+
+
+def route_targets(route: str, sample, count: int, start: int):
+    """count запросов к маршруту, отправка смс - на разные номера."""
+    if route == 'send-sms':
+        return [Target('send-sms/', f'{API_PREFIX}send-sms/', 'post',
+                       {'phone': phone})
+                for phone in stress_phones(count, start)]
+    return [Target('events/<int:pk>/', f'{API_PREFIX}events/'
+                   f'{sample.event.pk}/')] * count
+
+
+def summarize(results, wall: float, provider_peak: int) -> dict:
+    """Запросов в секунду, перцентили задержки в мс и ошибки."""
+    latencies = [latency * 1000 for latency, _ in results]
+    return {
+        'requests': len(results),
+        'seconds': round(wall, 3),
+        'throughput': round(len(results) / wall, 1),
+        'errors': sum(status is None or status >= 400
+                      for _, status in results),
+        'provider_peak': provider_peak,
+        **percentiles(latencies),
+    }
+
+
+class ConcurrencyBench:
+    """Замер маршрута при росте числа одновременных клиентов."""
+
+    def __init__(self, sample, stub, route: str = 'events',
+                 threads: int = 8, requests_count: int = 200) -> None:
+        """Инициализатор класса, stub - запущенная заглушка провайдеров."""
+        self.sample = sample
+        self.stub = stub
+        self.route = route
+        self.provider = ROUTES[route]
+        self.threads = threads
+        self.requests_count = requests_count
+        self.runners = {'asgi': ASGIRunner(), 'wsgi': ClientRunner()}
+        # номера отправки смс не повторяются между замерами
+        self.phones = 0
+
+    def targets(self, count: int):
+        """Запросы замера."""
+        targets = route_targets(self.route, self.sample, count, self.phones)
+        if self.route == 'send-sms':
+            self.phones += count
+        return targets
+
+    def run(self, mode: str, concurrency: int) -> dict:
+        """Замер режима при concurrency клиентах."""
+        runner = self.runners[mode]
+        runner.authorize(self.sample.access_token())
+        targets = self.targets(self.requests_count)
+        with self.stub.lock:
+            self.stub.peak[self.provider] = 0
+        if mode == 'asgi':
+            results, wall = run_asgi(runner, targets, concurrency)
+        else:
+            results, wall = run_wsgi(runner, targets, concurrency,
+                                     self.threads)
+        result = summarize(results, wall, self.stub.peak[self.provider])
+        return {'mode': mode, 'concurrency': concurrency, **result}
+
+    def cleanup(self) -> None:
+        """Удаление пользователей и кодов отправки смс."""
+        phones = stress_phones(self.phones)
+        SMSAuth.objects.filter(phone__in=phones).delete()
+        User.objects.filter(phone__in=phones).delete()
+
+
+def run_concurrency_bench(sample, stub, route: str, modes, levels,
+                          threads: int, requests_count: int,
+                          log=None) -> dict:
+    """Замер режимов на каждом уровне числа клиентов."""
+    bench = ConcurrencyBench(sample, stub, route, threads, requests_count)
+    results = []
+    try:
+        with override_settings(DEBUG=False, **stub.settings()):
+            for concurrency in levels:
+                for mode in modes:
+                    result = bench.run(mode, concurrency)
+                    if log:
+                        log(result)
+                    results.append(result)
+    finally:
+        bench.cleanup()
+    return {'commit': git_commit(), 'created_at': timezone.now().isoformat(),
+            'route': route, 'threads': threads,
+            'requests': requests_count, 'results': results}
@@ -0,0 +1,148 @@
+"""Замер соединений с базой: новое на запрос, постоянное или из пула.
+
+Каждый поток повторяет цикл запроса Django: проверка соединения при
+request_started, SQL запрос и проверка при request_finished, которая
+закрывает соединение при CONN_MAX_AGE = 0. При churn каждый запрос идет
+в новой обертке соединения, как новые потоки sync_to_async под ASGI.
+"""
+import threading
+import time
+
+from django.db import connections
+from django.db.utils import load_backend
+from django.test import override_settings
+from django.utils import timezone
+
+from api.benchmark import git_commit, percentiles
+from api.pool import base as pool_backend
+
+POSTGRESQL = 'django.db.backends.postgresql'
+# движок и CONN_MAX_AGE режима
+MODES = {
+    'connect': (POSTGRESQL, 0),
+    'persistent': (POSTGRESQL, 600),
+    'pool': ('api.pool', 0),
+}
+
+
+class ConnectionBench:
+    """Запросы в threads потоках через обертки соединений режима."""
+
+    def __init__(self, mode: str, threads: int, requests_count: int,
+                 churn: bool = False, query: str = 'SELECT 1') -> None:
+        """Инициализатор класса."""
+        engine, max_age = MODES[mode]
+        self.mode = mode
+        self.alias = f'bench-{mode}'
+        self.settings_dict = {**connections['default'].settings_dict,
+                              'ENGINE': engine, 'CONN_MAX_AGE': max_age}
+        self.backend = load_backend(engine)
+        self.threads = threads
+        self.requests_count = requests_count
+        self.churn = churn
+        self.query = query
+        self.lock = threading.Lock()
+        self.latencies = []
+        self.pids = set()
+        self.errors = 0
+        # обертки, оставленные потоками открытыми при churn
+        self.abandoned = []
+
+    def new_wrapper(self):
+        """Обертка соединения, как у нового потока Django."""
+        return self.backend.DatabaseWrapper(dict(self.settings_dict),
+                                            self.alias)
+
+    def request(self, wrapper) -> None:
+        """Один цикл запроса: задержка и процесс сервера базы."""
+        started = time.perf_counter()
+        try:
+            wrapper.close_if_unusable_or_obsolete()
+            with wrapper.cursor() as cursor:
+                cursor.execute(self.query)
+                cursor.fetchall()
+            pid = wrapper.connection.get_backend_pid()
+            wrapper.close_if_unusable_or_obsolete()
+        except Exception:
+            with self.lock:
+                self.errors += 1
+            return
+        latency = (time.perf_counter() - started) * 1000
+        with self.lock:
+            self.latencies.append(latency)
+            self.pids.add(pid)
+
+    def worker(self, count: int) -> None:
+        """Запросы потока, в конце соединения потока закрываются."""
+        wrapper = self.new_wrapper()
+        for _ in range(count):
+            if self.churn:
+                wrapper = self.new_wrapper()
+            self.request(wrapper)
+            if self.churn and wrapper.connection is not None:
+                with self.lock:
+                    self.abandoned.append(wrapper)
+        if not self.churn:
+            wrapper.close()
+
+    def run(self) -> dict:
+        """Замер режима, алиас режима зарегистрирован на время замера."""
+        # обработчики connection_created, например hstore из
+        # django.contrib.postgres, находят соединение по алиасу
+        connections.databases[self.alias] = self.settings_dict
+        try:
+            # первое соединение заполняет кэши обработчиков
+            connections[self.alias].ensure_connection()
+            connections[self.alias].close()
+            return self.measure()
+        finally:
+            del connections.databases[self.alias]
+
+    def measure(self) -> dict:
+        """Запросы во всех потоках и сводка."""
+        counts = [self.requests_count // self.threads
+                  + (index < self.requests_count % self.threads)
+                  for index in range(self.threads)]
+        workers = [threading.Thread(target=self.worker, args=(count,))
+                   for count in counts]
+        started = time.perf_counter()
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        seconds = time.perf_counter() - started
+        for wrapper in self.abandoned:
+            wrapper.inc_thread_sharing()
+            wrapper.close()
+        pool = [pool for key, pool in pool_backend.pools.items()
+                if key[0] == self.alias]
+        result = {
+            'mode': self.mode, 'requests': len(self.latencies),
+            'errors': self.errors, 'seconds': round(seconds, 3),
+            'throughput': round(len(self.latencies) / seconds, 1),
+            'connections': len(self.pids),
+            'connections_per_second': round(len(self.pids) / seconds, 1),
+        }
+        if self.latencies:
+            result.update(percentiles(self.latencies))
+        if pool:
+            result['pool'] = dict(pool[0].stats)
+        return result
+
+
+def run_connection_bench(modes, threads: int, requests_count: int,
+                         churn: bool, pool_size: int, query: str,
+                         log=None) -> dict:
+    """Замер режимов, пул ограничен pool_size соединениями."""
+    results = {}
+    with override_settings(DB_POOL_SIZE=pool_size):
+        for mode in modes:
+            result = ConnectionBench(mode, threads, requests_count, churn,
+                                     query).run()
+            if log:
+                log(result)
+            results[mode] = result
+    pool_backend.close_pools()
+    return {'commit': git_commit(), 'created_at': timezone.now().isoformat(),
+            'threads': threads, 'churn': churn, 'pool_size': pool_size,
+            'query': query, 'modes': results}
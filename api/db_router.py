@@ -0,0 +1,159 @@
+"""Чтение из реплик PostgreSQL с закреплением за основной базой.
+
+Реплики задаются в settings.DATABASE_REPLICAS. В реплики идут только
+чтения GET, HEAD и OPTIONS запросов к api, которые ReplicaMiddleware
+отмечает в current_state; команды, админка и фоновые задачи работают с
+основной базой. После записи пользователя его чтения идут в основную базу
+REPLICA_STICKY_SECONDS секунд, метка хранится в кэше, поэтому с репликами
+settings требует общий бэкенд кэша. Реплика с отставанием больше
+REPLICA_MAX_LAG секунд или недоступная не используется.
+"""
+import contextvars
+import random
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+# отставание реплики в секундах, 0 для основной базы и догнавшей реплики
+LAG_SQL = ('SELECT CASE WHEN NOT pg_is_in_recovery() THEN 0 '
+           'WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() '
+           'THEN 0 ELSE EXTRACT(EPOCH FROM now() '
+           '- pg_last_xact_replay_timestamp()) END')
+
+# маршрутизация текущего запроса, None вне запроса к api
+current_state = contextvars.ContextVar('replica_state', default=None)
+
+
+class RequestState:
+    """Пользователь запроса и разрешение читать из реплики."""
+
+    def __init__(self, user_id, replica: bool) -> None:
+        """Инициализатор класса."""
+        self.user_id = user_id
+        self.replica = replica
+        self.pinned = False
+
+
+def pin_key(user_id) -> str:
+    """Ключ кэша закрепления пользователя за основной базой."""
+    return f'replica-pin:{user_id}'
+
+
+def is_pinned(user_id) -> bool:
+    """Были ли записи пользователя в последние REPLICA_STICKY_SECONDS."""
+    return user_id is not None and cache.get(pin_key(user_id)) is not None
+
+
+def pin(user_id) -> None:
+    """Закрепление чтений пользователя за основной базой."""
+    cache.set(pin_key(user_id), 1, settings.REPLICA_STICKY_SECONDS)
+
+
+def token_user_id(request):
+    """id пользователя из access токена без запроса к базе."""
+    authentication = JWTAuthentication()
+    header = authentication.get_header(request)
+    if header is None:
+        return None
+    try:
+        raw_token = authentication.get_raw_token(header)
+        if raw_token is None:
+            return None
+        token = authentication.get_validated_token(raw_token)
+        return token[api_settings.USER_ID_CLAIM]
+    except (AuthenticationFailed, InvalidToken, KeyError):
+        return None
+
+
+def request_state(request) -> RequestState:
+    """Маршрутизация запроса: реплика для чтений api без недавних записей."""
+    user_id = token_user_id(request)
+    replica = (request.method in SAFE_METHODS
+               and request.path.startswith(settings.REPLICA_PATH_PREFIX)
+               and not is_pinned(user_id))
+    return RequestState(user_id, replica)
+
+
+class ReplicaLag:
+    """Отставание реплик, проверка не чаще REPLICA_LAG_CHECK_SECONDS."""
+
+    def __init__(self) -> None:
+        """Инициализатор класса."""
+        self.checked = {}
+        self.lock = threading.Lock()
+
+    def healthy(self, alias: str) -> bool:
+        """Реплика доступна и отстает не больше REPLICA_MAX_LAG."""
+        now = time.monotonic()
+        with self.lock:
+            checked = self.checked.get(alias)
+        if checked and now - checked[0] < settings.REPLICA_LAG_CHECK_SECONDS:
+            return checked[1]
+        lag = self.measure(alias)
+        healthy = lag is not None and lag <= settings.REPLICA_MAX_LAG
+        with self.lock:
+            self.checked[alias] = (now, healthy)
+        return healthy
+
+    @staticmethod
+    def measure(alias: str):
+        """Отставание реплики в секундах, None если она недоступна."""
+        try:
+            with connections[alias].cursor() as cursor:
+                cursor.execute(LAG_SQL)
+                lag = cursor.fetchone()[0]
+        except DatabaseError:
+            return None
+        return float(lag) if lag is not None else None
+
+    def clear(self) -> None:
+        """Сброс результатов проверок."""
+        with self.lock:
+            self.checked.clear()
+
+
+replica_lag = ReplicaLag()
+
+
+class ReplicaRouter:
+    """Роутер: чтения запросов api в реплики, остальное в основную базу."""
+
+    def db_for_read(self, model, **hints):
+        """Здоровая реплика для чтения запроса api или основная база."""
+        state = current_state.get()
+        if state is None or not state.replica:
+            return None
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return None
+        replicas = [alias for alias in settings.DATABASE_REPLICAS
+                    if replica_lag.healthy(alias)]
+        return random.choice(replicas) if replicas else None
+
+    def db_for_write(self, model, **hints):
+        """Основная база, пользователь запроса закрепляется за ней."""
+        state = current_state.get()
+        if state is not None:
+            # свои записи видны уже в этом запросе
+            state.replica = False
+            if state.user_id is not None and not state.pinned:
+                pin(state.user_id)
+                state.pinned = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        """Реплики содержат те же данные, связи между ними разрешены."""
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        """Миграции только в основной базе."""
+        if db in settings.DATABASE_REPLICAS:
+            return False
+        return None
@@ -0,0 +1,261 @@
+"""Аудит планов SQL запросов маршрутов API.
+
+Запросы берутся не из копий querysets, а из выполнения самих view: каждый
+маршрут вызывается тестовым клиентом в транзакции, которая затем
+откатывается, SELECT запросы с их параметрами проходят через
+EXPLAIN (ANALYZE, BUFFERS). В планах отмечаются последовательные чтения,
+сортировки и hash join на больших таблицах, для них проверяются индексы.
+"""
+import json
+import re
+
+from django.db import connection, transaction
+from django.test import Client, override_settings
+from django.utils import timezone
+
+from api.benchmark import (Sample, Target, api_targets, git_commit,
+                           wsgi_headers)
+from api.provider_stub import ProviderStub
+from api.querylog import query_shape
+
+ISSUE_KINDS = ('seq_scan', 'sort', 'hash_join')
+re_condition_column = re.compile(
+    r'(\w+)"?\)?(?:::[\w ]+?)?\s*(?:<>|<=|>=|=|<|>|!?~~\*?|IS\b)')
+re_sort_column = re.compile(r'(?:\w+\.)?"?(\w+)"?(?: DESC| ASC)?$')
+re_index_columns = re.compile(r'USING \w+ \((.+)\)')
+
+
+class QueryRecorder:
+    """execute_wrapper: SELECT запросы с параметрами."""
+
+    def __init__(self) -> None:
+        """Инициализатор класса."""
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        """Запись запроса и его выполнение."""
+        if not many and sql.lstrip().upper().startswith('SELECT'):
+            self.queries.append((sql, params))
+        return execute(sql, params, many, context)
+
+
+def audit_targets(sample: Sample):
+    """Маршруты для аудита: все из api_targets и варианты фильтров.
+
+    Вход по смс тоже проверяется, запросы выполняются в откатываемой
+    транзакции, смс и события аналитики уходят в заглушку провайдеров.
+    """
+    targets, _ = api_targets(sample)
+    tags = list(sample.event.tags.values_list('name', flat=True)[:2])
+    competences = list(sample.user.competences.values_list('name',
+                                                           flat=True)[:2])
+    city = sample.city.name if sample.city else ''
+    variants = (
+        ('events/', {'tags': ','.join(tags), 'ordering': '-start_date'}),
+        ('events/', {'city': city, 'ordering': 'start_date'}),
+        ('users/', {'competences': ','.join(competences),
+                    'ordering': '-date_of_registration'}),
+    )
+    for route, query in variants:
+        query = '&'.join(f'{name}={value}' for name, value in query.items())
+        targets.append(Target(route, f'/api/{route}?{query}'))
+    targets.append(Target('send-sms/', '/api/send-sms/', 'post',
+                          {'phone': sample.user.phone}))
+    targets.append(Target('token/', '/api/token/', 'post',
+                          {'phone': sample.user.phone, 'password': '0000'}))
+    return targets
+
+
+class Catalog:
+    """Размеры таблиц, их колонки и индексы из каталога PostgreSQL."""
+
+    def __init__(self) -> None:
+        """Инициализатор класса, читает каталог текущей схемы."""
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT c.relname, GREATEST(c.reltuples, s.n_live_tup) '
+                'FROM pg_class c JOIN pg_stat_user_tables s '
+                'ON s.relid = c.oid')
+            self.rows = {name: int(rows) for name, rows in cursor.fetchall()}
+            cursor.execute(
+                'SELECT table_name, column_name FROM '
+                'information_schema.columns '
+                'WHERE table_schema = current_schema()')
+            self.columns = {}
+            for table, column in cursor.fetchall():
+                self.columns.setdefault(table, set()).add(column)
+            cursor.execute('SELECT tablename, indexname, indexdef '
+                           'FROM pg_indexes '
+                           'WHERE schemaname = current_schema()')
+            self.indexes = {}
+            for table, name, definition in cursor.fetchall():
+                match = re_index_columns.search(definition)
+                leading = (match.group(1).split(',')[0].strip().strip('"')
+                           if match else '')
+                self.indexes.setdefault(table, []).append((name, leading))
+
+    def table_columns(self, table: str, names) -> list:
+        """Имена, которые являются колонками таблицы, без повторов."""
+        found = []
+        for name in names:
+            if name in self.columns.get(table, ()) and name not in found:
+                found.append(name)
+        return found
+
+    def index_for(self, table: str, column: str):
+        """Индекс таблицы, который начинается с колонки."""
+        for name, leading in self.indexes.get(table, ()):
+            if leading == column:
+                return name
+        return None
+
+
+def relation_of(node: dict):
+    """Таблица узла плана или первой таблицы под ним."""
+    if 'Relation Name' in node:
+        return node['Relation Name']
+    for child in node.get('Plans', ()):
+        relation = relation_of(child)
+        if relation:
+            return relation
+    return None
+
+
+def node_rows(node: dict) -> int:
+    """Фактическое число строк узла по всем повторам."""
+    return int(node.get('Actual Rows', node.get('Plan Rows', 0))
+               * node.get('Actual Loops', 1))
+
+
+def plan_issues(plan: dict, catalog: Catalog, min_rows: int) -> list:
+    """Последовательные чтения, сортировки и hash join больших таблиц."""
+    issues = []
+
+    def index_check(table, columns):
+        if not columns:
+            return {}
+        index = catalog.index_for(table, columns[0])
+        if index:
+            return {'index': index}
+        return {'suggestion': f'CREATE INDEX ON {table} '
+                              f'({", ".join(columns)})'}
+
+    def walk(node):
+        kind = node['Node Type']
+        table = relation_of(node)
+        table_rows = catalog.rows.get(table, 0)
+        if kind == 'Seq Scan' and table_rows >= min_rows:
+            columns = catalog.table_columns(
+                table, re_condition_column.findall(node.get('Filter') or ''))
+            issues.append({'kind': 'seq_scan', 'relation': table,
+                           'table_rows': table_rows,
+                           'filter': node.get('Filter'), 'columns': columns,
+                           **index_check(table, columns)})
+        elif kind == 'Sort' and (node_rows(node) >= min_rows
+                                 or node.get('Sort Space Type') == 'Disk'):
+            keys = node.get('Sort Key', [])
+            columns = catalog.table_columns(
+                table, [match.group(1) for match in
+                        map(re_sort_column.search, keys) if match])
+            issues.append({'kind': 'sort', 'relation': table,
+                           'rows': node_rows(node), 'keys': ', '.join(keys),
+                           'method': node.get('Sort Method'),
+                           'space': node.get('Sort Space Type'),
+                           'columns': columns,
+                           **index_check(table, columns)})
+        elif kind == 'Hash Join':
+            rows = max(node_rows(child) for child in node['Plans'])
+            if rows >= min_rows:
+                issues.append({'kind': 'hash_join', 'relation': table,
+                               'rows': rows,
+                               'condition': node.get('Hash Cond')})
+        for child in node.get('Plans', ()):
+            walk(child)
+    walk(plan['Plan'])
+    return issues
+
+
+def explain(sql: str, params) -> dict:
+    """План запроса EXPLAIN (ANALYZE, BUFFERS) в формате JSON."""
+    with connection.cursor() as cursor:
+        cursor.execute('EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) ' + sql,
+                       params)
+        plan = cursor.fetchone()[0]
+    return (json.loads(plan) if isinstance(plan, str) else plan)[0]
+
+
+def audit_target(client: Client, target: Target, headers: dict,
+                 catalog: Catalog, min_rows: int) -> list:
+    """Планы SELECT запросов маршрута, изменения данных откатываются."""
+    recorder = QueryRecorder()
+    results = []
+    with transaction.atomic():
+        with connection.execute_wrapper(recorder):
+            data = None if target.data is None else json.dumps(target.data)
+            response = client.generic(
+                target.method.upper(), target.path, data or '',
+                'application/json', **headers, **wsgi_headers(target.headers))
+        seen = set()
+        for sql, params in recorder.queries:
+            shape = query_shape(sql)
+            if shape in seen:
+                continue
+            seen.add(shape)
+            plan = explain(sql, params)
+            top = plan['Plan']
+            results.append({
+                'route': target.route, 'path': target.path,
+                'status': response.status_code, 'shape': shape,
+                'repeats': sum(query_shape(item) == shape
+                               for item, _ in recorder.queries),
+                'execution_ms': plan.get('Execution Time'),
+                'planning_ms': plan.get('Planning Time'),
+                'shared_hit': top.get('Shared Hit Blocks', 0),
+                'shared_read': top.get('Shared Read Blocks', 0),
+                'issues': plan_issues(plan, catalog, min_rows),
+            })
+        transaction.set_rollback(True)
+    return results
+
+
+def run_audit(sample: Sample, targets, min_rows: int, log=None) -> dict:
+    """Аудит маршрутов, результат для JSON и сравнения."""
+    catalog = Catalog()
+    client = Client(raise_request_exception=False)
+    headers = {'HTTP_AUTHORIZATION': f'Bearer {sample.access_token()}'}
+    queries = []
+    with ProviderStub() as stub, override_settings(**stub.settings()):
+        for target in targets:
+            results = audit_target(client, target, headers, catalog,
+                                   min_rows)
+            if log:
+                log(target, results)
+            queries.extend(results)
+    return {'commit': git_commit(), 'created_at': timezone.now().isoformat(),
+            'min_rows': min_rows, 'queries': queries}
+
+
+def issue_keys(query: dict) -> set:
+    """Ключи проблем запроса для сравнения: вид и таблица."""
+    return {(issue['kind'], issue['relation']) for issue in query['issues']}
+
+
+def compare_audits(baseline: dict, result: dict) -> list:
+    """Новые проблемы планов относительно базовой линии.
+
+    Запросы сопоставляются по маршруту и форме SQL; новый запрос с
+    проблемами тоже считается регрессией.
+    """
+    known = {}
+    for query in baseline['queries']:
+        known.setdefault((query['route'], query['shape']), set()).update(
+            issue_keys(query))
+    regressions = []
+    for query in result['queries']:
+        new = issue_keys(query) - known.get((query['route'], query['shape']),
+                                            set())
+        if new:
+            regressions.append({'route': query['route'],
+                                'shape': query['shape'],
+                                'issues': sorted(new)})
+    return regressions
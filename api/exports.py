@@ -0,0 +1,123 @@
+"""Потоковые выгрузки пользователей, участников и избранного."""
+import csv
+import itertools
+import tempfile
+from datetime import datetime
+
+import openpyxl
+from django.http import FileResponse, StreamingHttpResponse
+from django.utils.timezone import is_aware, localtime
+
+from api.models import Favorite, Participation, User
+
+# строк за одно обращение к серверному курсору
+EXPORT_CHUNK_SIZE = 2000
+
+# заголовки пользователей совпадают с файлом загрузки пользователей
+USER_COLUMNS = (('phone', 'Телефон'), ('last_name', 'Фамилия'),
+                ('first_name', 'Имя'),
+                ('subscription_expiration_date', 'Подписка'),
+                ('email', 'Email'),
+                ('date_of_registration', 'Дата регистрации'))
+EVENT_USER_COLUMNS = (('event_id', 'Id события'),
+                      ('event__title', 'Событие'),
+                      ('event__start_date', 'Дата начала события'),
+                      ('user__phone', 'Телефон'),
+                      ('user__last_name', 'Фамилия'),
+                      ('user__first_name', 'Имя'))
+
+
+class Export:
+    """Выгрузка queryset по столбцам без загрузки строк в память."""
+
+    def __init__(self, name: str, queryset, columns) -> None:
+        """Инициализатор класса."""
+        self.name = name
+        self.queryset = queryset
+        self.columns = columns
+
+    def rows(self):
+        """Заголовок и строки через серверный курсор."""
+        yield [title for _, title in self.columns]
+        rows = (self.queryset.order_by('pk')
+                .values_list(*(field for field, _ in self.columns))
+                .iterator(chunk_size=EXPORT_CHUNK_SIZE))
+        for row in rows:
+            yield [export_value(value) for value in row]
+
+    def write_csv(self, file) -> None:
+        """Запись CSV в открытый текстовый файл."""
+        csv.writer(file).writerows(self.rows())
+
+    def write_xlsx(self, file) -> None:
+        """Запись XLSX в режиме write-only, строки не копятся в памяти."""
+        book = openpyxl.Workbook(write_only=True)
+        sheet = book.create_sheet(self.name)
+        for row in self.rows():
+            sheet.append(row)
+        book.save(file)
+
+    def csv_response(self) -> StreamingHttpResponse:
+        """CSV ответ, который начинает отдаваться с первой строки."""
+        writer = csv.writer(Echo())
+        lines = (writer.writerow(row) for row in self.rows())
+        # BOM, чтобы Excel открыл файл в utf-8
+        response = StreamingHttpResponse(itertools.chain(('\ufeff',), lines),
+                                         content_type='text/csv')
+        response['Content-Disposition'] = (
+            f'attachment; filename="{self.name}.csv"')
+        return response
+
+    def xlsx_response(self) -> FileResponse:
+        """XLSX ответ из временного файла.
+
+        Архив XLSX дописывается при сохранении книги, поэтому книга
+        собирается во временном файле и затем отдается потоком.
+        """
+        file = tempfile.TemporaryFile()
+        self.write_xlsx(file)
+        file.seek(0)
+        return FileResponse(file, as_attachment=True,
+                            filename=f'{self.name}.xlsx')
+
+
+class Echo:
+    """Буфер для csv.writer, возвращающий записанную строку."""
+
+    def write(self, value: str) -> str:
+        """Запись возвращает строку без буферизации."""
+        return value
+
+
+def export_value(value):
+    """Значение ячейки, даты в местном времени без часового пояса."""
+    if isinstance(value, datetime) and is_aware(value):
+        return localtime(value).replace(tzinfo=None)
+    return value
+
+
+def users_export(queryset=None) -> Export:
+    """Выгрузка пользователей."""
+    if queryset is None:
+        queryset = User.objects.all()
+    return Export('users', queryset, USER_COLUMNS)
+
+
+def participants_export(event_ids=None) -> Export:
+    """Выгрузка участников событий."""
+    queryset = Participation.objects.filter(user__isnull=False)
+    if event_ids is not None:
+        queryset = queryset.filter(event_id__in=event_ids)
+    return Export('participants', queryset, EVENT_USER_COLUMNS)
+
+
+def favorites_export(event_ids=None) -> Export:
+    """Выгрузка избранного по событиям."""
+    queryset = Favorite.objects.filter(user__isnull=False)
+    if event_ids is not None:
+        queryset = queryset.filter(event_id__in=event_ids)
+    return Export('favorites', queryset, EVENT_USER_COLUMNS)
+
+
+EXPORTS = {'users': users_export, 'participants': participants_export,
+           'favorites': favorites_export}
@@ -1,6 +1,9 @@
 """Фильтры."""
+from django.utils.timezone import localtime
 from django_filters import rest_framework
-from api.models import User, Event
+
+from api.city_feed import city_event_ids
+from api.models import City, User, Event
 
 
 class ManyToManyFilter(rest_framework.BaseInFilter,
@@ -17,6 +20,18 @@ class ManyToManyFilter(rest_framework.BaseInFilter,
         return qs
 
 
+class CityFilter(rest_framework.BaseInFilter, rest_framework.CharFilter):
+    """Фильтр событий по городам через индекс событий городов."""
+
+    def filter(self, qs, value):  # noqa: A003
+        """Метод фильтрации по названиям городов."""
+        if not value:
+            return qs
+
+        city_ids = City.objects.filter(name__in=value).values('pk')
+        return qs.filter(pk__in=city_event_ids(city_ids, localtime()))
+
+
 class CompetenceFilter(rest_framework.FilterSet):
     """Фильтр по компетенциям (имя с lookup__in) у пользователя."""
 
@@ -30,12 +45,13 @@ class CompetenceFilter(rest_framework.FilterSet):
 
 
 class TagsFilter(rest_framework.FilterSet):
-    """Фильтр по тегам (имя с lookup__in) у события."""
+    """Фильтр по тегам и городам (имя с lookup__in) у события."""
 
     tags = ManyToManyFilter(field_name='tags__name')
+    city = CityFilter()
 
     class Meta:
         """Настройки класса."""
 
         model = Event
-        fields = ['tags']
+        fields = ['tags', 'city']
@@ -0,0 +1,33 @@
+"""Асинхронный HTTP клиент для запросов к провайдерам."""
+import asyncio
+import weakref
+
+import httpx
+from django.conf import settings
+
+# клиент на цикл событий: клиент httpx нельзя использовать в другом цикле
+clients = weakref.WeakKeyDictionary()
+
+
+def http_client() -> httpx.AsyncClient:
+    """Клиент текущего цикла, соединения с провайдерами переиспользуются.
+
+    Под ASGI цикл один на процесс, под WSGI async view выполняется в
+    отдельном цикле на запрос, клиент создается для него заново и
+    закрывается AsyncAPIView после ответа.
+    """
+    loop = asyncio.get_running_loop()
+    client = clients.get(loop)
+    if client is None:
+        limits = httpx.Limits(
+            max_connections=settings.PROVIDER_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.PROVIDER_MAX_CONNECTIONS)
+        client = clients[loop] = httpx.AsyncClient(limits=limits)
+    return client
+
+
+async def close_http_client() -> None:
+    """Закрытие клиента текущего цикла перед его остановкой."""
+    client = clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
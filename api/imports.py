@@ -0,0 +1,290 @@
+"""Фоновые загрузки файлов из админки пачками с продолжением после падения."""
+import io
+import itertools
+import logging
+import time
+import uuid
+from datetime import datetime, timedelta
+
+import openpyxl
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from api.cache_service import ReferenceCache
+from api.models import City, Competence, Event, ImportJob, User
+from api.user_import import UserImporter, prepare_user, read_numbered_rows
+
+logger = logging.getLogger(__name__)
+
+IMPORT_CHUNK_SIZE = 1000
+# ошибок строк хранится в задаче не больше, остальные только считаются
+IMPORT_MAX_ERRORS = 1000
+
+
+def make_aware(value):
+    """Дата из файла с часовым поясом проекта."""
+    if isinstance(value, datetime) and timezone.is_naive(value):
+        return timezone.make_aware(value)
+    return value
+
+
+def count_xlsx_rows(file, header: bool = True):
+    """Число строк первого листа по размерам листа, без чтения строк."""
+    book = openpyxl.load_workbook(file, read_only=True, data_only=True)
+    try:
+        max_row = book.worksheets[0].max_row
+    finally:
+        book.close()
+    if max_row is None:
+        return None
+    return max(max_row - header, 0)
+
+
+class UsersImport:
+    """Пользователи: телефон, фамилия, имя и дата окончания подписки."""
+
+    def __init__(self) -> None:
+        """Инициализатор класса."""
+        self.importer = UserImporter()
+        self.stats = {'rows': 0, 'created': 0, 'updated': 0}
+
+    def read(self, file):
+        """Строки файла с номерами."""
+        return read_numbered_rows(file)
+
+    def count(self, file):
+        """Число строк данных."""
+        return count_xlsx_rows(file)
+
+    def prepare(self, row):
+        """Проверка и подготовка строки."""
+        item = prepare_user(row)
+        if len(item['phone']) > User._meta.get_field('phone').max_length:
+            raise ValueError(f'Неверный телефон {item["phone"]}')
+        return item
+
+    def save(self, items) -> None:
+        """Сохранение пачки в открытой транзакции.
+
+        Пользователи пачки ставятся в очередь CRM в той же транзакции.
+        """
+        self.importer.import_chunk(items, self.stats)
+
+
+class EventsImport:
+    """События: название, описание, даты начала и окончания."""
+
+    def read(self, file):
+        """Строки файла с номерами."""
+        return read_numbered_rows(file)
+
+    def count(self, file):
+        """Число строк данных."""
+        return count_xlsx_rows(file)
+
+    def prepare(self, row):
+        """Проверка и подготовка строки."""
+        if not row.get('Название') or not row.get('Дата начала события'):
+            raise ValueError('Не заданы название или дата начала события')
+        return {'title': str(row['Название']),
+                'description': row.get('Описание') or '',
+                'start_date': make_aware(row['Дата начала события']),
+                'end_date': make_aware(row.get('Дата окончания события'))}
+
+    def save(self, items) -> None:
+        """Создание отсутствующих событий пачки одним запросом."""
+        fields = ('title', 'description', 'start_date', 'end_date')
+        existing = set(Event.objects
+                       .filter(title__in={item['title'] for item in items})
+                       .values_list(*fields))
+        events = {}
+        for item in items:
+            key = tuple(item[field] for field in fields)
+            if key not in existing:
+                events[key] = Event(**item)
+        Event.objects.bulk_create(events.values())
+
+
+class ReferenceImport:
+    """Справочник с уникальным названием, bulk_create без сигналов."""
+
+    model = None
+
+    def prepare(self, row):
+        """Проверка и подготовка строки."""
+        name = str(row).strip()
+        if not name:
+            raise ValueError('Пустое название')
+        return name
+
+    def save(self, items) -> None:
+        """Создание новых записей пачки, существующие пропускаются."""
+        self.model.objects.bulk_create(
+            [self.model(name=name) for name in items], ignore_conflicts=True)
+        ReferenceCache(self.model).invalidate()
+
+
+class CitiesImport(ReferenceImport):
+    """Города: текстовый файл, город на строке."""
+
+    model = City
+
+    def read(self, file):
+        """Строки текстового файла с номерами."""
+        lines = io.TextIOWrapper(file, encoding='utf-8')
+        for number, line in enumerate(lines, start=1):
+            if line.strip():
+                yield number, line
+
+    def count(self, file):
+        """Число непустых строк, тот же отбор, что и в read."""
+        return sum(1 for _ in self.read(file))
+
+
+class CompetencesImport(ReferenceImport):
+    """Компетенции: первый столбец листа без заголовка."""
+
+    model = Competence
+
+    def read(self, file):
+        """Значения первого столбца с номерами строк."""
+        book = openpyxl.load_workbook(file, read_only=True, data_only=True)
+        try:
+            rows = book.worksheets[0].iter_rows(max_col=1, values_only=True)
+            for number, (value,) in enumerate(rows, start=1):
+                if value is not None:
+                    yield number, value
+        finally:
+            book.close()
+
+    def count(self, file):
+        """Число строк листа."""
+        return count_xlsx_rows(file, header=False)
+
+
+IMPORT_KINDS = {'users': UsersImport, 'events': EventsImport,
+                'cities': CitiesImport, 'competences': CompetencesImport}
+
+
+class LeaseLost(Exception):
+    """Задачу как зависшую забрал другой воркер."""
+
+
+def claim_job():
+    """Следующая задача из очереди или зависшая после падения воркера."""
+    stale = timezone.now() - timedelta(
+        seconds=settings.IMPORT_JOB_STALE_SECONDS)
+    with transaction.atomic():
+        job = (ImportJob.objects.select_for_update(skip_locked=True)
+               .filter(Q(status=ImportJob.PENDING)
+                       | Q(status=ImportJob.RUNNING, updated_at__lt=stale))
+               .order_by('pk').first())
+        if job:
+            job.status = ImportJob.RUNNING
+            job.owner = uuid.uuid4().hex
+            job.save(update_fields=['status', 'owner', 'updated_at'])
+    return job
+
+
+class ImportRunner:
+    """Обработка задачи пачками строк.
+
+    Пачка и счетчик обработанных строк коммитятся в одной транзакции,
+    поэтому после падения загрузка продолжается с первой
+    незакоммиченной строки. Перед пачкой под блокировкой строки задачи
+    проверяется, что задача все еще у этого воркера: если воркер завис
+    дольше IMPORT_JOB_STALE_SECONDS и задачу забрал другой, он
+    останавливается, не записав пачку.
+    """
+
+    def __init__(self, job: ImportJob,
+                 chunk_size: int = IMPORT_CHUNK_SIZE) -> None:
+        """Инициализатор класса."""
+        self.job = job
+        self.chunk_size = chunk_size
+        self.kind = IMPORT_KINDS[job.kind]()
+
+    def run(self) -> None:
+        """Загрузка файла задачи до конца или до ошибки."""
+        job = self.job
+        try:
+            if job.total_rows is None:
+                with job.file.open('rb') as file:
+                    total_rows = self.kind.count(file)
+                self.update(total_rows=total_rows)
+            with job.file.open('rb') as file:
+                rows = itertools.islice(self.alive(self.kind.read(file)),
+                                        job.processed_rows, None)
+                while chunk := list(itertools.islice(rows, self.chunk_size)):
+                    self.process(chunk)
+        except LeaseLost:
+            logger.warning('import job %s was taken over by another worker',
+                           job.pk)
+            return
+        except Exception as error:
+            logger.exception('import job %s failed', job.pk)
+            self.finish(status=ImportJob.FAILED, error=str(error))
+            return
+        self.finish(status=ImportJob.DONE, error='',
+                    finished_at=timezone.now())
+
+    def finish(self, **fields) -> None:
+        """Итоговый статус задачи, если ее не забрал другой воркер."""
+        try:
+            self.update(**fields)
+        except LeaseLost:
+            logger.warning('import job %s was taken over by another worker',
+                           self.job.pk)
+
+    def owned(self):
+        """Задача, если она все еще выполняется этим воркером."""
+        return ImportJob.objects.filter(pk=self.job.pk, owner=self.job.owner,
+                                        status=ImportJob.RUNNING)
+
+    def update(self, **fields) -> None:
+        """Запись полей задачи с продлением аренды, если задача у воркера."""
+        if not self.owned().update(updated_at=timezone.now(), **fields):
+            raise LeaseLost
+        for name, value in fields.items():
+            setattr(self.job, name, value)
+
+    def alive(self, rows):
+        """Строки файла с продлением аренды задачи во время чтения.
+
+        Пропуск обработанных строк и чтение пачки большого файла могут
+        идти дольше IMPORT_JOB_STALE_SECONDS.
+        """
+        interval = settings.IMPORT_JOB_STALE_SECONDS / 3
+        renewed = time.monotonic()
+        for row in rows:
+            if time.monotonic() - renewed >= interval:
+                self.update()
+                renewed = time.monotonic()
+            yield row
+
+    def process(self, chunk) -> None:
+        """Сохранение пачки вместе с прогрессом задачи."""
+        job = self.job
+        started = time.perf_counter()
+        items, errors = [], []
+        for number, row in chunk:
+            try:
+                items.append(self.kind.prepare(row))
+            except (KeyError, TypeError, ValueError) as error:
+                errors.append({'row': number, 'error': str(error)})
+        with transaction.atomic():
+            # блокировка строки задачи до коммита пачки: воркер,
+            # перехвативший задачу, увидит уже записанный прогресс
+            if not list(self.owned().select_for_update()
+                        .values_list('pk', flat=True)):
+                raise LeaseLost
+            self.kind.save(items)
+            job.processed_rows += len(chunk)
+            job.error_count += len(errors)
+            job.errors += errors[:IMPORT_MAX_ERRORS - len(job.errors)]
+            job.processed_seconds += time.perf_counter() - started
+            job.save(update_fields=['processed_rows', 'error_count',
+                                    'errors', 'processed_seconds',
+                                    'updated_at'])
@@ -0,0 +1,171 @@
+"""Замеры фаз обработки запроса: SQL, сериализация, внешние вызовы."""
+import contextvars
+import time
+from contextlib import contextmanager, nullcontext
+from functools import partial, wraps
+
+from django.db import connection
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+from api import tracing
+
+# фазы текущего запроса, None вне профилируемого запроса
+current_profile = contextvars.ContextVar('current_profile', default=None)
+# execute_wrapper текущего запроса; под ASGI SQL идет в потоке Django,
+# куда контекст запроса копирует sync_to_async
+current_sql = contextvars.ContextVar('current_sql', default=())
+# подписчики на фазы и обращения к кэшам вне зависимости от запроса,
+# например метрики; объекты с методами phase и cache
+listeners = []
+
+
+def add_listener(listener) -> None:
+    """Подписка на фазы и обращения к кэшам, повторная не добавляется."""
+    if listener not in listeners:
+        listeners.append(listener)
+
+
+class RequestProfile:
+    """Суммарное время и число вызовов фаз одного запроса."""
+
+    def __init__(self) -> None:
+        """Инициализатор класса."""
+        self.started = time.perf_counter()
+        self.phases = {}
+
+    def add(self, name: str, seconds: float) -> None:
+        """Учет вызова фазы."""
+        total, count = self.phases.get(name, (0.0, 0))
+        self.phases[name] = (total + seconds, count + 1)
+
+    def elapsed(self) -> float:
+        """Время с начала запроса в секундах."""
+        return time.perf_counter() - self.started
+
+    def server_timing(self) -> str:
+        """Значение заголовка Server-Timing, время в мс."""
+        items = [f'{name};dur={total * 1000:.2f};desc="{count}"'
+                 for name, (total, count) in self.phases.items()]
+        items.append(f'total;dur={self.elapsed() * 1000:.2f}')
+        return ', '.join(items)
+
+    def as_dict(self) -> dict:
+        """Фазы для структурного лога, время в мс."""
+        return {name: {'ms': round(total * 1000, 3), 'count': count}
+                for name, (total, count) in self.phases.items()}
+
+
+@contextmanager
+def phase(name: str, attributes: dict = None):
+    """Замер фазы, без профиля, подписчиков и трассы ничего не делает.
+
+    Фазы включают вложенные: SQL из ленивых связей попадает и в db, и
+    в serialize. В трассе фаза становится span с атрибутами attributes.
+    """
+    profile = current_profile.get()
+    if (profile is None and not listeners
+            and tracing.current_span.get() is None):
+        yield
+        return
+    started = time.perf_counter()
+    error = True
+    try:
+        with tracing.span(name, attributes):
+            yield
+        error = False
+    finally:
+        seconds = time.perf_counter() - started
+        if profile is not None:
+            profile.add(name, seconds)
+        for listener in listeners:
+            listener.phase(name, seconds, error)
+
+
+def cache_result(name: str, hit: bool) -> None:
+    """Попадание или промах кэша name для подписчиков."""
+    for listener in listeners:
+        listener.cache(name, hit)
+
+
+def timed(name: str):
+    """Декоратор замера фазы name."""
+    def decorator(func):
+        attributes = {'code.function': func.__qualname__}
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with phase(name, attributes):
+                return func(*args, **kwargs)
+        wrapper.__wrapped_phase__ = name
+        return wrapper
+    return decorator
+
+
+def sql_timer(execute, sql, params, many, context):
+    """execute_wrapper: время запросов в фазе db."""
+    with phase('db', {'db.statement': sql}):
+        return execute(sql, params, many, context)
+
+
+def sql_dispatch(execute, sql, params, many, context):
+    """execute_wrapper соединений: обработчики current_sql, как у Django."""
+    for wrapper in current_sql.get():
+        execute = partial(wrapper, execute)
+    return execute(sql, params, many, context)
+
+
+@receiver(connection_created)
+def add_sql_dispatch(connection, **kwargs) -> None:
+    """Подключение sql_dispatch к соединению, повторно не добавляется."""
+    if sql_dispatch not in connection.execute_wrappers:
+        connection.execute_wrappers.append(sql_dispatch)
+
+
+@contextmanager
+def request_sql(wrapper):
+    """execute_wrapper для SQL запроса в любом потоке и соединении."""
+    add_sql_dispatch(connection)
+    token = current_sql.set(current_sql.get() + (wrapper,))
+    try:
+        yield
+    finally:
+        current_sql.reset(token)
+
+
+def sql_phase():
+    """Подключение sql_timer, если его еще не подключил другой обработчик."""
+    if sql_timer in current_sql.get():
+        return nullcontext()
+    return request_sql(sql_timer)
+
+
+def serializer_data(fget):
+    """Замер свойства data сериализатора с именем его класса."""
+    @wraps(fget)
+    def wrapper(self):
+        with phase('serialize', {'serializer': type(self).__name__}):
+            return fget(self)
+    wrapper.__wrapped_phase__ = 'serialize'
+    return wrapper
+
+
+def install_hooks() -> None:
+    """Замеры в Django и DRF, которые нельзя отметить в коде проекта.
+
+    Вызывается только при включенном профилировании или трассировке,
+    повторный вызов ничего не меняет.
+    """
+    from django.contrib.auth.hashers import PBKDF2PasswordHasher
+    from django.http import HttpRequest
+    from rest_framework.serializers import BaseSerializer
+
+    hooks = ((HttpRequest, 'build_absolute_uri', 'absolute_uri'),
+             (PBKDF2PasswordHasher, 'encode', 'password_hash'))
+    for owner, attribute, name in hooks:
+        method = getattr(owner, attribute)
+        if not hasattr(method, '__wrapped_phase__'):
+            setattr(owner, attribute, timed(name)(method))
+    data = BaseSerializer.data
+    if not hasattr(data.fget, '__wrapped_phase__'):
+        BaseSerializer.data = property(serializer_data(data.fget))
@@ -0,0 +1,162 @@
+"""Команда для замера всех маршрутов API."""
+from contextlib import ExitStack
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test import override_settings
+
+from api.benchmark import (ClientRunner, HTTPRunner, Sample, api_targets,
+                           compare_results, load_baseline, run_benchmark,
+                           save_baseline, serve_asgi, serve_wsgi)
+from api.models import User
+from api.provider_stub import Profile, ProviderStub
+
+
+class Command(BaseCommand):
+    """Задержки p50/p95/p99, запросы в секунду, SQL и размер ответов."""
+
+    help = 'benchmark every API route.'  # noqa: A003
+
+    def add_arguments(self, parser):
+        """Аргументы команды."""
+        parser.add_argument('--server', choices=('client', 'wsgi', 'asgi'),
+                            default='client',
+                            help='тестовый клиент, WSGI сервер в потоке '
+                                 'или daphne')
+        parser.add_argument('--url',
+                            help='адрес уже запущенного сервера')
+        parser.add_argument('--requests', type=int, default=100,
+                            help='число запросов к маршруту')
+        parser.add_argument('--concurrency', type=int, default=1,
+                            help='число параллельных клиентов')
+        parser.add_argument('--warmup', type=int, default=3,
+                            help='запросов прогрева перед замером')
+        parser.add_argument('--route', action='append',
+                            help='замерять только маршрут, можно повторять')
+        parser.add_argument('--phone',
+                            help='телефон пользователя для авторизации')
+        parser.add_argument('--accept-encoding',
+                            help='заголовок Accept-Encoding запросов')
+        parser.add_argument('--stub-sms', nargs='?', const='',
+                            help='запросы smstraffic в локальную заглушку '
+                                 'с профилем, например fixed:200')
+        parser.add_argument('--stub-carrot', nargs='?', const='',
+                            help='Carrot quest в локальную заглушку с '
+                                 'профилем, например '
+                                 'lognormal:150:0.6,errors=0.01')
+        parser.add_argument('--save', help='сохранить результат в JSON')
+        parser.add_argument('--compare',
+                            help='сравнить с сохраненным результатом')
+        parser.add_argument('--tolerance', type=float, default=0.2,
+                            help='допустимый рост p95 при сравнении')
+
+    def handle(self, *args, **options):
+        """Точка входа команды."""
+        user = None
+        if options['phone']:
+            user = User.objects.filter(phone=options['phone']).first()
+            if user is None:
+                raise CommandError(f'Нет пользователя {options["phone"]}')
+        try:
+            sample = Sample(user)
+        except ValueError as error:
+            raise CommandError(error)
+        targets, skipped = api_targets(sample)
+        if options['route']:
+            targets = [target for target in targets
+                       if target.route in options['route']]
+        for route, reason in skipped.items():
+            self.stdout.write(f'пропущен {route}: {reason}')
+
+        headers = {}
+        if options['accept_encoding']:
+            headers['Accept-Encoding'] = options['accept_encoding']
+        with ExitStack() as stack:
+            overrides = {}
+            stubs = {name: options[f'stub_{name}']
+                     for name in ('sms', 'carrot')
+                     if options[f'stub_{name}'] is not None}
+            if stubs:
+                try:
+                    stub = ProviderStub(
+                        sms=Profile.parse(options['stub_sms']),
+                        carrot=Profile.parse(options['stub_carrot']))
+                except ValueError as error:
+                    raise CommandError(error)
+                stack.enter_context(stub)
+                overrides = stub.settings()
+                stack.enter_context(override_settings(**overrides))
+            runner = self.get_runner(options, headers, overrides, stack)
+            self.write_header()
+            result = run_benchmark(
+                runner, sample, targets, options['requests'],
+                options['concurrency'], options['warmup'],
+                log=self.write_row)
+        result['server'] = options['url'] or options['server']
+        result['stubs'] = stubs
+
+        if options['save']:
+            save_baseline(result, options['save'])
+            self.stdout.write(f'сохранено в {options["save"]}')
+        if options['compare']:
+            self.compare(load_baseline(options['compare']), result,
+                         options['tolerance'])
+
+    def get_runner(self, options, headers, overrides, stack):
+        """Клиент замера, серверы останавливаются при выходе из stack."""
+        if options['url']:
+            return HTTPRunner(options['url'], headers)
+        if options['server'] == 'wsgi':
+            server, url = serve_wsgi()
+            stack.callback(server.shutdown)
+            return HTTPRunner(url, headers)
+        if options['server'] == 'asgi':
+            try:
+                process, url = serve_asgi(env=overrides)
+            except (OSError, RuntimeError) as error:
+                raise CommandError(f'daphne: {error}')
+            stack.callback(process.wait)
+            stack.callback(process.terminate)
+            return HTTPRunner(url, headers)
+        return ClientRunner(headers)
+
+    def write_header(self):
+        """Заголовок таблицы результатов."""
+        self.stdout.write(f'{"маршрут":<28} {"p50":>8} {"p95":>8} '
+                          f'{"p99":>8} {"rps":>8} {"sql":>4} '
+                          f'{"bytes":>9} статусы')
+
+    def write_row(self, route, summary):
+        """Строка отчета: задержки в мс, запросы в секунду, SQL, байты."""
+        queries = summary['queries']
+        statuses = ' '.join(f'{status}x{count}' for status, count
+                            in sorted(summary['statuses'].items()))
+        self.stdout.write(
+            f'{route:<28} {summary["p50"]:8.2f} {summary["p95"]:8.2f} '
+            f'{summary["p99"]:8.2f} {summary["throughput"]:8.1f} '
+            f'{"-" if queries is None else queries:>4} '
+            f'{summary["bytes"]:>9} {statuses}')
+
+    def compare(self, baseline, result, tolerance):
+        """Отчет сравнения, ошибка команды при регрессии."""
+        self.stdout.write(f'сравнение с {baseline.get("commit")} '
+                          f'({baseline.get("created_at")})')
+        for key in ('server', 'concurrency', 'counts', 'stubs'):
+            if baseline.get(key) != result.get(key):
+                self.stdout.write(f'внимание: {key} отличается: '
+                                  f'{baseline.get(key)} -> {result.get(key)}')
+        regressions = []
+        for row in compare_results(baseline, result, tolerance):
+            ratio = row['p95_ratio']
+            delta = row['queries_delta']
+            mark = 'РЕГРЕССИЯ' if row['regression'] else ''
+            self.stdout.write(
+                f'{row["route"]:<28} p95 {row["base_p95"]:8.2f} -> '
+                f'{row["p95"]:8.2f} '
+                f'({"-" if ratio is None else f"{ratio:.2f}x"}) '
+                f'sql {"-" if delta is None else f"{delta:+d}"} '
+                f'bytes {row["bytes_delta"]:+d} {mark}')
+            if row['regression']:
+                regressions.append(row['route'])
+        if regressions:
+            raise CommandError(f'Регрессия маршрутов: '
+                               f'{", ".join(regressions)}')
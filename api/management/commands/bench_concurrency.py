@@ -0,0 +1,66 @@
+"""Команда замера одновременных запросов к медленному провайдеру."""
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.benchmark import Sample
+from api.concurrency_bench import MODES, ROUTES, run_concurrency_bench
+from api.provider_stub import Profile, ProviderStub
+
+
+class Command(BaseCommand):
+    """Пропускная способность одного процесса ASGI и WSGI с потоками."""
+
+    help = 'benchmark concurrent requests waiting on a slow provider.'  # noqa: A003, E501
+
+    def add_arguments(self, parser):
+        """Аргументы команды."""
+        parser.add_argument('--route', choices=list(ROUTES),
+                            default='events',
+                            help='просмотр события или отправка смс')
+        parser.add_argument('--mode', action='append', choices=MODES,
+                            help='режим, можно несколько; по умолчанию все')
+        parser.add_argument('--concurrency', default='1,10,50,100,200',
+                            help='числа одновременных клиентов через запятую')
+        parser.add_argument('--threads', type=int, default=8,
+                            help='потоков процесса в режиме wsgi')
+        parser.add_argument('--requests', type=int, default=200,
+                            help='число запросов на замер')
+        parser.add_argument('--sms', default='fixed:200',
+                            help='профиль заглушки smstraffic')
+        parser.add_argument('--carrot', default='fixed:200',
+                            help='профиль заглушки Carrot quest, ее ждут '
+                                 'и сигналы сохранения пользователя')
+        parser.add_argument('--json', help='сохранить отчет в JSON')
+
+    def handle(self, *args, **options):
+        """Точка входа команды."""
+        try:
+            levels = [int(level) for level
+                      in options['concurrency'].split(',')]
+            profiles = {'sms': Profile.parse(options['sms']),
+                        'carrot': Profile.parse(options['carrot'])}
+            sample = Sample()
+        except ValueError as error:
+            raise CommandError(error)
+        if min(levels) < 1 or options['threads'] < 1:
+            raise CommandError('--concurrency и --threads должны быть '
+                               'больше 0')
+
+        def log(result):
+            self.stdout.write(
+                f'{result["mode"]:<5} x{result["concurrency"]:<4} '
+                f'{result["throughput"]:8.1f} запр/с '
+                f'p50 {result["p50"]:8.2f} p95 {result["p95"]:8.2f} ms, '
+                f'у провайдера до {result["provider_peak"]}, '
+                f'ошибок {result["errors"]}')
+
+        with ProviderStub(**profiles) as stub:
+            report = run_concurrency_bench(
+                sample, stub, options['route'], options['mode'] or MODES,
+                levels, options['threads'], options['requests'], log)
+        report['profiles'] = {'sms': options['sms'],
+                              'carrot': options['carrot']}
+        if options['json']:
+            with open(options['json'], 'w', encoding='utf-8') as file:
+                json.dump(report, file, ensure_ascii=False, indent=2)
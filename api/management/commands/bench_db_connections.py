@@ -0,0 +1,53 @@
+"""Команда замера соединений с базой."""
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.db_benchmark import MODES, run_connection_bench
+
+
+class Command(BaseCommand):
+    """Пропускная способность, задержки и число открытых соединений."""
+
+    help = 'benchmark database connection modes.'  # noqa: A003
+
+    def add_arguments(self, parser):
+        """Аргументы команды."""
+        parser.add_argument('--mode', action='append', choices=list(MODES),
+                            help='режим, можно несколько; по умолчанию все')
+        parser.add_argument('--threads', type=int, default=8,
+                            help='число потоков')
+        parser.add_argument('--requests', type=int, default=2000,
+                            help='число запросов на режим')
+        parser.add_argument('--churn', action='store_true',
+                            help='новая обертка соединения на каждый '
+                                 'запрос, как потоки sync_to_async')
+        parser.add_argument('--pool-size', type=int, default=4,
+                            help='размер пула в режиме pool')
+        parser.add_argument('--query', default='SELECT 1',
+                            help='SQL запрос каждого цикла')
+        parser.add_argument('--json', help='сохранить отчет в JSON')
+
+    def handle(self, *args, **options):
+        """Точка входа команды."""
+        if options['threads'] < 1 or options['pool_size'] < 1:
+            raise CommandError('--threads и --pool-size должны быть больше 0')
+        report = run_connection_bench(
+            options['mode'] or list(MODES), options['threads'],
+            options['requests'], options['churn'], options['pool_size'],
+            options['query'])
+        for result in report['modes'].values():
+            if not result['requests']:
+                self.stdout.write(f'{result["mode"]:<11} все запросы с '
+                                  f'ошибкой ({result["errors"]})')
+                continue
+            self.stdout.write(
+                f'{result["mode"]:<11} {result["throughput"]:9.1f} запр/с '
+                f'p50 {result["p50"]:7.2f} p95 {result["p95"]:7.2f} '
+                f'p99 {result["p99"]:7.2f} ms, соединений '
+                f'{result["connections"]} '
+                f'({result["connections_per_second"]}/с), '
+                f'ошибок {result["errors"]}')
+        if options['json']:
+            with open(options['json'], 'w', encoding='utf-8') as file:
+                json.dump(report, file, ensure_ascii=False, indent=2)
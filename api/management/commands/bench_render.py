@@ -0,0 +1,69 @@
+"""Команда для замера рендеринга и сжатия ответов списков."""
+import time
+
+import brotli
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils.text import compress_string
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from api.renderers import ORJSONRenderer
+from api.views import EventListView, UsersListView
+
+
+class Command(BaseCommand):
+    """Сравнение JSONRenderer и ORJSONRenderer, размер ответа до и после."""
+
+    help = 'benchmark JSON rendering and compression.'  # noqa: A003
+
+    def add_arguments(self, parser):
+        """Аргументы команды."""
+        parser.add_argument('--limit', type=int, default=1000,
+                            help='число объектов в ответе')
+        parser.add_argument('--repeat', type=int, default=20,
+                            help='число повторов каждого замера')
+
+    def handle(self, *args, **options):
+        """Точка входа команды."""
+        for view_class in (EventListView, UsersListView):
+            data = self.get_payload(view_class, options['limit'])
+            self.stdout.write(f'{view_class.__name__}: {len(data)} объектов')
+            rendered = {}
+            for renderer in (JSONRenderer(), ORJSONRenderer()):
+                seconds, content = self.measure(
+                    lambda: renderer.render(data), options['repeat'])
+                rendered[type(renderer).__name__] = content
+                self.write_row(type(renderer).__name__, seconds, content)
+
+            content = rendered['ORJSONRenderer']
+            compressors = (
+                ('gzip', compress_string),
+                ('br', lambda body: brotli.compress(
+                    body, quality=settings.BROTLI_QUALITY)),
+            )
+            for name, compress in compressors:
+                seconds, compressed = self.measure(
+                    lambda: compress(content), options['repeat'])
+                self.write_row(name, seconds, compressed)
+
+    def get_payload(self, view_class, limit):
+        """Сериализованные данные списка без пагинации."""
+        request = APIRequestFactory().get(settings.COMPRESSION_PATH_PREFIX)
+        view = view_class(request=Request(request), format_kwarg=None)
+        queryset = view.get_queryset()[:limit]
+        return view.get_serializer(queryset, many=True).data
+
+    @staticmethod
+    def measure(func, repeat):
+        """Среднее процессорное время вызова и результат последнего."""
+        started = time.process_time()
+        for _ in range(repeat):
+            result = func()
+        return (time.process_time() - started) / repeat, result
+
+    def write_row(self, name, seconds, content):
+        """Строка отчета: время в мс и размер в байтах."""
+        self.stdout.write(f'  {name:<16} {seconds * 1000:9.3f} ms '
+                          f'{len(content):>10} bytes')
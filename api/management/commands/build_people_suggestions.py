@@ -0,0 +1,36 @@
+"""Команда для пакетного расчета возможных знакомых."""
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from api.recommendations import PeopleSuggestionBuilder
+
+
+class Command(BaseCommand):
+    """Пересчет возможных знакомых пользователей."""
+
+    help = 'build people you may know suggestions.'  # noqa: A003
+
+    def add_arguments(self, parser):
+        """Аргументы команды."""
+        parser.add_argument('--top-k', type=int,
+                            default=settings.PEOPLE_SUGGESTIONS_TOP_K,
+                            help='число знакомых на пользователя')
+        parser.add_argument('--chunk-size', type=int, default=1000,
+                            help='пользователей в пачке расчета')
+        parser.add_argument('--memory-mb', type=int, default=256,
+                            help='предел матрицы близости пачки')
+        parser.add_argument('--incremental', action='store_true',
+                            help='только пользователи с изменениями')
+
+    def handle(self, *args, **options):
+        """Точка входа команды."""
+        self.stdout.write('building people suggestions...')
+        builder = PeopleSuggestionBuilder(options['top_k'],
+                                          options['chunk_size'],
+                                          options['memory_mb'])
+        stats = builder.build(incremental=options['incremental'])
+        self.stdout.write(
+            f'users: {stats["users"]}, refreshed: {stats["refreshed"]}, '
+            f'stored: {stats["stored"]}, chunks: {stats["chunks"]}, '
+            f'{stats["seconds"]:.1f} s')
+        self.stdout.write('done.')
@@ -0,0 +1,30 @@
+"""Команда для пакетного расчета рекомендаций событий."""
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from api.recommendations import RecommendationBuilder
+
+
+class Command(BaseCommand):
+    """Пересчет рекомендованных событий для всех пользователей."""
+
+    help = 'build event recommendations for all users.'  # noqa: A003
+
+    def add_arguments(self, parser):
+        """Аргументы команды."""
+        parser.add_argument('--top-n', type=int,
+                            default=settings.RECOMMENDATIONS_TOP_N,
+                            help='число событий на пользователя')
+        parser.add_argument('--memory-mb', type=int, default=256,
+                            help='память под матрицу оценок пачки')
+
+    def handle(self, *args, **options):
+        """Точка входа команды."""
+        self.stdout.write('building recommendations...')
+        stats = RecommendationBuilder(options['top_n'],
+                                      options['memory_mb']).build()
+        self.stdout.write(
+            f'users: {stats["users"]}, events: {stats["events"]}, '
+            f'stored: {stats["stored"]}, chunk: {stats["chunk_size"]}, '
+            f'{stats["seconds"]:.1f} s')
+        self.stdout.write('done.')
@@ -0,0 +1,99 @@
+"""Команда для аудита планов SQL запросов API."""
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from api.benchmark import Sample, load_baseline, save_baseline
+from api.explain import (ISSUE_KINDS, audit_targets, compare_audits,
+                         run_audit)
+from api.models import User
+
+
+class Command(BaseCommand):
+    """EXPLAIN (ANALYZE, BUFFERS) запросов всех маршрутов API."""
+
+    help = 'audit query plans of every API route.'  # noqa: A003
+
+    def add_arguments(self, parser):
+        """Аргументы команды."""
+        parser.add_argument('--route', action='append',
+                            help='проверять только маршрут, можно повторять')
+        parser.add_argument('--phone',
+                            help='телефон пользователя для авторизации')
+        parser.add_argument('--min-rows', type=int, default=10000,
+                            help='размер таблицы или сортировки, с которого '
+                                 'план отмечается')
+        parser.add_argument('--json', action='store_true',
+                            help='результат в JSON вместо таблицы')
+        parser.add_argument('--save', help='сохранить результат в JSON')
+        parser.add_argument('--compare',
+                            help='ошибка при новых проблемах планов '
+                                 'относительно сохраненного результата')
+        parser.add_argument('--fail-on', action='append',
+                            choices=ISSUE_KINDS,
+                            help='ошибка при любой проблеме этого вида '
+                                 'без предложенного индекса')
+
+    def handle(self, *args, **options):
+        """Точка входа команды."""
+        if connection.vendor != 'postgresql':
+            raise CommandError('Нужна база PostgreSQL')
+        user = None
+        if options['phone']:
+            user = User.objects.filter(phone=options['phone']).first()
+            if user is None:
+                raise CommandError(f'Нет пользователя {options["phone"]}')
+        try:
+            sample = Sample(user)
+        except ValueError as error:
+            raise CommandError(error)
+        targets = audit_targets(sample)
+        if options['route']:
+            targets = [target for target in targets
+                       if target.route in options['route']]
+
+        log = None if options['json'] else self.write_target
+        result = run_audit(sample, targets, options['min_rows'], log)
+        if options['json']:
+            self.stdout.write(json.dumps(result, ensure_ascii=False,
+                                         indent=2))
+        if options['save']:
+            save_baseline(result, options['save'])
+            self.stderr.write(f'сохранено в {options["save"]}')
+
+        failures = []
+        if options['compare']:
+            for row in compare_audits(load_baseline(options['compare']),
+                                      result):
+                failures.append(f'{row["route"]}: новые '
+                                f'{", ".join(map(" ".join, row["issues"]))}'
+                                f' в {row["shape"][:80]}')
+        for query in result['queries']:
+            for issue in query['issues']:
+                if (issue['kind'] in (options['fail_on'] or ())
+                        and 'suggestion' in issue):
+                    failures.append(f'{query["route"]}: {issue["kind"]} '
+                                    f'{issue["relation"]}, '
+                                    f'{issue["suggestion"]}')
+        if failures:
+            raise CommandError('Проблемы планов:\n' + '\n'.join(failures))
+
+    def write_target(self, target, results):
+        """Запросы маршрута: время, буферы и отмеченные узлы планов."""
+        self.stdout.write(f'{target.method.upper()} {target.path}')
+        for query in results:
+            repeats = (f' x{query["repeats"]}' if query['repeats'] > 1
+                       else '')
+            self.stdout.write(
+                f'  {query["execution_ms"]:9.2f} мс '
+                f'hit {query["shared_hit"]:>6} read {query["shared_read"]:>6}'
+                f'{repeats}  {query["shape"][:90]}')
+            for issue in query['issues']:
+                advice = issue.get('suggestion') or (
+                    f'есть индекс {issue["index"]}' if 'index' in issue
+                    else '')
+                detail = (issue.get('filter') or issue.get('keys')
+                          or issue.get('condition') or '')
+                self.stdout.write(f'    ! {issue["kind"]} {issue["relation"]}'
+                                  f' {detail} {advice}'.rstrip())
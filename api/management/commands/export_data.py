@@ -0,0 +1,39 @@
+"""Команда для потоковой выгрузки данных в CSV или XLSX."""
+from django.core.management.base import BaseCommand, CommandError
+
+from api.exports import EXPORTS
+
+
+class Command(BaseCommand):
+    """Выгрузка пользователей, участников или избранного."""
+
+    help = 'export users, participants or favorites.'  # noqa: A003
+
+    def add_arguments(self, parser):
+        """Аргументы команды."""
+        parser.add_argument('name', choices=sorted(EXPORTS))
+        parser.add_argument('--format', choices=('csv', 'xlsx'),
+                            default='csv')
+        parser.add_argument('--output', help='файл, по умолчанию stdout '
+                                             'для csv')
+        parser.add_argument('--event', type=int, action='append',
+                            dest='events',
+                            help='id события для участников и избранного')
+
+    def handle(self, *args, **options):
+        """Точка входа команды."""
+        if options['name'] == 'users':
+            export = EXPORTS['users']()
+        else:
+            export = EXPORTS[options['name']](options['events'])
+        output = options['output']
+        if options['format'] == 'xlsx':
+            if not output:
+                raise CommandError('Для xlsx нужен --output')
+            with open(output, 'wb') as file:
+                export.write_xlsx(file)
+        elif output:
+            with open(output, 'w', newline='', encoding='utf-8') as file:
+                export.write_csv(file)
+        else:
+            export.write_csv(self.stdout)
@@ -0,0 +1,26 @@
+"""Команда для загрузки пользователей из XLSX."""
+from django.core.management.base import BaseCommand
+
+from api.user_import import IMPORT_CHUNK_SIZE, UserImporter, read_rows
+
+
+class Command(BaseCommand):
+    """Загрузка пользователей из файла без запросов на каждую строку."""
+
+    help = 'import users from xlsx file.'  # noqa: A003
+
+    def add_arguments(self, parser):
+        """Аргументы команды."""
+        parser.add_argument('path', help='файл XLSX')
+        parser.add_argument('--chunk-size', type=int,
+                            default=IMPORT_CHUNK_SIZE,
+                            help='строк в транзакции')
+
+    def handle(self, *args, **options):
+        """Точка входа команды."""
+        importer = UserImporter(options['chunk_size'])
+        stats = importer.import_rows(read_rows(options['path']))
+        self.stdout.write(
+            f'rows: {stats["rows"]}, created: {stats["created"]}, '
+            f'updated: {stats["updated"]}, '
+            f'{stats["rows_per_second"]:.0f} rows/s')
@@ -0,0 +1,45 @@
+"""Команда воркера фоновых загрузок файлов."""
+import time
+
+from django.core.management.base import BaseCommand
+
+from api.imports import IMPORT_CHUNK_SIZE, ImportRunner, claim_job
+from api.user_import import process_sync_queue
+
+
+class Command(BaseCommand):
+    """Обработка очереди загрузок из админки и очереди отправки в CRM."""
+
+    help = 'process queued admin imports and CRM sync.'  # noqa: A003
+
+    def add_arguments(self, parser):
+        """Аргументы команды."""
+        parser.add_argument('--once', action='store_true',
+                            help='обработать очередь и выйти')
+        parser.add_argument('--poll', type=float, default=5,
+                            help='пауза при пустой очереди, секунды')
+        parser.add_argument('--chunk-size', type=int,
+                            default=IMPORT_CHUNK_SIZE,
+                            help='строк в транзакции')
+
+    def handle(self, *args, **options):
+        """Точка входа команды."""
+        while True:
+            job = claim_job()
+            if job is None:
+                stats = process_sync_queue()
+                if stats['sent'] or stats['failed']:
+                    self.stdout.write(f'crm sync: sent {stats["sent"]}, '
+                                      f'failed {stats["failed"]}')
+                    continue
+                if options['once']:
+                    return
+                time.sleep(options['poll'])
+                continue
+            self.stdout.write(f'import job {job.pk}: {job.kind}')
+            ImportRunner(job, options['chunk_size']).run()
+            job.refresh_from_db()
+            self.stdout.write(
+                f'import job {job.pk}: {job.status}, '
+                f'rows: {job.processed_rows}, errors: {job.error_count}, '
+                f'{job.rows_per_second:.0f} rows/s')
@@ -0,0 +1,44 @@
+"""Команда запуска локальной заглушки smstraffic и Carrot quest."""
+from django.core.management.base import BaseCommand, CommandError
+
+from api.provider_stub import Profile, ProviderStub
+
+
+class Command(BaseCommand):
+    """Заглушка провайдеров с задержками, ошибками и зависаниями."""
+
+    help = 'run local smstraffic and Carrot quest stand-ins.'  # noqa: A003
+
+    def add_arguments(self, parser):
+        """Аргументы команды."""
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8900)
+        parser.add_argument('--sms', default='',
+                            help='профиль smstraffic, например '
+                                 'lognormal:300:0.5,errors=0.02')
+        parser.add_argument('--carrot', default='',
+                            help='профиль Carrot quest, например '
+                                 'uniform:50:400,timeouts=0.01,hang=30')
+        parser.add_argument('--seed', type=int,
+                            help='seed генератора задержек и ошибок')
+
+    def handle(self, *args, **options):
+        """Точка входа команды."""
+        try:
+            stub = ProviderStub(options['host'], options['port'],
+                                Profile.parse(options['sms']),
+                                Profile.parse(options['carrot']),
+                                options['seed'])
+        except ValueError as error:
+            raise CommandError(error)
+        self.stdout.write('переменные окружения для сервера API:')
+        for name, value in stub.settings().items():
+            self.stdout.write(f'{name}={value}')
+        try:
+            stub.server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            stub.server.server_close()
+        for (provider, outcome), count in sorted(stub.outcomes.items()):
+            self.stdout.write(f'{provider} {outcome}: {count}')
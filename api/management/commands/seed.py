@@ -1,12 +1,14 @@
 """Команда для заполнения базы тестовыми данными."""
 import random
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
 
+from django.conf import settings
 from django.core.files.base import ContentFile
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
 from django.utils.timezone import make_aware
 
 from api.models import City, Competence, Event, Tags, User
+from api.seeding import ScaleSeeder
 
 
 class Command(BaseCommand):
@@ -14,8 +16,37 @@ class Command(BaseCommand):
 
     help = 'seed database for testing and development.'  # noqa: A003
 
+    def add_arguments(self, parser):
+        """Аргументы команды."""
+        parser.add_argument('--scale', type=float,
+                            help='объем данных: единица - 10 тысяч '
+                                 'пользователей и 2 тысячи событий')
+        parser.add_argument('--seed', type=int, default=0,
+                            help='seed генератора для --scale')
+        parser.add_argument('--today', type=date.fromisoformat,
+                            help='дата отсчета для --scale, YYYY-MM-DD')
+        parser.add_argument('--copy', action='store_true',
+                            help='запись через COPY в postgres')
+        parser.add_argument('--batch-size', type=int, default=10000,
+                            help='строк в пачке записи')
+        parser.add_argument('--flush', action='store_true',
+                            help='для --scale: удалить пользователей, '
+                                 'кроме суперпользователей, события и '
+                                 'справочники')
+        parser.add_argument('--noinput', '--no-input', action='store_false',
+                            dest='interactive',
+                            help='не спрашивать подтверждение --flush')
+
     def handle(self, *args, **options):
         """Точка входа команды."""
+        if options['scale'] is not None:
+            self.check_flush(options)
+            self.stdout.write(f'seeding scale {options["scale"]}...')
+            ScaleSeeder(options['scale'], options['seed'], options['copy'],
+                        options['batch_size'], options['today'],
+                        log=self.stdout.write).run()
+            self.stdout.write('done.')
+            return
         self.stdout.write('seeding data...')
         self.create_cities()
         self.create_competence()
@@ -26,6 +57,23 @@ class Command(BaseCommand):
 
         self.stdout.write('done.')
 
+    def check_flush(self, options):
+        """Перегенерация по масштабу только явно и не на продакшене."""
+        if not settings.DEBUG:
+            raise CommandError('--scale удаляет данные и работает только '
+                               'при DEBUG')
+        if not options['flush']:
+            raise CommandError('--scale удаляет пользователей, события и '
+                               'справочники, подтвердите флагом --flush')
+        if options['interactive']:
+            database = settings.DATABASES['default']
+            answer = input(
+                'Все пользователи, кроме суперпользователей, события и '
+                f'справочники базы {database["NAME"]} будут удалены.\n'
+                "Введите 'yes' для продолжения: ")
+            if answer != 'yes':
+                raise CommandError('Отменено.')
+
     def create_cities(self):
         """Создание городов."""
         City.objects.all().delete()
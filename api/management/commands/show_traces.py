@@ -0,0 +1,44 @@
+"""Команда для просмотра трасс запросов."""
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from api.tracing import format_trace, read_traces
+
+
+class Command(BaseCommand):
+    """Дерево span самых долгих трасс из файла TRACING_FILE."""
+
+    help = 'show the slowest request traces.'  # noqa: A003
+
+    def add_arguments(self, parser):
+        """Аргументы команды."""
+        parser.add_argument('--file', default=settings.TRACING_FILE,
+                            help='файл трасс FileExporter')
+        parser.add_argument('--view',
+                            help='только трассы view, например '
+                                 'EventDetailView')
+        parser.add_argument('--trace', help='трасса по идентификатору')
+        parser.add_argument('--slowest', type=int, default=1,
+                            help='число самых долгих трасс')
+
+    def handle(self, *args, **options):
+        """Точка входа команды."""
+        try:
+            traces = list(read_traces(options['file']))
+        except OSError as error:
+            raise CommandError(error)
+        if options['trace']:
+            traces = [trace for trace in traces
+                      if trace['trace_id'] == options['trace']]
+        if options['view']:
+            traces = [trace for trace in traces
+                      if self.view(trace) == options['view']]
+        traces.sort(key=lambda trace: -trace['ms'])
+        for trace in traces[:options['slowest']]:
+            self.stdout.write('\n'.join(format_trace(trace)) + '\n')
+
+    @staticmethod
+    def view(trace):
+        """View корневого span трассы."""
+        return next((item['attributes']['view'] for item in trace['spans']
+                     if 'view' in item['attributes']), None)
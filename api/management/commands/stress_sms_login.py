@@ -0,0 +1,80 @@
+"""Команда нагрузочной проверки входа по смс."""
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.models import SMSAuth, User
+from api.provider_stub import Profile
+from api.stress import LoginStress, stress_phones
+
+
+class Command(BaseCommand):
+    """Параллельный вход номеров через локальные заглушки провайдеров."""
+
+    help = 'stress test the SMS login flow.'  # noqa: A003
+
+    def add_arguments(self, parser):
+        """Аргументы команды."""
+        parser.add_argument('--phones', type=int, default=1000,
+                            help='число номеров')
+        parser.add_argument('--start', type=int, default=0,
+                            help='номер первого телефона')
+        parser.add_argument('--concurrency', type=int, default=50,
+                            help='число параллельных клиентов')
+        parser.add_argument('--burst', type=int, default=2,
+                            help='одновременных входов одного номера')
+        parser.add_argument('--typo-rate', type=float, default=0.3,
+                            help='доля входов с неверным кодом')
+        parser.add_argument('--seed', type=int, default=0,
+                            help='seed генератора ошибок ввода')
+        parser.add_argument('--sms', default='',
+                            help='профиль заглушки smstraffic, например '
+                                 'lognormal:200:0.5,errors=0.01')
+        parser.add_argument('--carrot', default='',
+                            help='профиль заглушки Carrot quest')
+        parser.add_argument('--json', help='сохранить отчет в JSON')
+        parser.add_argument('--cleanup', action='store_true',
+                            help='удалить пользователей и коды после прогона')
+
+    def handle(self, *args, **options):
+        """Точка входа команды."""
+        phones = stress_phones(options['phones'], options['start'])
+        try:
+            profiles = {'sms': Profile.parse(options['sms']),
+                        'carrot': Profile.parse(options['carrot'])}
+        except ValueError as error:
+            raise CommandError(error)
+        stress = LoginStress(phones, options['concurrency'],
+                             options['burst'], options['typo_rate'],
+                             options['seed'], **profiles)
+        try:
+            report = stress.run()
+        finally:
+            if options['cleanup']:
+                SMSAuth.objects.filter(phone__in=phones).delete()
+                User.objects.filter(phone__in=phones).delete()
+
+        self.stdout.write(f'{report["phones"]} номеров, {report["flows"]} '
+                          f'входов за {report["seconds"]} с, '
+                          f'{report["logins_per_second"]} входов/с')
+        for step, summary in report['steps'].items():
+            statuses = ' '.join(f'{status}x{count}' for status, count
+                                in sorted(summary['statuses'].items()))
+            self.stdout.write(
+                f'  {step:<12} p50 {summary["p50"]:8.2f} '
+                f'p95 {summary["p95"]:8.2f} p99 {summary["p99"]:8.2f} ms '
+                f'{statuses}')
+        waits = report['lock_waits']
+        self.stdout.write(f'ожидания блокировок: максимум {waits["max"]}, '
+                          f'в среднем {waits["mean"]}, '
+                          f'доля замеров {waits["waiting_share"]}')
+        self.stdout.write('провайдеры: ' + ', '.join(
+            f'{name} {count}' for name, count
+            in report['providers'].items()))
+        if options['json']:
+            with open(options['json'], 'w', encoding='utf-8') as file:
+                json.dump(report, file, ensure_ascii=False, indent=2)
+        if report['violations']:
+            raise CommandError('Нарушены инварианты: '
+                               + '; '.join(report['violations']))
+        self.stdout.write('инварианты соблюдены')
@@ -0,0 +1,156 @@
+"""Метрики в формате Prometheus: запросы, SQL, внешние вызовы, кэши, очереди.
+
+При заданной переменной PROMETHEUS_MULTIPROC_DIR значения каждого
+процесса пишутся в его mmap файлы, а эндпоинт суммирует файлы всех
+процессов. Под gunicorn хуки из gunicorn.conf.py очищают каталог перед
+запуском воркеров и вызывают mark_process_dead при остановке воркера.
+"""
+import hmac
+import os
+import time
+
+from django.conf import settings
+from django.db.models import Count, F
+from prometheus_client import (CONTENT_TYPE_LATEST, REGISTRY,
+                               CollectorRegistry, Counter, Histogram,
+                               generate_latest, multiprocess)
+from prometheus_client.core import GaugeMetricFamily
+
+from api.instrumentation import add_listener
+from api.models import ImportJob, PeopleSuggestion
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERIES_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 500, 1000)
+# фазы внешних вызовов из instrumentation.phase
+PROVIDERS = ('sms', 'carrot')
+
+REQUEST_SECONDS = Histogram(
+    'api_request_duration_seconds', 'Время обработки запроса',
+    ('route', 'method'), buckets=LATENCY_BUCKETS)
+REQUESTS = Counter(
+    'api_requests', 'Ответы по статусам', ('route', 'method', 'status'))
+REQUEST_QUERIES = Histogram(
+    'api_request_db_queries', 'SQL запросов на запрос', ('route',),
+    buckets=QUERIES_BUCKETS)
+REQUEST_DB_SECONDS = Counter(
+    'api_request_db_seconds', 'Суммарное время SQL запросов', ('route',))
+OUTBOUND_SECONDS = Histogram(
+    'api_outbound_duration_seconds', 'Время запросов к провайдерам',
+    ('provider',), buckets=LATENCY_BUCKETS)
+OUTBOUND_ERRORS = Counter(
+    'api_outbound_errors', 'Ошибки запросов к провайдерам', ('provider',))
+CACHE_REQUESTS = Counter(
+    'api_cache_requests', 'Обращения к кэшам', ('cache', 'result'))
+
+
+def route_label(request) -> str:
+    """Шаблон маршрута запроса, чтобы id не плодили серии."""
+    match = getattr(request, 'resolver_match', None)
+    return match.route if match else 'unresolved'
+
+
+class RequestSQL:
+    """execute_wrapper: число и время SQL запросов одного запроса."""
+
+    def __init__(self) -> None:
+        """Инициализатор класса."""
+        self.count = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        """Замер запроса."""
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.seconds += time.perf_counter() - started
+            self.count += 1
+
+
+def observe_request(request, response, seconds: float,
+                    sql: RequestSQL) -> None:
+    """Запись метрик обработанного запроса."""
+    route = route_label(request)
+    REQUEST_SECONDS.labels(route, request.method).observe(seconds)
+    REQUESTS.labels(route, request.method, response.status_code).inc()
+    REQUEST_QUERIES.labels(route).observe(sql.count)
+    REQUEST_DB_SECONDS.labels(route).inc(sql.seconds)
+
+
+class MetricsListener:
+    """Подписчик instrumentation: внешние вызовы и кэши."""
+
+    def phase(self, name: str, seconds: float, error: bool) -> None:
+        """Время и ошибки запросов к провайдерам."""
+        if name not in PROVIDERS:
+            return
+        OUTBOUND_SECONDS.labels(name).observe(seconds)
+        if error:
+            OUTBOUND_ERRORS.labels(name).inc()
+
+    def cache(self, name: str, hit: bool) -> None:
+        """Попадания и промахи кэшей."""
+        CACHE_REQUESTS.labels(name, 'hit' if hit else 'miss').inc()
+
+
+listener = MetricsListener()
+
+
+def install() -> None:
+    """Подписка метрик на фазы и кэши."""
+    add_listener(listener)
+
+
+class QueueCollector:
+    """Глубина очередей, считается из базы при сборе метрик."""
+
+    def collect(self):
+        """Задачи загрузки по статусам и ожидающие пересчета подсказки."""
+        jobs = GaugeMetricFamily('api_import_jobs', 'Задачи загрузки',
+                                 labels=('status',))
+        counts = dict(ImportJob.objects.order_by().values_list('status')
+                      .annotate(total=Count('pk')))
+        for status, _ in ImportJob.STATUSES:
+            jobs.add_metric((status,), counts.get(status, 0))
+        yield jobs
+        stale = PeopleSuggestion.objects.filter(
+            changed_at__gt=F('computed_at')).count()
+        yield GaugeMetricFamily('api_people_suggestions_stale',
+                                'Подсказки людей, ждущие пересчета', stale)
+
+
+def registry() -> CollectorRegistry:
+    """Реестр для сбора: файлы всех процессов или память процесса."""
+    collected = CollectorRegistry()
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        multiprocess.MultiProcessCollector(collected)
+    else:
+        collected.register(RegistryProxy(REGISTRY))
+    collected.register(QueueCollector())
+    return collected
+
+
+class RegistryProxy:
+    """Метрики процесса из основного реестра внутри другого реестра."""
+
+    def __init__(self, source: CollectorRegistry) -> None:
+        """Инициализатор класса."""
+        self.source = source
+
+    def collect(self):
+        """Метрики основного реестра."""
+        return self.source.collect()
+
+
+def render_metrics():
+    """Текст метрик и его Content-Type."""
+    return generate_latest(registry()), CONTENT_TYPE_LATEST
+
+
+def token_allowed(request) -> bool:
+    """Проверка токена METRICS_TOKEN, без DEBUG токен обязателен."""
+    if not settings.METRICS_TOKEN:
+        return settings.DEBUG
+    return hmac.compare_digest(
+        request.META.get('HTTP_AUTHORIZATION', '').encode(),
+        f'Bearer {settings.METRICS_TOKEN}'.encode())
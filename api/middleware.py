@@ -0,0 +1,387 @@
+"""Промежуточные обработчики запросов."""
+import asyncio
+import cProfile
+import json
+import logging
+import os
+import random
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+import brotli
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.utils.cache import patch_vary_headers
+from django.utils.deprecation import MiddlewareMixin
+from django.utils.regex_helper import _lazy_re_compile
+from django.utils.text import compress_string
+
+from api import db_router, metrics, tracing
+from api.instrumentation import (RequestProfile, current_profile,
+                                 install_hooks, phase, request_sql,
+                                 sql_phase)
+from api.querylog import QueryLog
+
+logger = logging.getLogger('api.profiling')
+sql_logger = logging.getLogger('api.sql')
+
+re_accepts_encoding = _lazy_re_compile(r'([a-z*]+)\s*(?:;\s*q=([0-9.]+))?')
+
+
+def accepted_encodings(header: str) -> dict[str, float]:
+    """Разбор Accept-Encoding в словарь кодировка - вес."""
+    encodings = {}
+    for item in header.lower().split(','):
+        match = re_accepts_encoding.match(item.strip())
+        if not match:
+            continue
+        try:
+            quality = float(match.group(2) or 1)
+        except ValueError:
+            continue
+        encodings[match.group(1)] = quality
+    return encodings
+
+
+def choose_encoding(header: str):
+    """Выбор поддерживаемой кодировки, br предпочтительнее gzip."""
+    encodings = accepted_encodings(header)
+    candidates = [(encodings.get(name, encodings.get('*', 0)), name)
+                  for name in ('br', 'gzip')]
+    quality, name = max(candidates, key=lambda item: item[0])
+    return name if quality > 0 else None
+
+
+class CompressionMiddleware(MiddlewareMixin):
+    """Сжатие ответов api в brotli или gzip по Accept-Encoding клиента."""
+
+    def process_response(self, request, response):
+        """Сжатие тела ответа больше порога."""
+        if not request.path.startswith(settings.COMPRESSION_PATH_PREFIX):
+            return response
+        if response.streaming or response.has_header('Content-Encoding'):
+            return response
+        patch_vary_headers(response, ('Accept-Encoding',))
+        if len(response.content) < settings.COMPRESSION_MIN_SIZE:
+            return response
+
+        encoding = choose_encoding(request.META.get('HTTP_ACCEPT_ENCODING',
+                                                    ''))
+        if encoding not in ('br', 'gzip'):
+            return response
+        with phase('compress'):
+            if encoding == 'br':
+                content = brotli.compress(response.content,
+                                          quality=settings.BROTLI_QUALITY)
+            else:
+                content = compress_string(response.content)
+        if len(content) >= len(response.content):
+            return response
+
+        response.content = content
+        response['Content-Length'] = str(len(content))
+        response['Content-Encoding'] = encoding
+        # тело ответа изменилось, строгий ETag становится слабым
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response['ETag'] = f'W/{etag}'
+        return response
+
+
+def view_name(request) -> str:
+    """Имя view запроса для логов и каталогов дампов."""
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unresolved'
+    view_class = getattr(match.func, 'view_class', None)
+    return (view_class or match.func).__name__
+
+
+class Exchange:
+    """Запрос и ответ следующего обработчика для OptionalMiddleware."""
+
+    def __init__(self, request) -> None:
+        """Инициализатор класса."""
+        self.request = request
+        self.response = None
+
+
+class OptionalMiddleware(MiddlewareMixin):
+    """Middleware, который подключается настройкой.
+
+    Обработка задается контекстным менеджером handle вокруг вызова
+    следующего обработчика, ответ он получает в exchange.response. Под
+    ASGI ответ ожидается в цикле событий и поток Django не занимается.
+    """
+
+    def __call__(self, request):
+        """Ответ через handle, в асинхронной цепочке - корутина."""
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        exchange = Exchange(request)
+        with self.handle(exchange):
+            exchange.response = self.get_response(request)
+        return exchange.response
+
+    async def __acall__(self, request):
+        """Ответ через handle в асинхронной цепочке."""
+        exchange = Exchange(request)
+        with self.handle(exchange):
+            exchange.response = await self.get_response(request)
+        return exchange.response
+
+    def handle(self, exchange):
+        """Контекстный менеджер обработки запроса."""
+        raise NotImplementedError
+
+
+class ProfilingMiddleware(OptionalMiddleware):
+    """Профилирование запросов по фазам.
+
+    Включается PROFILING_ENABLED, иначе удаляется из цепочки при
+    загрузке и не стоит ничего. Время фаз отдается в Server-Timing и
+    пишется в лог api.profiling строкой JSON. Доля PROFILING_SAMPLE_RATE
+    запросов, а при PROFILING_ALLOW_HEADER и запросы с заголовком
+    X-Profile: cprofile или tracemalloc, профилируются целиком, дамп
+    пишется в PROFILING_DIR/<view>/.
+    """
+
+    modes = ('cprofile', 'tracemalloc')
+
+    def __init__(self, get_response):
+        """Инициализатор, без PROFILING_ENABLED обработчик не подключается."""
+        if not settings.PROFILING_ENABLED:
+            raise MiddlewareNotUsed
+        super().__init__(get_response)
+        # cProfile и tracemalloc пишет один запрос за раз: под ASGI запросы
+        # делят поток цикла событий, а tracemalloc общий на процесс
+        self.locks = {mode: threading.Lock() for mode in self.modes}
+        install_hooks()
+
+    @contextmanager
+    def handle(self, exchange):
+        """Замер фаз запроса и выборочный дамп профиля."""
+        request = exchange.request
+        profile = RequestProfile()
+        dumps = []
+        token = current_profile.set(profile)
+        try:
+            with sql_phase():
+                mode = self.sample_mode(request)
+                if mode == 'cprofile':
+                    with self.run_cprofile(dumps):
+                        yield
+                elif mode == 'tracemalloc':
+                    with self.run_tracemalloc(dumps):
+                        yield
+                else:
+                    yield
+        finally:
+            current_profile.reset(token)
+        response = exchange.response
+        name = view_name(request)
+        for dump in dumps:
+            dump(self.dump_path(name, mode))
+        response['Server-Timing'] = profile.server_timing()
+        if logger.isEnabledFor(logging.INFO):
+            logger.info(json.dumps({
+                'view': name, 'method': request.method,
+                'path': request.path, 'status': response.status_code,
+                'ms': round(profile.elapsed() * 1000, 3),
+                'phases': profile.as_dict(), 'sampled': mode,
+                **tracing.log_context(),
+            }, ensure_ascii=False))
+
+    def sample_mode(self, request):
+        """Режим полного профилирования запроса или None."""
+        if settings.PROFILING_ALLOW_HEADER:
+            mode = request.META.get('HTTP_X_PROFILE', '').lower()
+            if mode in self.modes:
+                return mode
+        if random.random() < settings.PROFILING_SAMPLE_RATE:
+            return settings.PROFILING_MODE
+        return None
+
+    @contextmanager
+    def run_cprofile(self, dumps):
+        """Ответ под cProfile, функция записи статистики добавляется в dumps.
+
+        Под ASGI профиль видит поток цикла событий: middleware и
+        асинхронные view, но не синхронный код в потоке Django.
+        """
+        lock = self.locks['cprofile']
+        if not lock.acquire(blocking=False):
+            yield
+            return
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            lock.release()
+        dumps.append(profiler.dump_stats)
+
+    @contextmanager
+    def run_tracemalloc(self, dumps):
+        """Ответ под tracemalloc, запись разницы снимков в dumps."""
+        lock = self.locks['tracemalloc']
+        if not lock.acquire(blocking=False):
+            yield
+            return
+        started = not tracemalloc.is_tracing()
+        try:
+            if started:
+                tracemalloc.start(settings.PROFILING_TRACEMALLOC_FRAMES)
+            before = tracemalloc.take_snapshot()
+            yield
+            after = tracemalloc.take_snapshot()
+        finally:
+            if started:
+                tracemalloc.stop()
+            lock.release()
+
+        def dump(path):
+            stats = after.compare_to(before, 'traceback')
+            with open(path, 'w', encoding='utf-8') as file:
+                for stat in stats[:settings.PROFILING_TRACEMALLOC_TOP]:
+                    file.write(f'{stat}\n')
+                    file.writelines(f'    {line}\n'
+                                    for line in stat.traceback.format())
+        dumps.append(dump)
+
+    @staticmethod
+    def dump_path(name: str, mode: str) -> str:
+        """Путь файла дампа в каталоге view."""
+        directory = os.path.join(settings.PROFILING_DIR, name)
+        os.makedirs(directory, exist_ok=True)
+        suffix = 'prof' if mode == 'cprofile' else 'txt'
+        return os.path.join(directory, f'{time.time_ns()}-{os.getpid()}-'
+                                       f'{threading.get_ident()}.{suffix}')
+
+
+class MetricsMiddleware(OptionalMiddleware):
+    """Метрики Prometheus по маршрутам, подключается METRICS_ENABLED."""
+
+    def __init__(self, get_response):
+        """Инициализатор, без METRICS_ENABLED обработчик не подключается."""
+        if not settings.METRICS_ENABLED:
+            raise MiddlewareNotUsed
+        super().__init__(get_response)
+        metrics.install()
+
+    @contextmanager
+    def handle(self, exchange):
+        """Время, статус и SQL запроса."""
+        sql = metrics.RequestSQL()
+        started = time.perf_counter()
+        with request_sql(sql):
+            yield
+        metrics.observe_request(exchange.request, exchange.response,
+                                time.perf_counter() - started, sql)
+
+
+class QueryLogMiddleware(OptionalMiddleware):
+    """Медленные SQL запросы и N+1, подключается SLOW_QUERY_LOG_ENABLED.
+
+    В лог api.sql строкой JSON пишутся запросы дольше SLOW_QUERY_MS и
+    формы запросов, повторенные за запрос не меньше NPLUSONE_THRESHOLD
+    раз, с view, полем сериализатора, связью модели и стеком проекта.
+    """
+
+    def __init__(self, get_response):
+        """Инициализатор, без SLOW_QUERY_LOG_ENABLED не подключается."""
+        if not settings.SLOW_QUERY_LOG_ENABLED:
+            raise MiddlewareNotUsed
+        super().__init__(get_response)
+
+    @contextmanager
+    def handle(self, exchange):
+        """Сбор запросов и запись в лог после ответа."""
+        request = exchange.request
+        queries = QueryLog(settings.SLOW_QUERY_MS,
+                           settings.SLOW_QUERY_STACK_DEPTH)
+        with request_sql(queries):
+            yield
+        if not sql_logger.isEnabledFor(logging.WARNING):
+            return
+        request_info = {'view': view_name(request), 'method': request.method,
+                        'path': request.path, **tracing.log_context()}
+        for query in queries.slow:
+            sql_logger.warning(json.dumps(
+                {'kind': 'slow', **request_info, **query},
+                ensure_ascii=False))
+        for shape in queries.repeated(settings.NPLUSONE_THRESHOLD):
+            sql_logger.warning(json.dumps(
+                {'kind': 'repeated', **request_info, **shape},
+                ensure_ascii=False))
+
+
+class TracingMiddleware(OptionalMiddleware):
+    """Трассировка запросов, подключается TRACING_ENABLED.
+
+    Открывает корневой span запроса, вложенные span дают SQL запросы,
+    сериализаторы, smstraffic, Carrot quest и обработчики сигналов.
+    Идентификатор трассы отдается в заголовке X-Trace-Id и попадает в
+    логи api.profiling, api.sql и атрибут trace_id записей логов.
+    """
+
+    def __init__(self, get_response):
+        """Инициализатор, без TRACING_ENABLED обработчик не подключается."""
+        if not settings.TRACING_ENABLED:
+            raise MiddlewareNotUsed
+        super().__init__(get_response)
+        self.exporter = tracing.get_exporter(settings)
+        install_hooks()
+        tracing.install_log_context()
+
+    @contextmanager
+    def handle(self, exchange):
+        """Запрос в корневом span, имя span - метод и шаблон маршрута."""
+        request = exchange.request
+        with tracing.start_trace(request.method, self.exporter,
+                                 request.META.get('HTTP_TRACEPARENT')) as root:
+            with sql_phase():
+                yield
+            response = exchange.response
+            root.name = f'{request.method} {metrics.route_label(request)}'
+            root.attributes.update({
+                'http.method': request.method, 'http.target': request.path,
+                'http.status_code': response.status_code,
+                'view': view_name(request)})
+            if response.status_code >= 500:
+                root.status = 'error'
+        response['X-Trace-Id'] = root.trace.trace_id
+
+
+class ReplicaMiddleware(OptionalMiddleware):
+    """Разрешение чтений из реплик, подключается при DATABASE_REPLICAS."""
+
+    def __init__(self, get_response):
+        """Инициализатор, без реплик обработчик не подключается."""
+        if not settings.DATABASE_REPLICAS:
+            raise MiddlewareNotUsed
+        super().__init__(get_response)
+
+    async def __acall__(self, request):
+        """Метка закрепления читается из кэша вне цикла событий."""
+        state = await sync_to_async(db_router.request_state)(request)
+        with self.route(state):
+            return await self.get_response(request)
+
+    def handle(self, exchange):
+        """Маршрутизация чтений запроса через db_router.current_state."""
+        return self.route(db_router.request_state(exchange.request))
+
+    @staticmethod
+    @contextmanager
+    def route(state):
+        """Состояние маршрутизации на время запроса."""
+        token = db_router.current_state.set(state)
+        try:
+            yield
+        finally:
+            db_router.current_state.reset(token)
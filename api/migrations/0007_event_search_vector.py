@@ -0,0 +1,60 @@
+# Generated by Django 3.1 on 2026-10-19 08:24
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+CREATE_SEARCH_TRIGGER = """
+CREATE FUNCTION api_event_search_vector_update() RETURNS trigger AS $$
+BEGIN
+    NEW.search_vector :=
+        setweight(to_tsvector('russian', coalesce(NEW.title, '')), 'A') ||
+        setweight(to_tsvector('russian', coalesce(NEW.address, '')), 'B') ||
+        setweight(to_tsvector('russian', coalesce(NEW.description, '')), 'C');
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER api_event_search_vector_trigger
+    BEFORE INSERT OR UPDATE OF title, description, address, search_vector
+    ON api_event FOR EACH ROW
+    EXECUTE PROCEDURE api_event_search_vector_update();
+
+UPDATE api_event SET search_vector = NULL;
+
+CREATE INDEX api_event_search_vector_gin
+    ON api_event USING gin (search_vector);
+"""
+
+DROP_SEARCH_TRIGGER = """
+DROP INDEX IF EXISTS api_event_search_vector_gin;
+DROP TRIGGER IF EXISTS api_event_search_vector_trigger ON api_event;
+DROP FUNCTION IF EXISTS api_event_search_vector_update();
+"""
+
+
+def create_search_trigger(apps, schema_editor):
+    """Триггер и индекс поиска есть только в postgres."""
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(CREATE_SEARCH_TRIGGER)
+
+
+def drop_search_trigger(apps, schema_editor):
+    """Удаление триггера и индекса поиска."""
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(DROP_SEARCH_TRIGGER)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_auto_20210427_1729'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='event',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(create_search_trigger, drop_search_trigger),
+    ]
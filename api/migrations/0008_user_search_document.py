@@ -0,0 +1,64 @@
+# Generated by Django 3.1 on 2026-10-19 08:28
+
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations, models
+
+CREATE_SEARCH_INDEX = """
+CREATE INDEX api_user_search_document_trgm
+    ON api_user USING gin (search_document gin_trgm_ops);
+"""
+
+DROP_SEARCH_INDEX = 'DROP INDEX IF EXISTS api_user_search_document_trgm;'
+
+
+def fill_search_document(apps, schema_editor):
+    """Заполнение поискового текста существующих пользователей.
+
+    Копия api.search на момент миграции, код приложения может измениться.
+    """
+    User = apps.get_model('api', 'User')  # noqa: N806
+    users = User.objects.order_by('pk').prefetch_related('competences')
+    last_pk = 0
+    while True:
+        chunk = list(users.filter(pk__gt=last_pk)[:2000])
+        if not chunk:
+            return
+        for user in chunk:
+            parts = [user.first_name, user.last_name, user.profession,
+                     *(competence.name
+                       for competence in user.competences.all()),
+                     user.about]
+            user.search_document = (' '.join(part for part in parts if part)
+                                    .casefold().replace('ё', 'е'))
+        User.objects.bulk_update(chunk, ['search_document'])
+        last_pk = chunk[-1].pk
+
+
+def create_search_index(apps, schema_editor):
+    """Триграммный индекс есть только в postgres."""
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(CREATE_SEARCH_INDEX)
+
+
+def drop_search_index(apps, schema_editor):
+    """Удаление триграммного индекса."""
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(DROP_SEARCH_INDEX)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_event_search_vector'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.AddField(
+            model_name='user',
+            name='search_document',
+            field=models.TextField(blank=True, editable=False),
+        ),
+        migrations.RunPython(fill_search_document, migrations.RunPython.noop),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
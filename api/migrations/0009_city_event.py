@@ -0,0 +1,58 @@
+# Generated by Django 3.1 on 2026-10-19 08:32
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_city_events(apps, schema_editor):
+    """Заполнение индекса для существующих событий.
+
+    Копия api.city_feed на момент миграции, код приложения может
+    измениться.
+    """
+    Event = apps.get_model('api', 'Event')  # noqa: N806
+    CityEvent = apps.get_model('api', 'CityEvent')  # noqa: N806
+    event_ids = list(Event.objects.values_list('pk', flat=True))
+    for start in range(0, len(event_ids), 1000):
+        rows = (Event.tags.through.objects
+                .filter(event_id__in=event_ids[start:start + 1000],
+                        tags__city__isnull=False)
+                .values_list('tags__city_id', 'event_id',
+                             'event__start_date')
+                .distinct())
+        CityEvent.objects.bulk_create(
+            CityEvent(city_id=city_id, event_id=event_id,
+                      start_date=start_date)
+            for city_id, event_id, start_date in rows)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_user_search_document'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CityEvent',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('start_date', models.DateTimeField(verbose_name='Дата начала события')),
+                ('city', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='api.city', verbose_name='Город')),
+                ('event', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='api.event', verbose_name='Событие')),
+            ],
+            options={
+                'verbose_name': 'Событие города',
+                'verbose_name_plural': 'События городов',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='cityevent',
+            index=models.Index(fields=['city', 'start_date'], name='api_cityeve_city_id_e2085d_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='cityevent',
+            constraint=models.UniqueConstraint(fields=('city', 'event'), name='unique_city_event'),
+        ),
+        migrations.RunPython(fill_city_events, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 3.1 on 2026-10-19 08:34
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_city_event'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EventRecommendation',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('events', models.JSONField(default=list, verbose_name='События')),
+                ('computed_at', models.DateTimeField(auto_now=True, verbose_name='Дата расчета')),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='event_recommendation', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Рекомендации событий',
+                'verbose_name_plural': 'Рекомендации событий',
+            },
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 3.1 on 2026-10-19 08:38
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_event_recommendation'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PeopleSuggestion',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('users', models.JSONField(default=list, verbose_name='Пользователи')),
+                ('computed_at', models.DateTimeField(verbose_name='Дата расчета')),
+                ('changed_at', models.DateTimeField(blank=True, null=True, verbose_name='Дата изменения участий')),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='people_suggestion', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Возможные знакомые',
+                'verbose_name_plural': 'Возможные знакомые',
+            },
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 3.1 on 2026-10-19 08:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0011_people_suggestion'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImportJob',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('users', 'Пользователи'), ('events', 'События'), ('cities', 'Города'), ('competences', 'Компетенции')], max_length=20, verbose_name='Данные')),
+                ('file', models.FileField(upload_to='imports/', verbose_name='Файл')),
+                ('status', models.CharField(choices=[('pending', 'В очереди'), ('running', 'Выполняется'), ('done', 'Завершена'), ('failed', 'Ошибка')], default='pending', max_length=20, verbose_name='Статус')),
+                ('total_rows', models.PositiveIntegerField(blank=True, null=True, verbose_name='Строк в файле')),
+                ('processed_rows', models.PositiveIntegerField(default=0, verbose_name='Обработано строк')),
+                ('processed_seconds', models.FloatField(default=0, verbose_name='Время обработки, с')),
+                ('error_count', models.PositiveIntegerField(default=0, verbose_name='Строк с ошибкой')),
+                ('errors', models.JSONField(blank=True, default=list, verbose_name='Ошибки строк')),
+                ('error', models.TextField(blank=True, verbose_name='Ошибка загрузки')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Создана')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Обновлена')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='Завершена')),
+            ],
+            options={
+                'verbose_name': 'Загрузка файла',
+                'verbose_name_plural': 'Загрузки файлов',
+                'ordering': ('-pk',),
+            },
+        ),
+    ]
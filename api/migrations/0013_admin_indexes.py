@@ -0,0 +1,32 @@
+# Generated by Django 3.1 on 2026-10-19 08:47
+
+import datetime
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0012_import_job'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='event',
+            name='start_date',
+            field=models.DateTimeField(db_index=True, verbose_name='Дата начала события'),
+        ),
+        migrations.AlterField(
+            model_name='user',
+            name='date_of_registration',
+            field=models.DateField(db_index=True, default=datetime.date.today, verbose_name='Дата регистрации'),
+        ),
+        migrations.AddIndex(
+            model_name='smsauth',
+            index=models.Index(fields=['phone', 'send_at'], name='api_smsauth_phone_21ba51_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='smsauth',
+            index=models.Index(fields=['send_at'], name='api_smsauth_send_at_0a190c_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.1 on 2026-10-19 10:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0014_crm_sync'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='importjob',
+            name='owner',
+            field=models.CharField(blank=True, editable=False, max_length=32, verbose_name='Воркер'),
+        ),
+    ]
@@ -1,6 +1,7 @@
 """Модели приложения."""
 from datetime import date
 
+from django.contrib.postgres.search import SearchVectorField
 from django.core.validators import FileExtensionValidator
 from django.db import models
 from django.contrib.auth.models import AbstractUser
@@ -30,7 +31,11 @@ class User(AbstractUser):
     subscription_expiration_date = models.DateTimeField(
         null=True, verbose_name='Дата окончания подписки')
     date_of_registration = models.DateField(verbose_name='Дата регистрации',
-                                            default=date.today)
+                                            default=date.today,
+                                            db_index=True)
+    # нормализованные имя, профессия, компетенции и о себе для поиска,
+    # обновляется сигналами, триграммный индекс создается в миграции
+    search_document = models.TextField(editable=False, blank=True)
 
     USERNAME_FIELD = 'phone'
 
@@ -78,11 +83,13 @@ class Event(models.Model):
     title = models.CharField(verbose_name='Заголовок', max_length=250)
     description = models.TextField(verbose_name='Описание', blank=True)
     start_date = models.DateTimeField(verbose_name='Дата начала '
-                                                   'события')
+                                                   'события', db_index=True)
     end_date = models.DateTimeField(verbose_name='Дата окончания события',
                                     blank=True, null=True)
     address = models.CharField(verbose_name='Адрес', max_length=600)
     tags = models.ManyToManyField('Tags', verbose_name='Теги', blank=True)
+    # заполняется триггером в postgres, GIN индекс создается в миграции
+    search_vector = SearchVectorField(null=True, editable=False)
 
     def __str__(self):
         """Строкове представление модели."""
@@ -143,6 +150,8 @@ class SMSAuth(models.Model):
 
         verbose_name = 'Смс для авторизации'
         verbose_name_plural = 'Смс для авторизаций'
+        indexes = [models.Index(fields=('phone', 'send_at')),
+                   models.Index(fields=('send_at',))]
 
     def __str__(self):
         """Строковое представление для пользователя."""
@@ -184,4 +193,146 @@ class Favorite(models.Model):
         verbose_name_plural = 'Избранное'
 
 
+class CityEvent(models.Model):
+    """Индекс событий по городам их тегов, обновляется сигналами."""
+
+    city = models.ForeignKey(City, verbose_name='Город',
+                             on_delete=models.CASCADE)
+    event = models.ForeignKey(Event, verbose_name='Событие',
+                              on_delete=models.CASCADE)
+    start_date = models.DateTimeField(verbose_name='Дата начала события')
+
+    class Meta:
+        """Настройки модели."""
+
+        verbose_name = 'Событие города'
+        verbose_name_plural = 'События городов'
+        constraints = [models.UniqueConstraint(fields=('city', 'event'),
+                                               name='unique_city_event')]
+        indexes = [models.Index(fields=('city', 'start_date'))]
+
+
+class EventRecommendation(models.Model):
+    """Рекомендованные события пользователя, рассчитываются пакетно."""
+
+    user = models.OneToOneField(User, verbose_name='Пользователь',
+                                on_delete=models.CASCADE,
+                                related_name='event_recommendation')
+    events = models.JSONField(verbose_name='События', default=list)
+    computed_at = models.DateTimeField(verbose_name='Дата расчета',
+                                       auto_now=True)
+
+    class Meta:
+        """Настройки модели."""
+
+        verbose_name = 'Рекомендации событий'
+        verbose_name_plural = 'Рекомендации событий'
+
+
+class PeopleSuggestion(models.Model):
+    """Возможные знакомые пользователя, рассчитываются пакетно."""
+
+    user = models.OneToOneField(User, verbose_name='Пользователь',
+                                on_delete=models.CASCADE,
+                                related_name='people_suggestion')
+    users = models.JSONField(verbose_name='Пользователи', default=list)
+    computed_at = models.DateTimeField(verbose_name='Дата расчета')
+    changed_at = models.DateTimeField(verbose_name='Дата изменения участий',
+                                      blank=True, null=True)
+
+    class Meta:
+        """Настройки модели."""
+
+        verbose_name = 'Возможные знакомые'
+        verbose_name_plural = 'Возможные знакомые'
+
+
+class ImportJob(models.Model):
+    """Фоновая загрузка файла из админки."""
+
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUSES = ((PENDING, 'В очереди'), (RUNNING, 'Выполняется'),
+                (DONE, 'Завершена'), (FAILED, 'Ошибка'))
+    KINDS = (('users', 'Пользователи'), ('events', 'События'),
+             ('cities', 'Города'), ('competences', 'Компетенции'))
+
+    kind = models.CharField(verbose_name='Данные', max_length=20,
+                            choices=KINDS)
+    file = models.FileField(verbose_name='Файл', upload_to='imports/')
+    status = models.CharField(verbose_name='Статус', max_length=20,
+                              choices=STATUSES, default=PENDING)
+    total_rows = models.PositiveIntegerField(verbose_name='Строк в файле',
+                                             blank=True, null=True)
+    # строки данных, закоммиченные вместе с этим счетчиком,
+    # после падения загрузка продолжается со следующей строки
+    processed_rows = models.PositiveIntegerField(
+        verbose_name='Обработано строк', default=0)
+    processed_seconds = models.FloatField(verbose_name='Время обработки, с',
+                                          default=0)
+    error_count = models.PositiveIntegerField(verbose_name='Строк с ошибкой',
+                                              default=0)
+    errors = models.JSONField(verbose_name='Ошибки строк', default=list,
+                              blank=True)
+    error = models.TextField(verbose_name='Ошибка загрузки', blank=True)
+    created_at = models.DateTimeField(verbose_name='Создана',
+                                      auto_now_add=True)
+    # воркер, взявший задачу; пачка сохраняется только им, после
+    # перехвата зависшей задачи прежний воркер останавливается
+    owner = models.CharField(verbose_name='Воркер', max_length=32,
+                             blank=True, editable=False)
+    # обновляется после каждой пачки и во время чтения файла,
+    # по нему находятся упавшие загрузки
+    updated_at = models.DateTimeField(verbose_name='Обновлена',
+                                      auto_now=True)
+    finished_at = models.DateTimeField(verbose_name='Завершена',
+                                       blank=True, null=True)
+
+    class Meta:
+        """Настройки модели."""
+
+        verbose_name = 'Загрузка файла'
+        verbose_name_plural = 'Загрузки файлов'
+        ordering = ('-pk',)
+
+    def __str__(self):
+        """Строковое представление модели."""
+        return f'{self.get_kind_display()} {self.created_at:%d.%m.%Y %H:%M}'
+
+    @property
+    def rows_per_second(self) -> float:
+        """Скорость обработки строк."""
+        if not self.processed_seconds:
+            return 0.0
+        return self.processed_rows / self.processed_seconds
+
+
+class CrmSync(models.Model):
+    """Пользователь в очереди отправки данных в Carrot quest."""
+
+    user = models.ForeignKey(User, verbose_name='Пользователь',
+                             on_delete=models.CASCADE, related_name='+')
+    created_at = models.DateTimeField(verbose_name='Поставлен в очередь',
+                                      auto_now_add=True)
+    attempts = models.PositiveIntegerField(verbose_name='Попыток',
+                                           default=0)
+    error = models.TextField(verbose_name='Ошибка отправки', blank=True)
+    # до этого времени строку отправляет воркер или она ждет повтора
+    locked_until = models.DateTimeField(verbose_name='Занята до',
+                                        blank=True, null=True)
+
+    class Meta:
+        """Настройки модели."""
+
+        verbose_name = 'Отправка в CRM'
+        verbose_name_plural = 'Очередь отправки в CRM'
+        ordering = ('pk',)
+
+    def __str__(self):
+        """Строковое представление модели."""
+        return f'{self.user_id} {self.created_at:%d.%m.%Y %H:%M}'
+
+
 from api.signals import *  # noqa: F401, E402, F403
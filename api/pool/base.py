@@ -0,0 +1,188 @@
+"""Бэкенд PostgreSQL с ограниченным пулом соединений на процесс.
+
+Обертка соединения Django живет в своем потоке, как и раньше, но при
+подключении берет готовое соединение из общего пула процесса, а при
+закрытии возвращает его в пул. Поэтому закрытие после каждого запроса
+(CONN_MAX_AGE = 0) и новые потоки sync_to_async под ASGI не открывают
+новое соединение с базой. Открытых соединений не больше DB_POOL_SIZE,
+остальные потоки ждут свободное DB_POOL_TIMEOUT секунд. Соединение,
+простоявшее дольше DB_POOL_CHECK_AFTER секунд, перед выдачей проверяется
+запросом SELECT 1, дольше DB_POOL_MAX_IDLE секунд - закрывается.
+"""
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.db.backends.postgresql import base
+from django.utils.asyncio import async_unsafe
+from psycopg2 import OperationalError, extensions
+
+Database = base.Database
+
+# пулы процесса по алиасу и параметрам подключения
+pools = {}
+pools_lock = threading.Lock()
+
+
+class ConnectionPool:
+    """Ограниченный потокобезопасный пул соединений psycopg2."""
+
+    def __init__(self, connect, size: int, timeout: float, max_idle: float,
+                 check_after: float) -> None:
+        """Инициализатор класса, connect открывает новое соединение."""
+        self.connect = connect
+        self.size = size
+        self.timeout = timeout
+        self.max_idle = max_idle
+        self.check_after = check_after
+        # свободные соединения и время возврата, последнее выдается первым
+        self.idle = []
+        # открытые соединения: свободные, выданные и открываемые
+        self.opened = 0
+        self.condition = threading.Condition()
+        self.stats = Counter()
+
+    def acquire(self):
+        """Свободное рабочее соединение или новое, если пул не заполнен."""
+        deadline = time.monotonic() + self.timeout
+        while True:
+            connection, idle_for = self.take(deadline)
+            if connection is None:
+                try:
+                    connection = self.connect()
+                except BaseException:
+                    self.forget()
+                    raise
+                self.count('opened')
+                return connection
+            if idle_for < self.check_after or self.healthy(connection):
+                self.count('reused')
+                return connection
+            self.discard(connection)
+
+    def take(self, deadline: float):
+        """Свободное соединение и его простой или (None, None) - место."""
+        with self.condition:
+            while True:
+                now = time.monotonic()
+                while self.idle:
+                    connection, returned = self.idle.pop()
+                    if not connection.closed and (now - returned
+                                                  <= self.max_idle):
+                        return connection, now - returned
+                    self.close(connection)
+                if self.opened < self.size:
+                    self.opened += 1
+                    return None, None
+                remaining = deadline - now
+                if remaining <= 0:
+                    self.stats['timeouts'] += 1
+                    raise OperationalError(
+                        f'Нет свободного соединения в пуле из {self.size} '
+                        f'за {self.timeout} с')
+                self.stats['waits'] += 1
+                self.condition.wait(remaining)
+
+    def release(self, connection) -> None:
+        """Возврат соединения, открытая транзакция откатывается."""
+        status = (extensions.TRANSACTION_STATUS_UNKNOWN if connection.closed
+                  else connection.info.transaction_status)
+        if status in (extensions.TRANSACTION_STATUS_INTRANS,
+                      extensions.TRANSACTION_STATUS_INERROR):
+            try:
+                connection.rollback()
+                status = connection.info.transaction_status
+            except Database.Error:
+                status = extensions.TRANSACTION_STATUS_UNKNOWN
+        if status != extensions.TRANSACTION_STATUS_IDLE:
+            self.discard(connection)
+            return
+        with self.condition:
+            self.idle.append((connection, time.monotonic()))
+            self.condition.notify()
+
+    @staticmethod
+    def healthy(connection) -> bool:
+        """Проверка соединения запросом SELECT 1."""
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT 1')
+            if (connection.info.transaction_status
+                    != extensions.TRANSACTION_STATUS_IDLE):
+                connection.rollback()
+        except Database.Error:
+            return False
+        return True
+
+    def discard(self, connection) -> None:
+        """Закрытие неисправного соединения, место освобождается."""
+        with self.condition:
+            self.stats['discarded'] += 1
+            self.close(connection)
+
+    def count(self, name: str) -> None:
+        """Учет события в статистике пула."""
+        with self.condition:
+            self.stats[name] += 1
+
+    def close(self, connection) -> None:
+        """Закрытие соединения под блокировкой пула."""
+        try:
+            connection.close()
+        except Database.Error:
+            pass
+        self.forget()
+
+    def forget(self) -> None:
+        """Освобождение места в пуле, ожидающий поток просыпается."""
+        with self.condition:
+            self.opened -= 1
+            self.condition.notify()
+
+    def close_idle(self) -> None:
+        """Закрытие всех свободных соединений."""
+        with self.condition:
+            while self.idle:
+                self.close(self.idle.pop()[0])
+
+
+def get_pool(key, connect) -> ConnectionPool:
+    """Пул процесса для ключа, создается при первом обращении."""
+    with pools_lock:
+        if key not in pools:
+            pools[key] = ConnectionPool(
+                connect, settings.DB_POOL_SIZE, settings.DB_POOL_TIMEOUT,
+                settings.DB_POOL_MAX_IDLE, settings.DB_POOL_CHECK_AFTER)
+        return pools[key]
+
+
+def close_pools() -> None:
+    """Закрытие свободных соединений всех пулов, например перед fork."""
+    with pools_lock:
+        for pool in pools.values():
+            pool.close_idle()
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """Обертка соединения, которая берет соединение из пула процесса."""
+
+    @async_unsafe
+    def get_new_connection(self, conn_params):
+        """Соединение из пула, новое открывается обычным способом."""
+        key = (self.alias, tuple(sorted(conn_params.items())))
+        pool = get_pool(key, lambda: Database.connect(**conn_params))
+        connection = pool.acquire()
+        options = self.settings_dict['OPTIONS']
+        self.isolation_level = options.get('isolation_level',
+                                           connection.isolation_level)
+        if self.isolation_level != connection.isolation_level:
+            connection.set_session(isolation_level=self.isolation_level)
+        self.pool = pool
+        return connection
+
+    def _close(self):
+        """Возврат соединения в пул вместо закрытия."""
+        if self.connection is not None:
+            with self.wrap_database_errors:
+                self.pool.release(self.connection)
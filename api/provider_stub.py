@@ -0,0 +1,254 @@
+"""Локальная замена smstraffic и Carrot quest для нагрузочных тестов."""
+import math
+import random
+import re
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+SMS_PATH = '/multi.php'
+CARROT_PREFIX = '/v1'
+CARROT_PATH = re.compile(
+    r'^/v1/users/(?P<user_id>[^/]+)/(?P<uri>props|events)$')
+CODE = re.compile(r'(\d{4,6})')
+
+SMS_REPLY = ('<?xml version="1.0"?><reply><result>{result}</result>'
+             '<code>{code}</code><description>{description}</description>'
+             '</reply>')
+CARROT_REPLY = '{"meta": {"status": 200}, "data": {}}'
+
+
+class Profile:
+    """Поведение провайдера: распределение задержки, ошибки и зависания.
+
+    Задается строкой вида ``lognormal:200:0.5,errors=0.01,timeouts=0.001``.
+    Задержка: ``none``, ``fixed:MS``, ``uniform:MIN_MS:MAX_MS`` или
+    ``lognormal:MEDIAN_MS:SIGMA``. Зависший ответ отдается через hang
+    секунд, то есть после таймаута клиента.
+    """
+
+    # число параметров каждого распределения
+    DISTRIBUTIONS = {'none': 0, 'fixed': 1, 'uniform': 2, 'lognormal': 2}
+
+    def __init__(self, distribution: str = 'none', params=(),
+                 error_rate: float = 0.0, timeout_rate: float = 0.0,
+                 hang: float = 60.0) -> None:
+        """Инициализатор класса, params - параметры распределения в мс."""
+        if distribution not in self.DISTRIBUTIONS:
+            raise ValueError(f'Неизвестное распределение {distribution}')
+        self.distribution = distribution
+        self.params = tuple(float(param) for param in params)
+        if len(self.params) != self.DISTRIBUTIONS[distribution]:
+            raise ValueError(
+                f'Распределение {distribution} принимает '
+                f'{self.DISTRIBUTIONS[distribution]} параметров, '
+                f'передано {len(self.params)}')
+        if any(param < 0 for param in self.params) or (
+                distribution == 'lognormal' and self.params[0] <= 0):
+            raise ValueError(f'Недопустимые параметры {distribution}')
+        self.error_rate = error_rate
+        self.timeout_rate = timeout_rate
+        self.hang = hang
+
+    @classmethod
+    def parse(cls, spec: str) -> 'Profile':
+        """Профиль из строки."""
+        distribution, params, options = 'none', (), {}
+        for part in filter(None, (spec or '').split(',')):
+            if '=' in part:
+                name, value = part.split('=', 1)
+                options[name.strip()] = float(value)
+            else:
+                distribution, *params = part.strip().split(':')
+        unknown = set(options) - {'errors', 'timeouts', 'hang'}
+        if unknown:
+            raise ValueError(f'Неизвестные параметры {", ".join(unknown)}')
+        return cls(distribution, params, options.get('errors', 0.0),
+                   options.get('timeouts', 0.0), options.get('hang', 60.0))
+
+    def latency(self, rng: random.Random) -> float:
+        """Задержка ответа в секундах."""
+        if self.distribution == 'fixed':
+            return self.params[0] / 1000
+        if self.distribution == 'uniform':
+            return rng.uniform(*self.params) / 1000
+        if self.distribution == 'lognormal':
+            median, sigma = self.params
+            return rng.lognormvariate(math.log(median / 1000), sigma)
+        return 0.0
+
+    def outcome(self, rng: random.Random):
+        """Исход запроса ok, error или timeout и задержка в секундах."""
+        chance = rng.random()
+        if chance < self.timeout_rate:
+            return 'timeout', self.hang
+        if chance < self.timeout_rate + self.error_rate:
+            return 'error', self.latency(rng)
+        return 'ok', self.latency(rng)
+
+
+class StubServer(ThreadingHTTPServer):
+    """HTTP сервер с длинной очередью соединений для сотен клиентов."""
+
+    daemon_threads = True
+    request_queue_size = 1024
+
+
+class ProviderStub:
+    """HTTP сервер в фоновом потоке, запоминает отправленные смс и события.
+
+    Отвечает как smstraffic на SMS_PATH и как Carrot quest на
+    /v1/users/<id>/props и /v1/users/<id>/events, с задержками и
+    ошибками по профилям sms и carrot.
+    """
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0,
+                 sms: Profile = None, carrot: Profile = None,
+                 seed: int = None) -> None:
+        """Инициализатор класса, port 0 - свободный порт."""
+        self.profiles = {'sms': sms or Profile(),
+                         'carrot': carrot or Profile()}
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.messages = {}
+        self.sms_counts = Counter()
+        self.outcomes = Counter()
+        # запросы в обработке и их максимум по провайдерам
+        self.active = Counter()
+        self.peak = Counter()
+        self.server = StubServer((host, port), self.handler_class())
+        self.url = f'http://{host}:{self.server.server_port}'
+        self.thread = None
+
+    @property
+    def sms_url(self) -> str:
+        """Адрес для SMS_TRAFFIC_API."""
+        return self.url + SMS_PATH
+
+    @property
+    def carrot_url(self) -> str:
+        """Адрес для CARROT_API."""
+        return self.url + CARROT_PREFIX
+
+    def settings(self) -> dict:
+        """Настройки проекта для работы через заглушку."""
+        return {'SMS_TRAFFIC_API': self.sms_url,
+                'CARROT_API': self.carrot_url,
+                'AUTH_TOKEN_CQ': 'stub'}
+
+    def start(self) -> 'ProviderStub':
+        """Запуск сервера."""
+        self.thread = threading.Thread(target=self.server.serve_forever,
+                                       daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self) -> None:
+        """Остановка сервера."""
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        """Запуск в блоке with."""
+        return self.start()
+
+    def __exit__(self, *args):
+        """Остановка при выходе из блока."""
+        self.stop()
+
+    def code(self, phone: str):
+        """Код из последней доставленной смс на номер."""
+        with self.lock:
+            message = self.messages.get(phone)
+        match = CODE.search(message or '')
+        return match.group(1) if match else None
+
+    def sent(self, phone: str) -> int:
+        """Число доставленных смс на номер."""
+        with self.lock:
+            return self.sms_counts[phone]
+
+    def outcome(self, provider: str):
+        """Исход и задержка следующего запроса к провайдеру."""
+        with self.lock:
+            outcome, delay = self.profiles[provider].outcome(self.rng)
+            self.outcomes[provider, outcome] += 1
+            self.active[provider] += 1
+            self.peak[provider] = max(self.peak[provider],
+                                      self.active[provider])
+        return outcome, delay
+
+    def finished(self, provider: str) -> None:
+        """Запрос к провайдеру обработан."""
+        with self.lock:
+            self.active[provider] -= 1
+
+    def record_sms(self, form: dict) -> None:
+        """Запись смс из формы запроса smstraffic."""
+        message = form.get('message', [''])[0]
+        with self.lock:
+            for phone in form.get('phones', [''])[0].split(','):
+                self.messages[phone] = message
+                self.sms_counts[phone] += 1
+
+    def handler_class(self):
+        """Класс обработчика запросов, связанный с заглушкой."""
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            """Обработчик запросов к заглушке."""
+
+            def do_POST(self):  # noqa: N802
+                """Смс или запрос Carrot quest."""
+                length = int(self.headers.get('Content-Length', 0))
+                body = self.rfile.read(length).decode('utf-8')
+                if self.path == SMS_PATH:
+                    self.sms(parse_qs(body))
+                elif CARROT_PATH.match(self.path):
+                    self.carrot()
+                else:
+                    self.reply(404, '', 'text/plain')
+
+            def sms(self, form):
+                """Ответ smstraffic: ошибка передается кодом в XML."""
+                outcome, delay = stub.outcome('sms')
+                time.sleep(delay)
+                stub.finished('sms')
+                if outcome == 'ok':
+                    stub.record_sms(form)
+                    reply = SMS_REPLY.format(
+                        result='OK', code=0,
+                        description='queued 1 messages')
+                else:
+                    reply = SMS_REPLY.format(result='ERROR', code=401,
+                                             description='stub error')
+                self.reply(200, reply, 'text/xml')
+
+            def carrot(self):
+                """Ответ Carrot quest или 503."""
+                outcome, delay = stub.outcome('carrot')
+                time.sleep(delay)
+                stub.finished('carrot')
+                if outcome == 'ok':
+                    self.reply(200, CARROT_REPLY, 'application/json')
+                else:
+                    self.reply(503, '', 'text/plain')
+
+            def reply(self, status, content, content_type):
+                """Ответ с телом, клиент мог уже отвалиться по таймауту."""
+                content = content.encode('utf-8')
+                try:
+                    self.send_response(status)
+                    self.send_header('Content-Type', content_type)
+                    self.send_header('Content-Length', str(len(content)))
+                    self.end_headers()
+                    self.wfile.write(content)
+                except OSError:
+                    pass
+
+            def log_message(self, format, *args):  # noqa: A002
+                """Лог запросов отключен."""
+
+        return Handler
@@ -0,0 +1,109 @@
+"""Журнал медленных SQL запросов и повторяющихся форм запросов (N+1).
+
+Запрос привязывается к view, к полю сериализатора, которое сериализовалось
+в момент запроса, к ленивой связи модели и к короткому стеку кода проекта.
+Стек разбирается только для медленных запросов и первых двух запросов
+каждой формы, остальные запросы только считаются. Повтор привязывается ко
+второму запросу формы: первый часто делает другой код, например загрузка
+пользователя при авторизации.
+"""
+import os
+import re
+import sys
+import time
+
+from django.conf import settings
+from rest_framework.serializers import Serializer
+
+# вызовы execute_wrapper из кода замеров не относятся к источнику запроса
+INSTRUMENTATION_FILES = ('benchmark.py', 'instrumentation.py', 'metrics.py',
+                         'middleware.py', 'querylog.py')
+RELATED_DESCRIPTORS = os.path.join('db', 'models', 'fields',
+                                   'related_descriptors.py')
+re_in_list = re.compile(r'IN \((?:%s, )*%s\)')
+re_values = re.compile(r'\((?:%s, )*%s\)(?:, \((?:%s, )*%s\))+')
+re_space = re.compile(r'\s+')
+
+
+def query_shape(sql: str) -> str:
+    """Форма запроса: списки IN и VALUES любой длины совпадают."""
+    sql = re_in_list.sub('IN (...)', sql)
+    sql = re_values.sub('(...), ...', sql)
+    return re_space.sub(' ', sql).strip()
+
+
+def query_source(frame, depth: int) -> dict:
+    """Поле сериализатора, ленивая связь и стек проекта для запроса."""
+    project = str(settings.BASE_DIR)
+    field = attribute = None
+    stack = []
+    while frame is not None:
+        code = frame.f_code
+        filename = code.co_filename
+        if attribute is None and filename.endswith(RELATED_DESCRIPTORS):
+            attribute = related_attribute(frame.f_locals.get('self'))
+        if field is None and code.co_name == 'to_representation':
+            owner = frame.f_locals.get('self')
+            current = frame.f_locals.get('field')
+            if isinstance(owner, Serializer) and current is not None:
+                field = f'{type(owner).__name__}.{current.field_name}'
+        if (filename.startswith(project) and len(stack) < depth
+                and os.path.basename(filename) not in INSTRUMENTATION_FILES):
+            stack.append(f'{os.path.relpath(filename, project)}:'
+                         f'{frame.f_lineno} {code.co_name}')
+        frame = frame.f_back
+    return {'field': field, 'attribute': attribute, 'stack': stack}
+
+
+def related_attribute(descriptor):
+    """Связь модели, которую загрузил дескриптор или менеджер связи."""
+    field = getattr(descriptor, 'field', None)
+    if field is not None and hasattr(field, 'model'):
+        return f'{field.model.__name__}.{field.name}'
+    instance = getattr(descriptor, 'instance', None)
+    name = getattr(descriptor, 'prefetch_cache_name', None)
+    if instance is not None and name:
+        return f'{type(instance).__name__}.{name}'
+    return None
+
+
+class QueryLog:
+    """execute_wrapper одного запроса: медленные запросы и формы."""
+
+    def __init__(self, slow_ms: float, depth: int) -> None:
+        """Инициализатор класса."""
+        self.slow_ms = slow_ms
+        self.depth = depth
+        self.slow = []
+        self.shapes = {}
+
+    def __call__(self, execute, sql, params, many, context):
+        """Замер запроса, источник для первых двух запросов формы."""
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            ms = (time.perf_counter() - started) * 1000
+            shape = query_shape(sql)
+            seen = self.shapes.get(shape)
+            source = None
+            if seen is None or seen['count'] < 2 or ms >= self.slow_ms:
+                source = query_source(sys._getframe(), self.depth)
+            if seen is None:
+                self.shapes[shape] = seen = {'count': 0, 'ms': 0.0}
+            if seen['count'] < 2:
+                seen.update(source)
+            seen['count'] += 1
+            seen['ms'] += ms
+            if ms >= self.slow_ms:
+                self.slow.append({'ms': round(ms, 3),
+                                  'sql': sql[:settings.SLOW_QUERY_SQL_LENGTH],
+                                  **source})
+
+    def repeated(self, threshold: int):
+        """Формы, повторенные не меньше threshold раз, по убыванию."""
+        found = [{'shape': shape[:settings.SLOW_QUERY_SQL_LENGTH],
+                  **seen, 'ms': round(seen['ms'], 3)}
+                 for shape, seen in self.shapes.items()
+                 if seen['count'] >= threshold]
+        return sorted(found, key=lambda item: -item['count'])
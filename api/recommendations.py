@@ -0,0 +1,337 @@
+"""Пакетный расчет рекомендаций событий и знакомых на разреженных матрицах."""
+import itertools
+import time
+
+import numpy as np
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils.timezone import localtime, now
+from scipy import sparse
+
+from api.models import (City, Competence, Event, EventRecommendation,
+                        Favorite, Participation, PeopleSuggestion, Tags, User)
+from api.search import normalize
+
+FETCH_CHUNK_SIZE = 10000
+
+
+def fetch_ids(queryset) -> np.ndarray:
+    """Отсортированный массив id из queryset."""
+    ids = queryset.order_by('pk').values_list('pk', flat=True)
+    return np.fromiter(ids.iterator(chunk_size=FETCH_CHUNK_SIZE),
+                       dtype=np.int64)
+
+
+def fetch_pairs(queryset, first: str, second: str) -> np.ndarray:
+    """Массив пар (first, second) без промежуточного списка кортежей."""
+    rows = (queryset.filter(**{f'{first}__isnull': False,
+                               f'{second}__isnull': False})
+            .values_list(first, second).iterator(chunk_size=FETCH_CHUNK_SIZE))
+    flat = np.fromiter(itertools.chain.from_iterable(rows), dtype=np.int64)
+    return flat.reshape(-1, 2)
+
+
+def to_positions(ids: np.ndarray, values: np.ndarray) -> np.ndarray:
+    """Позиции values в отсортированном ids, -1 если значения нет."""
+    positions = np.searchsorted(ids, values)
+    positions[positions >= len(ids)] = 0
+    found = (ids[positions] == values) if len(ids) else np.zeros(
+        len(values), dtype=bool)
+    return np.where(found, positions, -1)
+
+
+def build_matrix(pairs: np.ndarray, row_ids: np.ndarray,
+                 col_ids: np.ndarray, weight: float = 1.0):
+    """Разреженная матрица связей строк и столбцов по парам id."""
+    rows = to_positions(row_ids, pairs[:, 0])
+    cols = to_positions(col_ids, pairs[:, 1])
+    valid = (rows >= 0) & (cols >= 0)
+    data = np.full(valid.sum(), weight, dtype=np.float32)
+    matrix = sparse.csr_matrix((data, (rows[valid], cols[valid])),
+                               shape=(len(row_ids), len(col_ids)))
+    matrix.sum_duplicates()
+    return matrix
+
+
+class RecommendationBuilder:
+    """Расчет top-N событий для всех активных пользователей.
+
+    Профиль пользователя - вектор по тегам, собранный из тегов событий
+    в избранном и участиях, тегов с названием компетенции и тегов его
+    городов. Оценка события - скалярное произведение профиля и тегов
+    события с весом idf. Пользователи обрабатываются пачками, размер
+    пачки ограничен плотной матрицей оценок и временными массивами ее
+    обработки в memory_mb.
+    """
+
+    favorite_weight = 1.0
+    participation_weight = 2.0
+    competence_weight = 1.0
+    city_weight = 0.5
+    # байт на оценку пачки: float32 оценки, маска положительных, -scores
+    # и индексы int64 в argpartition
+    bytes_per_score = 4 + 1 + 4 + 8
+
+    def __init__(self, top_n: int, memory_mb: int = 256) -> None:
+        """Инициализатор класса."""
+        self.top_n = top_n
+        self.memory_mb = memory_mb
+
+    def build(self) -> dict:
+        """Полный пересчет, возвращает статистику расчета."""
+        started = time.perf_counter()
+        self.load()
+        chunk_size = max(1, self.memory_mb * 2 ** 20
+                         // (self.bytes_per_score
+                             * max(len(self.upcoming_ids), 1)))
+        stored = 0
+        for start in range(0, len(self.user_ids), chunk_size):
+            rows = np.arange(start, min(start + chunk_size,
+                                        len(self.user_ids)))
+            stored += self.store(rows, self.score(rows))
+        EventRecommendation.objects.exclude(user__is_active=True).delete()
+        return {'users': len(self.user_ids),
+                'events': len(self.upcoming_ids),
+                'stored': stored, 'chunk_size': chunk_size,
+                'seconds': time.perf_counter() - started}
+
+    def load(self) -> None:
+        """Загрузка связей из БД в разреженные матрицы."""
+        self.user_ids = fetch_ids(User.objects.filter(is_active=True))
+        event_ids = fetch_ids(Event.objects.all())
+        tag_ids = fetch_ids(Tags.objects.all())
+        competence_ids = fetch_ids(Competence.objects.all())
+        city_ids = fetch_ids(City.objects.all())
+
+        event_tags = build_matrix(
+            fetch_pairs(Event.tags.through.objects, 'event_id', 'tags_id'),
+            event_ids, tag_ids)
+        self.interactions = (
+            build_matrix(fetch_pairs(Favorite.objects, 'user_id',
+                                     'event_id'),
+                         self.user_ids, event_ids, self.favorite_weight)
+            + build_matrix(fetch_pairs(Participation.objects, 'user_id',
+                                       'event_id'),
+                           self.user_ids, event_ids,
+                           self.participation_weight))
+        user_competences = build_matrix(
+            fetch_pairs(User.competences.through.objects, 'user_id',
+                        'competence_id'),
+            self.user_ids, competence_ids, self.competence_weight)
+        user_cities = build_matrix(
+            fetch_pairs(User.city.through.objects, 'user_id', 'city_id'),
+            self.user_ids, city_ids, self.city_weight)
+
+        tags_by_name = dict(Tags.objects.values_list('name', 'pk'))
+        tags_by_name = {normalize(name).strip(): pk
+                        for name, pk in tags_by_name.items()}
+        competence_tags = np.array(
+            [(pk, tags_by_name[normalize(name).strip()])
+             for pk, name in Competence.objects.values_list('pk', 'name')
+             if normalize(name).strip() in tags_by_name],
+            dtype=np.int64).reshape(-1, 2)
+        city_tags = fetch_pairs(Tags.objects, 'city_id', 'pk')
+        self.profiles = (
+            self.interactions @ event_tags
+            + user_competences @ build_matrix(competence_tags,
+                                              competence_ids, tag_ids)
+            + user_cities @ build_matrix(city_tags, city_ids, tag_ids)
+        ).tocsr()
+
+        self.upcoming_ids = fetch_ids(
+            Event.objects.filter(start_date__gte=localtime()))
+        upcoming = to_positions(event_ids, self.upcoming_ids)
+        upcoming_tags = event_tags[upcoming]
+        frequency = np.asarray((upcoming_tags > 0).sum(axis=0)).ravel()
+        idf = np.log1p(len(self.upcoming_ids) / (1 + frequency))
+        self.upcoming_tags = (upcoming_tags @ sparse.diags(
+            idf.astype(np.float32))).T.tocsr()
+        self.seen = self.interactions[:, upcoming].tocsr()
+        popularity = np.asarray(self.seen.sum(axis=0)).ravel()
+        self.tiebreak = (popularity / (popularity.max(initial=0) + 1)
+                         * 1e-3).astype(np.float32)
+
+    def score(self, rows: np.ndarray) -> np.ndarray:
+        """Плотная матрица оценок пачки пользователей по событиям."""
+        scores = (self.profiles[rows] @ self.upcoming_tags).toarray()
+        seen = self.seen[rows].tocoo()
+        scores[seen.row, seen.col] = 0
+        # без новых матриц: маска неположительных и оценки float32 на месте
+        missing = scores <= 0
+        scores += self.tiebreak
+        np.putmask(scores, missing, -np.inf)
+        return scores
+
+    def top_events(self, scores: np.ndarray) -> list[list[int]]:
+        """Id лучших событий по строкам, по убыванию оценки."""
+        top_n = min(self.top_n, scores.shape[1])
+        if not top_n:
+            return [[] for _ in range(scores.shape[0])]
+        if top_n < scores.shape[1]:
+            top = np.argpartition(-scores, top_n - 1, axis=1)[:, :top_n]
+        else:
+            top = np.tile(np.arange(scores.shape[1]), (scores.shape[0], 1))
+        top_scores = np.take_along_axis(scores, top, axis=1)
+        order = np.argsort(-top_scores, axis=1, kind='stable')
+        top = np.take_along_axis(top, order, axis=1)
+        top_scores = np.take_along_axis(top_scores, order, axis=1)
+        return [self.upcoming_ids[cols[np.isfinite(values)]].tolist()
+                for cols, values in zip(top, top_scores)]
+
+    def store(self, rows: np.ndarray, scores: np.ndarray) -> int:
+        """Замена рекомендаций пачки пользователей."""
+        user_ids = self.user_ids[rows].tolist()
+        recommendations = [
+            EventRecommendation(user_id=user_id, events=events)
+            for user_id, events in zip(user_ids, self.top_events(scores))
+            if events]
+        with transaction.atomic():
+            EventRecommendation.objects.filter(user_id__in=user_ids).delete()
+            EventRecommendation.objects.bulk_create(recommendations)
+        return len(recommendations)
+
+
+def idf_weights(matrix, weight: float):
+    """Веса столбцов по редкости признака, корень для произведения X @ X.T."""
+    frequency = np.asarray((matrix > 0).sum(axis=0)).ravel()
+    idf = np.log1p(matrix.shape[0] / (1 + frequency))
+    return sparse.diags(np.sqrt(weight * idf).astype(np.float32))
+
+
+class PeopleSuggestionBuilder:
+    """Расчет top-k знакомых для активных пользователей.
+
+    Близость двух пользователей - сумма idf общих событий, в которых они
+    участвуют, и общих компетенций. Матрица близости считается пачками
+    строк произведением разреженных матриц признаков, из каждой строки
+    сохраняются k соседей. Пачка ограничена не только chunk_size, но и
+    оценкой ненулевых элементов произведения в memory_mb: участники
+    популярного события дают почти плотные строки. Инкрементальный
+    расчет пересчитывает пользователей, у которых участия или компетенции
+    менялись после прошлого расчета, их текущих соседей по событиям и
+    новых пользователей.
+    """
+
+    participation_weight = 1.0
+    competence_weight = 0.5
+
+    def __init__(self, top_k: int, chunk_size: int = 1000,
+                 memory_mb: int = 256) -> None:
+        """Инициализатор класса."""
+        self.top_k = top_k
+        self.chunk_size = chunk_size
+        # элемент csr - значение float32 и индекс int32, с запасом
+        # на промежуточные массивы умножения
+        self.max_nnz = max(1, memory_mb * 2 ** 20 // 16)
+
+    def build(self, incremental: bool = False) -> dict:
+        """Пересчет знакомых, возвращает статистику расчета."""
+        started = time.perf_counter()
+        computed_at = now()
+        self.load()
+        rows = (self.changed_rows() if incremental
+                else np.arange(len(self.user_ids)))
+        stored = chunks = 0
+        for chunk in self.chunks(rows):
+            stored += self.store(chunk, self.neighbors(chunk), computed_at)
+            chunks += 1
+        if not incremental:
+            PeopleSuggestion.objects.exclude(user__is_active=True).delete()
+        return {'users': len(self.user_ids), 'refreshed': len(rows),
+                'stored': stored, 'chunks': chunks,
+                'seconds': time.perf_counter() - started}
+
+    def load(self) -> None:
+        """Загрузка участий и компетенций в разреженные матрицы."""
+        self.user_ids = fetch_ids(User.objects.filter(is_active=True))
+        participations = build_matrix(
+            fetch_pairs(Participation.objects, 'user_id', 'event_id'),
+            self.user_ids, fetch_ids(Event.objects.all()))
+        participations.data[:] = 1
+        competences = build_matrix(
+            fetch_pairs(User.competences.through.objects, 'user_id',
+                        'competence_id'),
+            self.user_ids, fetch_ids(Competence.objects.all()))
+        self.participations = participations
+        self.features = sparse.hstack([
+            participations @ idf_weights(participations,
+                                         self.participation_weight),
+            competences @ idf_weights(competences, self.competence_weight),
+        ]).tocsr()
+        self.features_t = self.features.T.tocsr()
+        # верхняя оценка ненулевых в строке X @ X.T: сумма числа
+        # пользователей у каждого признака строки
+        users_per_feature = np.diff(self.features_t.indptr)
+        self.row_nnz = ((self.features > 0).astype(np.int64)
+                        @ users_per_feature)
+
+    def changed_rows(self) -> np.ndarray:
+        """Строки пользователей для инкрементального пересчета."""
+        changed = User.objects.filter(is_active=True).filter(
+            Q(people_suggestion__isnull=True)
+            | Q(people_suggestion__changed_at__gt=F(
+                'people_suggestion__computed_at')))
+        rows = to_positions(self.user_ids, fetch_ids(changed))
+        rows = rows[rows >= 0]
+        # соседи по событиям пачками, как и близость в build
+        participations_t = self.participations.T.tocsr()
+        result = rows
+        for chunk in self.chunks(rows):
+            co_participants = self.participations[chunk] @ participations_t
+            result = np.union1d(result, co_participants.indices)
+        return result
+
+    def chunks(self, rows: np.ndarray):
+        """Пачки строк не больше chunk_size и max_nnz ненулевых близости.
+
+        Строка тяжелее max_nnz считается одна, ее размер ограничен числом
+        пользователей.
+        """
+        total = np.cumsum(self.row_nnz[rows])
+        start = 0
+        while start < len(rows):
+            before = total[start - 1] if start else 0
+            end = np.searchsorted(total, before + self.max_nnz, side='right')
+            end = min(max(end, start + 1), start + self.chunk_size)
+            yield rows[start:end]
+            start = end
+
+    def neighbors(self, rows: np.ndarray) -> list[list[int]]:
+        """Id ближайших пользователей по строкам, по убыванию близости."""
+        similarity = (self.features[rows] @ self.features_t).tocsr()
+        result = []
+        for index, row in enumerate(rows):
+            start, end = similarity.indptr[index:index + 2]
+            cols = similarity.indices[start:end]
+            values = similarity.data[start:end]
+            keep = (cols != row) & (values > 0)
+            cols, values = cols[keep], values[keep]
+            order = np.lexsort((cols, -values))[:self.top_k]
+            result.append(self.user_ids[cols[order]].tolist())
+        return result
+
+    def store(self, rows: np.ndarray, neighbors: list[list[int]],
+              computed_at) -> int:
+        """Сохранение знакомых пачки пользователей.
+
+        Отметка изменения не сбрасывается, чтобы не потерять изменения,
+        сделанные во время расчета.
+        """
+        user_ids = self.user_ids[rows].tolist()
+        existing = PeopleSuggestion.objects.in_bulk(user_ids,
+                                                    field_name='user_id')
+        created, updated = [], []
+        for user_id, users in zip(user_ids, neighbors):
+            suggestion = existing.get(user_id)
+            if suggestion is None:
+                created.append(PeopleSuggestion(user_id=user_id, users=users,
+                                                computed_at=computed_at))
+            else:
+                suggestion.users = users
+                suggestion.computed_at = computed_at
+                updated.append(suggestion)
+        with transaction.atomic():
+            PeopleSuggestion.objects.bulk_create(created)
+            PeopleSuggestion.objects.bulk_update(updated,
+                                                 ['users', 'computed_at'])
+        return len(user_ids)
@@ -0,0 +1,65 @@
+"""Рендерер и парсер JSON на orjson."""
+import datetime
+import decimal
+
+import orjson
+from django.db.models.query import QuerySet
+from django.utils.encoding import force_str
+from django.utils.functional import Promise
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+
+from api.instrumentation import phase
+
+# OPT_NON_STR_KEYS: ошибки ListField и DictField приходят с ключами int
+OPTIONS = (orjson.OPT_UTC_Z | orjson.OPT_SERIALIZE_NUMPY
+           | orjson.OPT_NON_STR_KEYS)
+
+
+def default(obj):
+    """Типы, которые orjson не умеет сериализовать сам (как в DRF)."""
+    if isinstance(obj, Promise):
+        return force_str(obj)
+    if isinstance(obj, decimal.Decimal):
+        return float(obj)
+    if isinstance(obj, datetime.timedelta):
+        return str(obj.total_seconds())
+    if isinstance(obj, (QuerySet, set, frozenset)):
+        return list(obj)
+    if isinstance(obj, bytes):
+        return obj.decode()
+    if hasattr(obj, 'tolist'):
+        return obj.tolist()
+    if hasattr(obj, '__iter__'):
+        return list(obj)
+    raise TypeError(f'Тип {type(obj).__name__} не сериализуется в JSON')
+
+
+class ORJSONRenderer(JSONRenderer):
+    """Рендерер JSON, даты, uuid и Decimal обрабатываются без json.dumps."""
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        """Сериализация данных в байты."""
+        if data is None:
+            return b''
+
+        options = OPTIONS
+        indent = self.get_indent(accepted_media_type, renderer_context or {})
+        if indent:
+            options |= orjson.OPT_INDENT_2
+        with phase('render'):
+            return orjson.dumps(data, default=default, option=options)
+
+
+class ORJSONParser(JSONParser):
+    """Парсер JSON на orjson."""
+
+    renderer_class = ORJSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        """Разбор тела запроса."""
+        try:
+            return orjson.loads(stream.read())
+        except orjson.JSONDecodeError as exc:
+            raise ParseError(f'JSON parse error - {exc}')
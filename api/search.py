@@ -0,0 +1,126 @@
+"""Полнотекстовый поиск."""
+from functools import reduce
+from operator import and_, or_
+
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db import connection
+from django.db.models import (Case, F, FloatField, Func, Q, TextField, Value,
+                              When)
+from django.db.models.functions import Cast
+from django.db.models.lookups import PostgresOperatorLookup
+
+SEARCH_CONFIG = 'russian'
+SEARCH_CHUNK_SIZE = 2000
+# поля пользователя в поисковом тексте, кроме компетенций
+USER_SEARCH_FIELDS = frozenset(('first_name', 'last_name', 'profession',
+                                'about'))
+
+# веса полей события для поиска без postgres, как A, B и C в триггере
+EVENT_FIELDS_WEIGHTS = (('title', 1.0), ('address', 0.4),
+                        ('description', 0.2))
+
+
+def search_events(queryset, query: str):
+    """События, подходящие под запрос, с аннотацией релевантности rank."""
+    if connection.vendor == 'postgresql':
+        search_query = SearchQuery(query, config=SEARCH_CONFIG,
+                                   search_type='websearch')
+        # ts_rank возвращает real, для точного сравнения в курсоре
+        # пагинации приводим к double precision
+        rank = Cast(SearchRank(F('search_vector'), search_query),
+                    FloatField())
+        return (queryset.filter(search_vector=search_query)
+                .annotate(rank=rank))
+    return _search_fallback(queryset, query.split(), EVENT_FIELDS_WEIGHTS)
+
+
+def _search_fallback(queryset, words, fields_weights):
+    """Поиск через icontains для баз без полнотекстового поиска."""
+    if not words:
+        return queryset.none()
+    matches = [reduce(or_, (Q(**{f'{field}__icontains': word})
+                            for field, _ in fields_weights))
+               for word in words]
+    rank = sum((Case(When(**{f'{field}__icontains': word}, then=weight),
+                     default=0.0, output_field=FloatField())
+                for word in words for field, weight in fields_weights),
+               Value(0.0, output_field=FloatField()))
+    return queryset.filter(reduce(and_, matches)).annotate(rank=rank)
+
+
+@TextField.register_lookup
+class TrigramWordSimilar(PostgresOperatorLookup):
+    """Нечеткое совпадение слова с частью текста, использует GIN индекс."""
+
+    lookup_name = 'trigram_word_similar'
+    postgres_operator = '%%>'
+
+
+class TrigramWordSimilarity(Func):
+    """Степень совпадения строки с наиболее похожей частью текста."""
+
+    function = 'WORD_SIMILARITY'
+    output_field = FloatField()
+
+    def __init__(self, string, expression, **extra):
+        """Инициализатор класса."""
+        if not hasattr(string, 'resolve_expression'):
+            string = Value(string)
+        super().__init__(string, expression, **extra)
+
+
+def normalize(text: str) -> str:
+    """Приведение текста к виду для поиска: регистр и ё."""
+    return text.casefold().replace('ё', 'е')
+
+
+def build_user_document(user, competences) -> str:
+    """Текст для поиска по пользователю."""
+    parts = [user.first_name, user.last_name, user.profession,
+             *competences, user.about]
+    return normalize(' '.join(part for part in parts if part))
+
+
+def update_user_search_document(user, competences=None) -> None:
+    """Обновление поискового текста одного пользователя.
+
+    competences - названия компетенций, если уже известны.
+    """
+    if competences is None:
+        competences = user.competences.values_list('name', flat=True)
+    document = build_user_document(user, competences)
+    if document != user.search_document:
+        type(user).objects.filter(pk=user.pk).update(search_document=document)
+        user.search_document = document
+
+
+def update_user_search_documents(queryset) -> None:
+    """Пересчет поискового текста пользователей пачками по pk."""
+    queryset = queryset.order_by('pk').prefetch_related('competences')
+    last_pk = 0
+    while True:
+        users = list(queryset.filter(pk__gt=last_pk)[:SEARCH_CHUNK_SIZE])
+        if not users:
+            return
+        for user in users:
+            competences = [competence.name
+                           for competence in user.competences.all()]
+            user.search_document = build_user_document(user, competences)
+        queryset.model.objects.bulk_update(users, ['search_document'])
+        last_pk = users[-1].pk
+
+
+def search_users(queryset, query: str):
+    """Пользователи, у которых каждое слово запроса нечетко совпадает."""
+    words = normalize(query).split()
+    if not words:
+        return queryset.none()
+    if connection.vendor == 'postgresql':
+        matches = [Q(search_document__trigram_word_similar=word)
+                   for word in words]
+        rank = sum((TrigramWordSimilarity(word, 'search_document')
+                    for word in words), Value(0.0, output_field=FloatField()))
+    else:
+        matches = [Q(search_document__contains=word) for word in words]
+        rank = Value(0.0, output_field=FloatField())
+    return queryset.filter(reduce(and_, matches)).annotate(rank=rank)
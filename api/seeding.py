@@ -0,0 +1,366 @@
+"""Генерация данных продакшен-объема для проверки планов запросов."""
+import io
+import time
+from contextlib import contextmanager
+from datetime import datetime, time as dt_time, timedelta
+from types import SimpleNamespace
+
+import numpy as np
+from django.core.management.color import no_style
+from django.db import connection, models, transaction
+from django.utils.timezone import make_aware
+
+from api.city_feed import rebuild_city_events
+from api.models import (City, Competence, Event, Favorite, Participation,
+                        SMSAuth, Tags, User)
+from api.search import build_user_document
+
+# объем данных на единицу масштаба
+USERS_PER_SCALE = 10000
+EVENTS_PER_SCALE = 2000
+# общий путь фото без файла: списки пользователей скрывают тех, кто без фото
+SEED_PHOTO = 'seed/user.jpg'
+PHOTO_SHARE = 0.9
+
+FIRST_NAMES = ('Александр', 'Алексей', 'Анна', 'Дмитрий', 'Екатерина',
+               'Елена', 'Иван', 'Ирина', 'Мария', 'Михаил', 'Наталья',
+               'Никита', 'Ольга', 'Павел', 'Сергей', 'Светлана', 'Татьяна',
+               'Юлия', 'Артём', 'Фёдор')
+LAST_NAMES = ('Иванов', 'Смирнов', 'Кузнецов', 'Попов', 'Васильев',
+              'Петров', 'Соколов', 'Михайлов', 'Новиков', 'Фёдоров',
+              'Морозов', 'Волков', 'Алексеев', 'Лебедев', 'Семёнов',
+              'Егоров', 'Павлов', 'Козлов', 'Степанов', 'Николаев')
+PROFESSIONS = ('', 'Маркетолог', 'Разработчик', 'Дизайнер', 'Аналитик',
+               'Преподаватель', 'Предприниматель', 'Финансист', 'Юрист')
+TOPICS = ('маркетинг', 'дизайн', 'финансы', 'образование', 'технологии',
+          'история', 'спорт', 'кино', 'музыка', 'путешествия', 'бизнес',
+          'наука', 'искусство', 'психология', 'инвестиции', 'карьера')
+FORMATS = ('Лекция', 'Встреча', 'Мастер-класс', 'Конференция', 'Семинар',
+           'Экскурсия', 'Вечеринка', 'Завтрак', 'Дискуссия', 'Воркшоп')
+
+
+def zipf_weights(count: int, exponent: float = 1.1) -> np.ndarray:
+    """Вероятности с длинным хвостом: популярных значений мало."""
+    weights = 1 / np.arange(1, count + 1) ** exponent
+    return weights / weights.sum()
+
+
+def copy_value(value) -> str:
+    """Значение в текстовом формате COPY."""
+    if value is None:
+        return '\\N'
+    if isinstance(value, datetime):
+        value = value.isoformat()
+    return (str(value).replace('\\', '\\\\').replace('\t', '\\t')
+            .replace('\n', '\\n').replace('\r', '\\r'))
+
+
+@contextmanager
+def auto_now_disabled(model):
+    """Сохранение заданных дат в полях auto_now при bulk_create."""
+    fields = [field for field in model._meta.concrete_fields
+              if getattr(field, 'auto_now', False)]
+    for field in fields:
+        field.auto_now = False
+    try:
+        yield
+    finally:
+        for field in fields:
+            field.auto_now = True
+
+
+def raw_delete(cursor, model, condition: str = '1 = 1') -> None:
+    """Удаление строк без загрузки объектов в память.
+
+    Зависимые строки обрабатываются по on_delete связи, как при
+    QuerySet.delete(): CASCADE удаляет их, SET_NULL обнуляет ссылку,
+    DO_NOTHING оставляет базе. Остальные правила, например PROTECT,
+    требуют проверки объектов, и удаление прерывается с ошибкой.
+    Сигналы удаления не вызываются.
+    """
+    quote = connection.ops.quote_name
+    table = quote(model._meta.db_table)
+    ids = f'SELECT {quote(model._meta.pk.column)} FROM {table} ' \
+          f'WHERE {condition}'
+    for field in model._meta.many_to_many:
+        through = field.remote_field.through
+        cursor.execute(f'DELETE FROM {quote(through._meta.db_table)} '
+                       f'WHERE {quote(field.m2m_column_name())} IN ({ids})')
+    for relation in model._meta.related_objects:
+        if relation.many_to_many:
+            through = relation.through
+            column = relation.field.m2m_reverse_name()
+            cursor.execute(f'DELETE FROM {quote(through._meta.db_table)} '
+                           f'WHERE {quote(column)} IN ({ids})')
+            continue
+        related = relation.related_model
+        column = quote(relation.field.column)
+        if relation.on_delete is models.CASCADE:
+            raw_delete(cursor, related, f'{column} IN ({ids})')
+        elif relation.on_delete is models.SET_NULL:
+            cursor.execute(f'UPDATE {quote(related._meta.db_table)} '
+                           f'SET {column} = NULL WHERE {column} IN ({ids})')
+        elif relation.on_delete is not models.DO_NOTHING:
+            raise ValueError(f'{related.__name__}.{relation.field.name}: '
+                             f'on_delete {relation.on_delete.__name__} '
+                             f'не поддерживается')
+    cursor.execute(f'DELETE FROM {table} WHERE {condition}')
+
+
+class ScaleSeeder:
+    """Заполнение БД данными объема scale единиц.
+
+    Единица - 10 тысяч пользователей и 2 тысячи событий со связями.
+    Популярность компетенций, городов, тегов и событий распределена
+    по Ципфу. Все значения берутся из генератора с заданным seed
+    и отсчитываются от даты today, поэтому при тех же аргументах
+    данные совпадают. Строки пишутся пачками через bulk_create или
+    COPY в postgres с явными id, после чего счетчики id сдвигаются.
+    """
+
+    def __init__(self, scale: float, seed: int = 0, use_copy: bool = False,
+                 batch_size: int = 10000, today=None, log=print) -> None:
+        """Инициализатор класса."""
+        self.scale = scale
+        self.rng = np.random.default_rng(seed)
+        self.use_copy = use_copy and connection.vendor == 'postgresql'
+        self.batch_size = batch_size
+        today = today or datetime.now().date()
+        self.today = make_aware(datetime.combine(today, dt_time(10)))
+        self.log = log
+
+    def count(self, per_scale: float, minimum: int, maximum: int = None):
+        """Объем таблицы для масштаба."""
+        value = max(minimum, int(round(per_scale * self.scale)))
+        return min(value, maximum) if maximum else value
+
+    def run(self) -> dict:
+        """Полная перегенерация данных, возвращает число строк таблиц."""
+        started = time.perf_counter()
+        with transaction.atomic(), connection.cursor() as cursor:
+            raw_delete(cursor, User, 'NOT is_superuser')
+            for model in (Event, SMSAuth, Tags, City, Competence):
+                raw_delete(cursor, model)
+        self.stats = {}
+        self.create_references()
+        self.create_users()
+        self.create_events()
+        self.create_activity()
+        self.finish()
+        self.log(f'seeded in {time.perf_counter() - started:.1f} s')
+        return self.stats
+
+    def next_id(self, model) -> int:
+        """Первый свободный id таблицы."""
+        last = (model.objects.order_by('-pk')
+                .values_list('pk', flat=True).first())
+        return (last or 0) + 1
+
+    def write(self, model, rows) -> None:
+        """Запись строк-словарей по attname пачками."""
+        started = time.perf_counter()
+        total = 0
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= self.batch_size:
+                total += self.write_batch(model, batch)
+                batch = []
+        if batch:
+            total += self.write_batch(model, batch)
+        name = model._meta.db_table
+        self.stats[name] = self.stats.get(name, 0) + total
+        self.log(f'{name}: {total} rows, '
+                 f'{time.perf_counter() - started:.1f} s')
+
+    def write_batch(self, model, batch) -> int:
+        """Запись пачки через COPY или bulk_create."""
+        if self.use_copy:
+            fields = model._meta.concrete_fields
+            buffer = io.StringIO()
+            for row in batch:
+                buffer.write('\t'.join(
+                    copy_value(row[field.attname] if field.attname in row
+                               else field.get_default())
+                    for field in fields))
+                buffer.write('\n')
+            buffer.seek(0)
+            with connection.cursor() as cursor:
+                cursor.cursor.copy_from(
+                    buffer, model._meta.db_table,
+                    columns=[field.column for field in fields])
+        else:
+            with auto_now_disabled(model):
+                model.objects.bulk_create([model(**row) for row in batch],
+                                          batch_size=self.batch_size)
+        return len(batch)
+
+    def write_pairs(self, through, first: str, second: str,
+                    pairs: np.ndarray) -> None:
+        """Запись связей таблицы многие ко многим."""
+        start = self.next_id(through)
+        self.write(through, ({'id': start + index, first: int(left),
+                              second: int(right)}
+                             for index, (left, right) in enumerate(pairs)))
+
+    def sample_pairs(self, rows: int, columns: np.ndarray, mean: float,
+                     minimum: int = 0, exponent: float = 1.1) -> np.ndarray:
+        """Уникальные пары (строка, id столбца) с популярностью по Ципфу."""
+        counts = self.rng.poisson(mean, rows) + minimum
+        counts = np.minimum(counts, len(columns))
+        left = np.repeat(np.arange(rows), counts)
+        right = self.rng.choice(len(columns), size=len(left),
+                                p=zipf_weights(len(columns), exponent))
+        keys = np.unique(left.astype(np.int64) * len(columns) + right)
+        return np.stack([keys // len(columns), columns[keys % len(columns)]],
+                        axis=1)
+
+    def create_references(self) -> None:
+        """Города, компетенции и теги."""
+        cities = self.count(5, 20, 2000)
+        competences = self.count(10, 50, 5000)
+        tags = self.count(10, 30, 5000)
+        start = self.next_id(City)
+        self.city_ids = np.arange(start, start + cities)
+        self.write(City, ({'id': int(pk), 'name': f'Город {index + 1}'}
+                          for index, pk in enumerate(self.city_ids)))
+        start = self.next_id(Competence)
+        self.competence_ids = np.arange(start, start + competences)
+        self.competence_names = {
+            int(pk): f'{TOPICS[index % len(TOPICS)].capitalize()} '
+                     f'{index // len(TOPICS) + 1}'
+            for index, pk in enumerate(self.competence_ids)}
+        self.write(Competence, ({'id': pk, 'name': name}
+                                for pk, name in self.competence_names.items()))
+        start = self.next_id(Tags)
+        self.tag_ids = np.arange(start, start + tags)
+        # каждый пятый тег привязан к городу
+        tag_cities = self.rng.choice(self.city_ids, size=tags,
+                                     p=zipf_weights(cities))
+        self.write(Tags, ({'id': int(pk),
+                           'name': f'{TOPICS[index % len(TOPICS)]} '
+                                   f'{index // len(TOPICS) + 1}',
+                           'city_id': (int(tag_cities[index])
+                                       if index % 5 == 4 else None)}
+                          for index, pk in enumerate(self.tag_ids)))
+
+    def create_users(self) -> None:
+        """Пользователи с компетенциями и городами."""
+        users = self.count(USERS_PER_SCALE, 100)
+        start = self.next_id(User)
+        self.user_ids = np.arange(start, start + users)
+        competences = self.sample_pairs(users, self.competence_ids, 2)
+        user_competences = np.split(
+            competences[:, 1], np.searchsorted(competences[:, 0],
+                                               np.arange(1, users)))
+        first_names = self.rng.integers(len(FIRST_NAMES), size=users)
+        last_names = self.rng.integers(len(LAST_NAMES), size=users)
+        professions = self.rng.integers(len(PROFESSIONS), size=users)
+        registered = self.rng.integers(0, 3 * 365, size=users)
+        subscription = self.rng.integers(-365, 365, size=users)
+        has_subscription = self.rng.random(users) < 0.7
+        has_photo = self.rng.random(users) < PHOTO_SHARE
+
+        def rows():
+            for index, pk in enumerate(self.user_ids):
+                phone = f'+78{index:09d}'
+                user = SimpleNamespace(
+                    first_name=FIRST_NAMES[first_names[index]],
+                    last_name=LAST_NAMES[last_names[index]],
+                    profession=PROFESSIONS[professions[index]], about='')
+                names = [self.competence_names[int(competence)]
+                         for competence in user_competences[index]]
+                date_joined = self.today - timedelta(
+                    days=int(registered[index]))
+                photo = SEED_PHOTO if has_photo[index] else ''
+                yield {
+                    'id': int(pk), 'password': '', 'username': phone,
+                    'phone': phone, 'photo': photo,
+                    'first_name': user.first_name,
+                    'last_name': user.last_name,
+                    'profession': user.profession,
+                    'date_joined': date_joined,
+                    'date_of_registration': date_joined.date(),
+                    'subscription_expiration_date': (
+                        self.today + timedelta(days=int(subscription[index]))
+                        if has_subscription[index] else None),
+                    'search_document': build_user_document(user, names)}
+
+        self.write(User, rows())
+        competences[:, 0] = self.user_ids[competences[:, 0]]
+        self.write_pairs(User.competences.through, 'user_id',
+                         'competence_id', competences)
+        cities = self.sample_pairs(users, self.city_ids, 0.2, minimum=1)
+        cities[:, 0] = self.user_ids[cities[:, 0]]
+        self.write_pairs(User.city.through, 'user_id', 'city_id', cities)
+
+    def create_events(self) -> None:
+        """События с тегами, треть в прошлом."""
+        events = self.count(EVENTS_PER_SCALE, 20)
+        start = self.next_id(Event)
+        self.event_ids = np.arange(start, start + events)
+        days = self.rng.integers(-90, 180, size=events)
+        hours = self.rng.integers(8, 22, size=events)
+        formats = self.rng.integers(len(FORMATS), size=events)
+        topics = self.rng.integers(len(TOPICS), size=(events, 2))
+        cities = self.rng.integers(len(self.city_ids), size=events)
+
+        def rows():
+            for index, pk in enumerate(self.event_ids):
+                topic, other = (TOPICS[topic] for topic in topics[index])
+                start_date = self.today + timedelta(days=int(days[index]),
+                                                    hours=int(hours[index]))
+                yield {
+                    'id': int(pk),
+                    'title': f'{FORMATS[formats[index]]}: {topic} '
+                             f'№{index + 1}',
+                    'description': f'Обсуждаем {topic} и {other}. '
+                                   f'Встреча для всех, кому интересны '
+                                   f'{topic}.',
+                    'address': f'Город {cities[index] + 1}, '
+                               f'ул. {other.capitalize()}, {index % 100 + 1}',
+                    'start_date': start_date,
+                    'end_date': start_date + timedelta(hours=2)}
+
+        self.write(Event, rows())
+        tags = self.sample_pairs(events, self.tag_ids, 1.5, minimum=1)
+        tags[:, 0] = self.event_ids[tags[:, 0]]
+        self.write_pairs(Event.tags.through, 'event_id', 'tags_id', tags)
+
+    def create_activity(self) -> None:
+        """Участия, избранное и история смс авторизаций."""
+        users = len(self.user_ids)
+        for model, mean in ((Participation, 3), (Favorite, 2)):
+            pairs = self.sample_pairs(users, self.event_ids, mean,
+                                      exponent=0.8)
+            start = self.next_id(model)
+            self.write(model, ({'id': start + index,
+                                'user_id': int(self.user_ids[user]),
+                                'event_id': int(event)}
+                               for index, (user, event) in enumerate(pairs)))
+        counts = self.rng.integers(1, 4, size=users)
+        owners = np.repeat(np.arange(users), counts)
+        ages = self.rng.integers(0, 365 * 24 * 60, size=len(owners))
+        codes = self.rng.integers(1000, 10000, size=len(owners))
+        start = self.next_id(SMSAuth)
+        self.write(SMSAuth, ({
+            'id': start + index, 'phone': f'+78{owner:09d}',
+            'code': str(codes[index]), 'attempts': int(codes[index] % 3),
+            'is_used': bool(ages[index] > 10),
+            'send_at': self.today - timedelta(minutes=int(ages[index]))}
+            for index, owner in enumerate(owners)))
+
+    def finish(self) -> None:
+        """Счетчики id после явных id, индекс ленты и статистика таблиц."""
+        models = (City, Competence, Tags, User, User.competences.through,
+                  User.city.through, Event, Event.tags.through,
+                  Participation, Favorite, SMSAuth)
+        with connection.cursor() as cursor:
+            for sql in connection.ops.sequence_reset_sql(no_style(), models):
+                cursor.execute(sql)
+        started = time.perf_counter()
+        rebuild_city_events(self.event_ids.tolist())
+        self.log(f'city events: {time.perf_counter() - started:.1f} s')
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE')
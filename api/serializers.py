@@ -187,7 +187,7 @@ class EventSerializer(serializers.ModelSerializer):
         """Настройки класса."""
 
         model = Event
-        fields = '__all__'
+        exclude = ('search_vector',)
 
     def get_photos(self, obj):
         """Получение списка картинок события."""
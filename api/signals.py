@@ -1,20 +1,32 @@
 """Обработка сигналов."""
 import logging
 
-from django.db.models.signals import post_save, m2m_changed, post_delete
+from django.db.models.signals import (post_save, m2m_changed, post_delete,
+                                      pre_delete, pre_save)
 from django.dispatch import receiver
+from django.utils.timezone import now
 
+from api.cache_service import ReferenceCache
 from api.carrot_crm_service import CarrotQuest
-from api.models import User, Event, Favorite, Participation, Competence
-from api.serializers import CarrotSerializer
+from api.city_feed import rebuild_city_events
+from api.instrumentation import timed
+from api.models import (User, Event, Favorite, Participation, Competence,
+                        City, Tags, CityEvent, PeopleSuggestion)
+from api.search import (USER_SEARCH_FIELDS, update_user_search_document,
+                        update_user_search_documents)
+from api.user_import import CRM_USER_FIELDS, enqueue_sync
 
 logger = logging.getLogger(__name__)
 
 
 @receiver(m2m_changed, sender=User.competences.through)
+@timed('signal')
 def change_user_competences(instance, **kwargs):
     """Сигнал на изменение компетенций пользователя."""
     user_competences = kwargs['pk_set']
+    # при очистке pk_set пуст, при обратной связи instance - компетенция
+    if kwargs['reverse'] or user_competences is None:
+        return
     competences = (Competence.objects.filter(id__in=user_competences)
                    .values_list('name', flat=True))
     analytics = CarrotQuest(user_id=instance.pk)
@@ -22,16 +34,93 @@ def change_user_competences(instance, **kwargs):
     analytics.send_update(dict_data)
 
 
+@receiver(m2m_changed, sender=User.competences.through)
+@timed('signal')
+def clear_competence_users(instance, action, reverse, **kwargs):
+    """Сохранение владельцев компетенции, в post_clear pk_set пуст."""
+    if reverse and action == 'pre_clear':
+        instance._cleared_user_ids = list(
+            instance.user_set.values_list('pk', flat=True))
+
+
+@receiver(m2m_changed, sender=User.competences.through)
+@timed('signal')
+def change_competences_search(instance, action, reverse, pk_set, **kwargs):
+    """Сигнал на изменение компетенций, обновляет поиск пользователей."""
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        update_user_search_document(instance)
+        return
+    if action == 'post_clear':
+        pk_set = getattr(instance, '_cleared_user_ids', [])
+    if pk_set:
+        update_user_search_documents(User.objects.filter(pk__in=pk_set))
+
+
+@receiver(pre_save, sender=Competence)
+@timed('signal')
+def check_competence_name(instance, **kwargs):
+    """Отметка смены названия компетенции до сохранения."""
+    instance._name_changed = bool(
+        instance.pk and Competence.objects.filter(pk=instance.pk)
+        .exclude(name=instance.name).exists())
+
+
+@receiver(post_save, sender=Competence)
+@timed('signal')
+def rename_competence(instance, created, **kwargs):
+    """Сигнал на переименование компетенции, обновляет поиск владельцев."""
+    if not created and getattr(instance, '_name_changed', True):
+        update_user_search_documents(instance.user_set.all())
+
+
+@receiver(pre_delete, sender=Competence)
+@timed('signal')
+def delete_competence(instance, **kwargs):
+    """Сохранение владельцев, связи удалятся каскадом без m2m сигнала."""
+    instance._deleted_user_ids = list(
+        instance.user_set.values_list('pk', flat=True))
+
+
+@receiver(post_delete, sender=Competence)
+@timed('signal')
+def update_deleted_competence_users(instance, **kwargs):
+    """Пересчет поиска и знакомых владельцев удаленной компетенции."""
+    user_ids = getattr(instance, '_deleted_user_ids', [])
+    if user_ids:
+        update_user_search_documents(User.objects.filter(pk__in=user_ids))
+        mark_people_changed(user_ids)
+
+
 @receiver(post_save, sender=User)
-def create_new_user(instance, **kwargs):
-    """Сигнал на создание пользователя."""
-    user_data = CarrotSerializer(instance)
-    user_fields = user_data.get_field_ru_names()
-    analytics = CarrotQuest(user_id=instance.pk)
-    analytics.send_update(user_fields)
+@timed('signal')
+def change_user_search(instance, created, update_fields, **kwargs):
+    """Сигнал на сохранение пользователя, обновляет поисковый текст.
+
+    Сохранение без полей поиска, например пароля при входе, пропускается,
+    у нового пользователя компетенций еще нет.
+    """
+    if update_fields is not None and not USER_SEARCH_FIELDS & update_fields:
+        return
+    update_user_search_document(instance, [] if created else None)
+
+
+@receiver(post_save, sender=User)
+@timed('signal')
+def create_new_user(instance, update_fields, **kwargs):
+    """Сигнал на сохранение пользователя, ставит его в очередь CRM.
+
+    Данные уходят воркером run_import_jobs, а не в потоке запроса.
+    Сохранение без полей CRM, например пароля при входе, пропускается.
+    """
+    if update_fields is not None and not CRM_USER_FIELDS & update_fields:
+        return
+    enqueue_sync([instance.pk])
 
 
 @receiver(post_save, sender=Favorite)
+@timed('signal')
 def create_new_favorite(created, instance, **kwargs):
     """Сигнал на добавление в избранное."""
     if not created:
@@ -42,6 +131,7 @@ def create_new_favorite(created, instance, **kwargs):
 
 
 @receiver(post_delete, sender=Favorite)
+@timed('signal')
 def delete_favorite(instance, **kwargs):
     """Сигнал на удаление из избранного."""
     event = f'удалить избранное {instance.event.title}'
@@ -51,6 +141,7 @@ def delete_favorite(instance, **kwargs):
 
 
 @receiver(post_save, sender=Participation)
+@timed('signal')
 def create_new_participation(created, instance, **kwargs):
     """Сигнал на участие в событие."""
     if not created or not hasattr(instance, 'event'):
@@ -59,3 +150,95 @@ def create_new_participation(created, instance, **kwargs):
     event = f'участие в событии {instance.event.title}'
     analytics = CarrotQuest(user_id=instance.user.id)
     analytics.send_event(event)
+
+
+@receiver(post_save, sender=City)
+@receiver(post_delete, sender=City)
+@receiver(post_save, sender=Competence)
+@receiver(post_delete, sender=Competence)
+@receiver(post_save, sender=Tags)
+@receiver(post_delete, sender=Tags)
+@timed('signal')
+def change_reference(sender, **kwargs):
+    """Сигнал на изменение справочников, сбрасывает версию таблицы."""
+    ReferenceCache(sender).invalidate()
+
+
+@receiver(m2m_changed, sender=Event.tags.through)
+@timed('signal')
+def change_event_tags(instance, action, reverse, pk_set, **kwargs):
+    """Сигнал на изменение тегов события, обновляет индекс по городам."""
+    if reverse and action == 'pre_clear':
+        instance._cleared_event_ids = list(
+            instance.event_set.values_list('pk', flat=True))
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        rebuild_city_events([instance.pk])
+    elif action == 'post_clear':
+        rebuild_city_events(instance.__dict__.pop('_cleared_event_ids', []))
+    else:
+        rebuild_city_events(pk_set)
+
+
+@receiver(post_save, sender=Tags)
+@timed('signal')
+def change_tag_city(instance, created, **kwargs):
+    """Сигнал на изменение тега, город тега мог поменяться."""
+    if not created:
+        rebuild_city_events(instance.event_set.values_list('pk', flat=True))
+
+
+@receiver(pre_delete, sender=Tags)
+@timed('signal')
+def delete_tag(instance, **kwargs):
+    """Сохранение событий тега, связи удалятся каскадом без m2m сигнала."""
+    instance._deleted_event_ids = list(
+        instance.event_set.values_list('pk', flat=True))
+
+
+@receiver(post_delete, sender=Tags)
+@timed('signal')
+def rebuild_deleted_tag_events(instance, **kwargs):
+    """Пересчет индекса событий удаленного тега."""
+    rebuild_city_events(getattr(instance, '_deleted_event_ids', []))
+
+
+@receiver(post_save, sender=Event)
+@timed('signal')
+def change_event_start_date(instance, created, **kwargs):
+    """Сигнал на сохранение события, обновляет дату в индексе."""
+    if not created:
+        (CityEvent.objects.filter(event=instance)
+         .exclude(start_date=instance.start_date)
+         .update(start_date=instance.start_date))
+
+
+def mark_people_changed(user_ids) -> None:
+    """Отметка изменения связей для инкрементального расчета знакомых."""
+    PeopleSuggestion.objects.filter(user_id__in=user_ids).update(
+        changed_at=now())
+
+
+@receiver(post_save, sender=Participation)
+@receiver(post_delete, sender=Participation)
+@timed('signal')
+def change_participation_people(instance, **kwargs):
+    """Сигнал на изменение участия, знакомые пользователя устарели."""
+    if instance.user_id:
+        mark_people_changed([instance.user_id])
+
+
+@receiver(m2m_changed, sender=User.competences.through)
+@timed('signal')
+def change_competences_people(instance, action, reverse, pk_set, **kwargs):
+    """Сигнал на изменение компетенций, знакомые пользователей устарели."""
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        mark_people_changed([instance.pk])
+        return
+    if action == 'post_clear':
+        pk_set = getattr(instance, '_cleared_user_ids', [])
+    if pk_set:
+        mark_people_changed(pk_set)
@@ -2,9 +2,13 @@
 
 import xml.etree.ElementTree as ET  # noqa: N817, S405
 
+import httpx
 import requests
 from django.conf import settings
 
+from api.http_client import http_client
+from api.instrumentation import phase
+
 
 class SmsException(Exception):
     """Ошибка при отправке смс."""
@@ -20,15 +24,44 @@ class SmsTraffic:
 
     def send_sms(self, phone: str, message: str) -> None:
         """Метод для отправки смс на сервис."""
+        try:
+            with phase('sms'):
+                res = requests.post(settings.SMS_TRAFFIC_API,
+                                    **self._request(phone, message),
+                                    timeout=settings.PROVIDER_TIMEOUT)
+                res.raise_for_status()
+        except requests.RequestException as error:
+            raise SmsException('Сервис смс недоступен') from error
+        self._check_reply(res.text)
+
+    async def send_sms_async(self, phone: str, message: str) -> None:
+        """Отправка смс без блокировки потока, для async view."""
+        try:
+            with phase('sms'):
+                res = await http_client().post(
+                    settings.SMS_TRAFFIC_API, **self._request(phone, message),
+                    timeout=settings.PROVIDER_TIMEOUT)
+                res.raise_for_status()
+        except httpx.HTTPError as error:
+            raise SmsException('Сервис смс недоступен') from error
+        self._check_reply(res.text)
+
+    def _request(self, phone: str, message: str) -> dict:
+        """Тело и заголовки запроса к сервису."""
         data = {'login': self.login, 'password': self.password, 'rus': 5,
                 'phones': phone, 'message': message}
         if not settings.DEBUG:
             data['originator'] = settings.SMS_TRAFFIC_ORIGINATOR
         headers = {'Content-Type': 'application/x-www-form-urlencoded'}
+        return {'data': data, 'headers': headers}
 
-        res = requests.post(settings.SMS_TRAFFIC_API, data=data,
-                            headers=headers)
-        if self._get_code(res.text):
+    def _check_reply(self, xml_str: str) -> None:
+        """Ошибка, если сервис не принял смс."""
+        try:
+            code = self._get_code(xml_str)
+        except (ET.ParseError, ValueError) as error:
+            raise SmsException('Неверный ответ сервиса смс') from error
+        if code:
             raise SmsException('Возникла ошибка при отправке смс')
 
     @staticmethod
@@ -0,0 +1,213 @@
+"""Нагрузочная проверка входа по смс: send-sms, token и token/refresh."""
+import random
+import threading
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connection, connections
+from django.db.models import Count
+from django.test import Client, override_settings
+
+from api.benchmark import percentiles
+from api.models import SMSAuth, User
+from api.provider_stub import Profile, ProviderStub
+
+# номера нагрузочных пользователей не пересекаются с seed (+78...)
+STRESS_PHONE_PREFIX = '+77'
+LOCK_WAITS_SQL = (
+    "SELECT count(*) FROM pg_stat_activity "
+    "WHERE datname = current_database() AND wait_event_type = 'Lock'")
+
+
+def stress_phones(count: int, start: int = 0):
+    """Номера нагрузочных пользователей."""
+    return [f'{STRESS_PHONE_PREFIX}{index:09d}'
+            for index in range(start, start + count)]
+
+
+class LockMonitor:
+    """Замер ожидающих блокировок соединений через pg_stat_activity."""
+
+    def __init__(self, interval: float = 0.05) -> None:
+        """Инициализатор класса, interval - период опроса в секундах."""
+        self.interval = interval
+        self.samples = []
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def run(self) -> None:
+        """Опрос в своем соединении до остановки."""
+        try:
+            with connection.cursor() as cursor:
+                while not self.stopped.is_set():
+                    cursor.execute(LOCK_WAITS_SQL)
+                    self.samples.append(cursor.fetchone()[0])
+                    self.stopped.wait(self.interval)
+        finally:
+            connections.close_all()
+
+    def start(self) -> None:
+        """Запуск опроса."""
+        self.thread.start()
+
+    def stop(self) -> dict:
+        """Остановка и сводка: максимум и среднее ожидающих соединений."""
+        self.stopped.set()
+        self.thread.join()
+        samples = self.samples or [0]
+        return {'max': max(samples),
+                'mean': round(sum(samples) / len(samples), 3),
+                'waiting_share': round(
+                    sum(1 for sample in samples if sample) / len(samples), 3)}
+
+
+class LoginStress:
+    """Параллельный вход множества номеров с ошибками ввода кода.
+
+    Каждый номер запрашивает код burst потоками одновременно, с
+    вероятностью typo_rate вводит неверные коды, затем верный код и
+    обновляет токен. Смс и события Carrot quest уходят в локальную
+    заглушку, из нее же берется код. После прогона проверяются инварианты.
+    """
+
+    def __init__(self, phones, concurrency: int = 50, burst: int = 2,
+                 typo_rate: float = 0.3, seed: int = 0, sms: Profile = None,
+                 carrot: Profile = None) -> None:
+        """Инициализатор класса, sms и carrot - профили заглушек."""
+        self.phones = list(phones)
+        self.concurrency = concurrency
+        self.burst = burst
+        self.typo_rate = typo_rate
+        self.seed = seed
+        self.profiles = {'sms': sms, 'carrot': carrot}
+        self.lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.statuses = defaultdict(Counter)
+        self.logins = Counter()
+        self.stub = None
+
+    def reset(self) -> None:
+        """Удаление кодов номеров, чтобы лимиты считались с нуля."""
+        SMSAuth.objects.filter(phone__in=self.phones).delete()
+
+    def run(self) -> dict:
+        """Прогон и отчет с нарушенными инвариантами."""
+        self.reset()
+        flows = [(index, phone) for index, phone in enumerate(self.phones)
+                 for _ in range(self.burst)]
+        monitor = LockMonitor()
+        self.stub = ProviderStub(seed=self.seed, **self.profiles)
+        with self.stub, override_settings(DEBUG=False,
+                                          **self.stub.settings()):
+            monitor.start()
+            started = time.perf_counter()
+            with ThreadPoolExecutor(self.concurrency) as executor:
+                list(executor.map(self.flow, flows))
+            wall = time.perf_counter() - started
+            lock_waits = monitor.stop()
+            violations = self.check()
+        return {
+            'phones': len(self.phones),
+            'flows': len(flows),
+            'concurrency': self.concurrency,
+            'seconds': round(wall, 3),
+            'logins': self.logins['ok'],
+            'logins_per_second': round(self.logins['ok'] / wall, 2),
+            'steps': {step: {'requests': len(values),
+                             'statuses': dict(self.statuses[step]),
+                             **percentiles(values)}
+                      for step, values in self.latencies.items()},
+            'lock_waits': lock_waits,
+            'providers': {f'{provider} {outcome}': count for
+                          (provider, outcome), count
+                          in sorted(self.stub.outcomes.items())},
+            'violations': violations,
+        }
+
+    def flow(self, item) -> None:
+        """Вход одного номера, соединение потока закрывается в конце."""
+        index, phone = item
+        try:
+            self.login(phone, random.Random(self.seed * 1000003 + index))
+        finally:
+            connections.close_all()
+
+    def login(self, phone: str, rng: random.Random) -> None:
+        """Запрос кода, ошибки ввода, вход и обновление токена."""
+        # ошибки view считаются ответами 500, а не прерывают прогон
+        client = Client(raise_request_exception=False)
+        response = self.post(client, 'send-sms', '/api/send-sms/',
+                             {'phone': phone})
+        if response.status_code != 200:
+            return
+        code = self.stub.code(phone)
+        if rng.random() < self.typo_rate:
+            for _ in range(rng.randint(1, settings.CODE_COUNT + 1)):
+                wrong = str(int(code) % 9000 + 1001)
+                response = self.post(client, 'token-typo', '/api/token/',
+                                     {'phone': phone, 'password': wrong})
+                if response.status_code == 200:
+                    self.count('wrong_code_accepted')
+        response = self.post(client, 'token', '/api/token/',
+                             {'phone': phone, 'password': code})
+        if response.status_code != 200:
+            self.count('rejected')
+            return
+        self.count('ok')
+        self.post(client, 'refresh', '/api/token/refresh/', {})
+
+    def post(self, client: Client, step: str, path: str, data: dict):
+        """POST запрос с замером времени и статуса."""
+        started = time.perf_counter()
+        response = client.post(path, data)
+        elapsed = (time.perf_counter() - started) * 1000
+        with self.lock:
+            self.latencies[step].append(elapsed)
+            self.statuses[step][response.status_code] += 1
+        return response
+
+    def count(self, name: str) -> None:
+        """Счетчик исходов входа."""
+        with self.lock:
+            self.logins[name] += 1
+
+    def check(self) -> list:
+        """Нарушенные инварианты после прогона."""
+        violations = []
+        errors = sum(count for statuses in self.statuses.values()
+                     for status, count in statuses.items() if status >= 500)
+        if errors:
+            violations.append(f'ответов 5xx: {errors}')
+        if self.logins['wrong_code_accepted']:
+            violations.append(f'принят неверный код: '
+                              f'{self.logins["wrong_code_accepted"]}')
+        users = User.objects.filter(phone__in=self.phones)
+        duplicates = (users.values('phone').annotate(total=Count('pk'))
+                      .filter(total__gt=1).count())
+        if duplicates:
+            violations.append(f'номеров с несколькими пользователями: '
+                              f'{duplicates}')
+        missing = len(self.phones) - users.count()
+        if missing:
+            violations.append(f'номеров без пользователя: {missing}')
+        codes = SMSAuth.objects.filter(phone__in=self.phones)
+        over_attempts = codes.filter(
+            attempts__gt=settings.CODE_COUNT).count()
+        if over_attempts:
+            violations.append(f'кодов с попытками больше CODE_COUNT: '
+                              f'{over_attempts}')
+        over_limit = (codes.values('phone').annotate(total=Count('pk'))
+                      .filter(total__gt=settings.SMS_COUNT).count())
+        over_sent = sum(1 for phone in self.phones
+                        if self.stub.sent(phone) > settings.SMS_COUNT)
+        if over_limit or over_sent:
+            violations.append(f'номеров с кодами сверх SMS_COUNT: '
+                              f'{max(over_limit, over_sent)}')
+        active = (codes.filter(is_used=False).values('phone')
+                  .annotate(total=Count('pk')).filter(total__gt=1).count())
+        if active:
+            violations.append(f'номеров с несколькими действующими '
+                              f'кодами: {active}')
+        return violations
@@ -1,4 +1,7 @@
 """Фикстуры для pytest."""
+from django.apps import apps
+from django.core.management.color import no_style
+from django.db import connection
 from rest_framework.test import APIClient
 from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
 
@@ -20,3 +23,16 @@ class JWTClient(APIClient):
         user.set_password('1111')
         user.save()
         return self.login(phone=user.phone, password='1111')  # noqa: S106
+
+
+class ResetSequencesMixin:
+    """Сброс счетчиков id после класса, тесты в test_views ждут свои pk."""
+
+    @classmethod
+    def tearDownClass(cls):
+        """Сброс последовательностей после отката данных класса."""
+        super().tearDownClass()
+        models = apps.get_app_config('api').get_models()
+        with connection.cursor() as cursor:
+            for sql in connection.ops.sequence_reset_sql(no_style(), models):
+                cursor.execute(sql)
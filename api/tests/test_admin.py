@@ -0,0 +1,190 @@
+"""Тесты админки для больших таблиц."""
+import datetime
+from unittest import mock
+
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from api import bulk
+from api.admin import EstimatedCountPaginator
+from api.models import (City, CityEvent, Competence, CrmSync, Event,
+                        Participation, PeopleSuggestion, SMSAuth, Tags, User)
+from api.tests.conftest import ResetSequencesMixin
+
+
+class TestAdmin(ResetSequencesMixin, TestCase):
+    """Списки, поиск и автодополнение в админке."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser(phone='+70000000000',
+                                                  username='+70000000000',
+                                                  password='admin')
+        cls.user = User.objects.create(phone='+79991112233',
+                                       username='+79991112233',
+                                       first_name='Пётр', last_name='Ёлкин')
+        cls.event = Event.objects.create(title='Форум', start_date=(
+            timezone.now() + datetime.timedelta(days=1)))
+        Participation.objects.create(user=cls.user, event=cls.event)
+        Competence.objects.create(name='Python')
+        Competence.objects.create(name='Машинное обучение')
+        Tags.objects.create(name='Спорт')
+        SMSAuth.objects.create(phone='+79991112233', code='1111')
+
+    def setUp(self) -> None:
+        self.client.force_login(self.admin)
+
+    def search(self, url, term):
+        response = self.client.get(url, {'q': term})
+        assert response.status_code == 200
+        return list(response.context['cl'].result_list)
+
+    def test_changelists(self):
+        """Списки больших таблиц открываются без полного подсчета."""
+        for url in ('/admin/api/importjob/', '/admin/api/tags/',
+                    '/admin/api/user/', '/admin/api/event/',
+                    '/admin/api/participation/', '/admin/api/smsauth/'):
+            response = self.client.get(url)
+            assert response.status_code == 200, url
+        assert response.context['cl'].show_full_result_count is False
+
+    def test_estimated_count(self):
+        """Оценка числа строк только для списка без фильтров."""
+        with mock.patch('api.admin.estimated_count', return_value=10 ** 6):
+            paginator = EstimatedCountPaginator(User.objects.all(), 100)
+            assert paginator.count == 10 ** 6
+            paginator = EstimatedCountPaginator(
+                User.objects.filter(is_superuser=True), 100)
+            assert paginator.count == 1
+
+    def test_user_search(self):
+        """Поиск по префиксу телефона и по словам с ё."""
+        assert self.search('/admin/api/user/', '7999111') == [self.user]
+        assert self.search('/admin/api/user/', '+7000') == [self.admin]
+        assert self.search('/admin/api/user/', 'елкин петр') == [self.user]
+        assert self.search('/admin/api/smsauth/', '79991112233') == [
+            SMSAuth.objects.get()]
+        assert self.search('/admin/api/participation/', '7999') == [
+            Participation.objects.get()]
+
+    def test_reference_autocomplete(self):
+        """Автодополнение справочника по префиксу слова."""
+        response = self.client.get('/admin/api/competence/autocomplete/',
+                                   {'term': 'обуч'})
+        assert [item['text'] for item in response.json()['results']] == [
+            'Машинное обучение']
+
+    def test_event_participants_link(self):
+        """Участники события ссылкой на постраничный список."""
+        response = self.client.get(
+            f'/admin/api/event/{self.event.pk}/change/')
+        assert (f'/admin/api/participation/?event__id__exact='
+                f'{self.event.pk}').encode() in response.content
+        assert 'Участники: 1' in response.content.decode()
+        response = self.client.get('/admin/api/participation/',
+                                   {'event__id__exact': self.event.pk})
+        assert len(response.context['cl'].result_list) == 1
+
+
+class TestBulkActions(ResetSequencesMixin, TestCase):
+    """Массовые действия одним запросом на набор записей."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser(phone='+70000000000',
+                                                  username='+70000000000',
+                                                  password='admin')
+        now = timezone.now()
+        cls.users = [
+            User.objects.create(phone=f'+7999000000{index}',
+                                username=f'+7999000000{index}',
+                                subscription_expiration_date=date)
+            for index, date in enumerate((
+                None, now - datetime.timedelta(days=5),
+                now + datetime.timedelta(days=5)))]
+        cls.python = Competence.objects.create(name='Python')
+        cls.events = [Event.objects.create(title=f'Событие {index}',
+                                           start_date=now)
+                      for index in range(3)]
+
+    def setUp(self) -> None:
+        self.client.force_login(self.admin)
+
+    def action(self, url, action, objects, **data):
+        return self.client.post(url, {
+            'action': action, **data,
+            '_selected_action': [obj.pk for obj in objects]})
+
+    def test_extend_subscriptions(self):
+        """Продление одним UPDATE, истекшие и пустые - от текущей даты."""
+        response = self.action('/admin/api/user/', 'extend_subscriptions',
+                               self.users)
+        assert response.status_code == 200
+        assert 'Выбрано записей: 3' in response.content.decode()
+        # Now() в sqlite с точностью до секунды
+        before = timezone.now().replace(microsecond=0)
+        with CaptureQueriesContext(connection) as queries, \
+                override_settings(AUTH_TOKEN_CQ='token'):
+            response = self.action('/admin/api/user/',
+                                   'extend_subscriptions', self.users,
+                                   apply=1, days=10)
+        assert response.status_code == 302
+        assert len([query for query in queries
+                    if query['sql'].startswith('UPDATE')]) == 1
+        assert sorted(CrmSync.objects.values_list('user_id', flat=True)) == [
+            user.pk for user in self.users]
+        dates = [User.objects.get(pk=user.pk).subscription_expiration_date
+                 for user in self.users]
+        for date in dates[:2]:
+            assert before + datetime.timedelta(days=10) <= date
+            assert date < before + datetime.timedelta(days=11)
+        assert dates[2] == (self.users[2].subscription_expiration_date
+                            + datetime.timedelta(days=10))
+
+    def test_add_competence(self):
+        """Компетенция через таблицу связи, поиск и знакомые обновлены."""
+        self.users[0].competences.add(self.python)
+        PeopleSuggestion.objects.create(user=self.users[1],
+                                        computed_at=timezone.now())
+        with override_settings(AUTH_TOKEN_CQ='token'), \
+                CaptureQueriesContext(connection) as queries:
+            self.action('/admin/api/user/', 'add_competence', self.users,
+                        apply=1, competence=self.python.pk)
+        inserts = [query['sql'] for query in queries
+                   if query['sql'].startswith('INSERT')]
+        # связи и очередь CRM - INSERT ... SELECT по выборке админки
+        assert len(inserts) == 2
+        assert all('SELECT' in sql for sql in inserts)
+        assert CrmSync.objects.count() == 3
+        assert self.python.user_set.count() == 3
+        assert User.objects.get(pk=self.users[2].pk).search_document == (
+            'python')
+        assert PeopleSuggestion.objects.get().changed_at is not None
+
+    def test_add_tag(self):
+        """Тег города через таблицу связи обновляет индекс ленты."""
+        tag = Tags.objects.create(name='В Москве',
+                                  city=City.objects.create(name='Москва'))
+        self.events[0].tags.add(tag)
+        response = self.action('/admin/api/event/', 'add_tag', self.events,
+                               apply=1, tag=tag.pk)
+        assert response.status_code == 302
+        assert tag.event_set.count() == 3
+        assert CityEvent.objects.count() == 3
+
+    def test_atomic(self):
+        """Сбой на середине действия откатывает уже сделанные изменения."""
+        users = User.objects.filter(pk__in=[user.pk for user in self.users])
+        with mock.patch('api.bulk.queue_crm_sync', side_effect=RuntimeError), \
+                self.assertRaises(RuntimeError):
+            bulk.extend_subscriptions(users, 10)
+        assert list(users.order_by('pk').values_list(
+            'subscription_expiration_date', flat=True)) == [
+            user.subscription_expiration_date for user in self.users]
+        with mock.patch('api.bulk.mark_people_changed',
+                        side_effect=RuntimeError), \
+                self.assertRaises(RuntimeError):
+            bulk.add_competence(users, self.python)
+        assert not self.python.user_set.exists()
@@ -0,0 +1,136 @@
+"""Тесты асинхронных view под ASGI."""
+import asyncio
+import json
+from unittest import mock
+
+from django.test import TransactionTestCase, override_settings
+from prometheus_client import REGISTRY
+
+from api.benchmark import Sample, Target
+from api.concurrency_bench import (MODES, ASGIRunner, asgi_request,
+                                   run_asgi, run_concurrency_bench)
+from api.http_client import clients, close_http_client
+from api.models import Event, User
+from api.provider_stub import Profile, ProviderStub
+from api.tests.conftest import JWTClient
+from api.tracing import memory_exporter
+
+
+class TestAsyncViews(TransactionTestCase):
+    """ORM под ASGI идет в отдельном потоке Django, поэтому без TestCase."""
+
+    def setUp(self):
+        self.user = User.objects.create(phone='+79990000000',
+                                        username='+79990000000')
+        self.event = Event.objects.create(title='Форум',
+                                          start_date='2030-01-01T10:00Z')
+        self.sample = Sample(self.user)
+        self.target = Target('events/<int:pk>/',
+                             f'/api/events/{self.event.pk}/')
+
+    def request(self, target):
+        runner = ASGIRunner()
+        runner.authorize(self.sample.access_token())
+
+        async def main():
+            try:
+                return await asgi_request(runner.application, target,
+                                          runner.headers)
+            finally:
+                await close_http_client()
+
+        return asyncio.run(main())
+
+    def test_event_detail(self):
+        """Один процесс ждет Carrot quest для всех запросов сразу."""
+        carrot = Profile('fixed', (300,))
+        with ProviderStub(carrot=carrot) as stub, \
+                override_settings(**stub.settings()):
+            runner = ASGIRunner()
+            runner.authorize(self.sample.access_token())
+            results, _ = run_asgi(runner, [self.target] * 10, 10)
+        assert [status for _, status in results] == [200] * 10
+        assert stub.peak['carrot'] == 10
+        assert stub.outcomes['carrot', 'ok'] == 10
+
+    def test_wsgi_client_closed(self):
+        """Под WSGI клиент httpx цикла запроса закрывается после ответа."""
+        client = JWTClient()
+        client.credentials(
+            HTTP_AUTHORIZATION=f'Bearer {self.sample.access_token()}')
+        with ProviderStub() as stub, override_settings(**stub.settings()), \
+                mock.patch('httpx.AsyncClient.aclose',
+                           autospec=True) as aclose:
+            response = client.get(self.target.path)
+        assert response.status_code == 200
+        assert stub.outcomes['carrot', 'ok'] == 1
+        aclose.assert_awaited_once()
+        assert not clients
+
+    def test_carrot_failure(self):
+        """Отказ Carrot quest не ломает просмотр события."""
+        with ProviderStub(carrot=Profile(error_rate=1)) as stub, \
+                override_settings(**stub.settings()), \
+                self.assertLogs('api.carrot_crm_service', 'WARNING'):
+            response = self.request(self.target)
+        assert response['status'] == 200
+        assert json.loads(response['body'])['title'] == 'Форум'
+
+    def test_send_sms(self):
+        """Код уходит в smstraffic, пароль нового пользователя задан."""
+        phone = '+79990000001'
+        target = Target('send-sms/', '/api/send-sms/', 'post',
+                        {'phone': phone})
+        with ProviderStub() as stub, override_settings(DEBUG=False,
+                                                       **stub.settings()):
+            response = self.request(target)
+        assert response['status'] == 200
+        assert stub.code(phone)
+        assert User.objects.get(phone=phone).has_usable_password()
+
+        phone = '+79990000002'
+        target.data = {'phone': phone}
+        with ProviderStub(sms=Profile(error_rate=1)) as stub, \
+                override_settings(DEBUG=False, **stub.settings()):
+            response = self.request(target)
+        assert response['status'] == 400
+        assert 'Невозможно отправить смс' in response['body'].decode()
+
+    @override_settings(TRACING_ENABLED=True, TRACING_EXPORTER='memory',
+                       PROFILING_ENABLED=True, METRICS_ENABLED=True,
+                       SLOW_QUERY_LOG_ENABLED=True)
+    def test_optional_middleware(self):
+        """Включенные middleware не занимают поток Django на весь запрос."""
+        memory_exporter.clear()
+        response = self.request(self.target)
+        assert response['status'] == 200
+        assert 'server-timing' in response['headers']
+        trace, = memory_exporter.traces
+        assert response['headers']['x-trace-id'] == trace['trace_id']
+        assert any(span['name'] == 'db' for span in trace['spans'])
+
+        labels = {'route': 'api/events/<int:pk>/'}
+        queries = REGISTRY.get_sample_value('api_request_db_queries_sum',
+                                            labels)
+        carrot = Profile('fixed', (300,))
+        with ProviderStub(carrot=carrot) as stub, \
+                override_settings(**stub.settings()):
+            runner = ASGIRunner()
+            runner.authorize(self.sample.access_token())
+            results, _ = run_asgi(runner, [self.target] * 10, 10)
+        assert [status for _, status in results] == [200] * 10
+        assert stub.peak['carrot'] == 10
+        assert REGISTRY.get_sample_value('api_request_db_queries_sum',
+                                         labels) > queries
+
+    def test_bench(self):
+        """Под ASGI провайдера ждут все клиенты, под WSGI - по потоку."""
+        carrot = Profile('fixed', (200,))
+        with ProviderStub(carrot=carrot) as stub:
+            report = run_concurrency_bench(self.sample, stub, 'events',
+                                           MODES, [4], threads=2,
+                                           requests_count=8)
+        asgi, wsgi = report['results']
+        assert asgi['errors'] == wsgi['errors'] == 0
+        assert asgi['provider_peak'] == 4
+        assert wsgi['provider_peak'] <= 2
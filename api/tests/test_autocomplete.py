@@ -0,0 +1,80 @@
+"""Тесты подсказок по справочникам."""
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase
+from rest_framework import status
+
+from api.autocomplete import Autocomplete, PrefixIndex
+from api.models import City, User
+from api.tests.conftest import JWTClient, ResetSequencesMixin
+
+
+class TestPrefixIndex(SimpleTestCase):
+    """Поиск по префиксу в индексе."""
+
+    index = PrefixIndex(['Москва', 'Мосальск', 'Санкт-Петербург',
+                         'Орёл', 'Нижний Новгород', 'Великий Новгород'])
+
+    def test_prefix(self):
+        """Совпадение начала названия без учета регистра."""
+        assert self.index.search('мос', 10) == ['Мосальск', 'Москва']
+        assert self.index.search('МОСК', 10) == ['Москва']
+        assert self.index.search('казань', 10) == []
+        assert self.index.search(' ', 10) == []
+
+    def test_yo(self):
+        """Буквы е и ё не различаются."""
+        assert self.index.search('орел', 10) == ['Орёл']
+        assert self.index.search('Орё', 10) == ['Орёл']
+
+    def test_word_prefix(self):
+        """Совпадение начала слова внутри названия идет после начала."""
+        assert self.index.search('петер', 10) == ['Санкт-Петербург']
+        assert self.index.search('н', 10) == [
+            'Нижний Новгород', 'Великий Новгород']
+
+    def test_limit(self):
+        """Количество подсказок ограничено."""
+        assert self.index.search('мо', 1) == ['Мосальск']
+
+
+class TestAutocompleteView(ResetSequencesMixin, TestCase):
+    """Запросы подсказок."""
+
+    client_class = JWTClient
+
+    @classmethod
+    def setUpTestData(cls):
+        for name in ('Москва', 'Волгоград', 'Краснодар'):
+            City.objects.create(name=name)
+        cls.user = User.objects.create(phone='+73333333333',
+                                       username='+73333333333')
+
+    def setUp(self) -> None:
+        cache.clear()
+        Autocomplete.indexes.clear()
+        self.client.force_login(self.user)
+
+    def test_autocomplete(self):
+        """Подсказки строятся один раз и отдаются без запросов к таблице."""
+        response = self.client.get('/api/autocomplete/cities/', {'q': 'во'})
+        assert response.status_code == status.HTTP_200_OK
+        assert response.json() == ['Волгоград']
+        # остается только запрос пользователя при авторизации
+        with self.assertNumQueries(1):
+            self.client.get('/api/autocomplete/cities/', {'q': 'кр'})
+
+    def test_rebuild_on_change(self):
+        """Индекс перестраивается после смены версии таблицы."""
+        self.client.get('/api/autocomplete/cities/', {'q': 'к'})
+        with mock.patch('api.cache_service.transaction.on_commit',
+                        lambda func: func()):
+            City.objects.create(name='Казань')
+        response = self.client.get('/api/autocomplete/cities/', {'q': 'к'})
+        assert response.json() == ['Казань', 'Краснодар']
+
+    def test_unknown_kind(self):
+        """Неизвестный справочник."""
+        response = self.client.get('/api/autocomplete/users/', {'q': 'а'})
+        assert response.status_code == status.HTTP_404_NOT_FOUND
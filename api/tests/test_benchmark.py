@@ -0,0 +1,90 @@
+"""Тесты замеров маршрутов API."""
+import datetime
+import json
+import os
+import tempfile
+from io import StringIO
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.test import TestCase
+
+from api.benchmark import (QUERIES_HEADER, ClientRunner, Sample, api_targets,
+                           compare_results, count_queries, run_benchmark)
+from api.seeding import ScaleSeeder
+from api.tests.conftest import ResetSequencesMixin
+from api.urls import urlpatterns
+
+
+class TestBenchmark(ResetSequencesMixin, TestCase):
+    """Маршруты, замер тестовым клиентом и сравнение с базовой линией."""
+
+    @classmethod
+    def setUpTestData(cls):
+        ScaleSeeder(0.01, today=datetime.date.today(),
+                    log=lambda message: None).run()
+
+    def test_targets(self):
+        """Каждый маршрут либо замеряется, либо пропущен с причиной."""
+        targets, skipped = api_targets(Sample())
+        assert len(targets) + len(skipped) == len(urlpatterns)
+        assert all('<' not in target.path for target in targets)
+        assert 'send-sms/' in skipped
+
+    def test_client_run(self):
+        """Успешные ответы, перцентили по возрастанию и число SQL."""
+        sample = Sample()
+        targets, _ = api_targets(sample)
+        result = run_benchmark(ClientRunner(), sample, targets, 3, warmup=0)
+        assert set(result['routes']) == {target.route for target in targets}
+        for route, summary in result['routes'].items():
+            assert summary['errors'] == 0, (route, summary['statuses'])
+            assert summary['p50'] <= summary['p95'] <= summary['p99']
+            assert summary['bytes'] > 0
+        assert result['routes']['events/']['queries'] > 0
+        assert result['counts']['users'] == 100
+
+    def test_count_queries(self):
+        """WSGI обертка отдает число SQL запросов в заголовке."""
+        def app(environ, start_response):
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT 1')
+                cursor.execute('SELECT 2')
+            start_response('200 OK', [])
+            return [b'']
+
+        headers = []
+        count_queries(app)({}, lambda status, items, exc_info=None:
+                           headers.extend(items))
+        assert (QUERIES_HEADER, '2') in headers
+
+    def test_compare(self):
+        """Регрессия по росту p95 или числа запросов."""
+        def result(p95, queries):
+            return {'routes': {'events/': {'p95': p95, 'queries': queries,
+                                           'bytes': 100}}}
+
+        baseline = result(10, 5)
+        assert not compare_results(baseline, result(11, 5))[0]['regression']
+        assert compare_results(baseline, result(13, 5))[0]['regression']
+        assert compare_results(baseline, result(10, 6))[0]['regression']
+
+    def test_command(self):
+        """Сохранение результата и сравнение с ним."""
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'baseline.json')
+            call_command('bench_api', '--requests', '2', '--route', 'cities/',
+                         '--save', path, stdout=StringIO())
+            with open(path, encoding='utf-8') as file:
+                baseline = json.load(file)
+            assert list(baseline['routes']) == ['cities/']
+            call_command('bench_api', '--requests', '2', '--route', 'cities/',
+                         '--compare', path, '--tolerance', '1000',
+                         stdout=StringIO())
+            baseline['routes']['cities/']['queries'] = 0
+            with open(path, 'w', encoding='utf-8') as file:
+                json.dump(baseline, file)
+            with self.assertRaises(CommandError):
+                call_command('bench_api', '--requests', '2', '--route',
+                             'cities/', '--compare', path, stdout=StringIO())
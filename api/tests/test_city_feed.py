@@ -0,0 +1,85 @@
+"""Тесты ленты событий по городам."""
+import datetime
+
+from django.test import TestCase
+from django.utils import timezone
+
+from api.models import City, CityEvent, Event, Tags, User
+from api.tests.conftest import JWTClient, ResetSequencesMixin
+
+
+class TestCityFeed(ResetSequencesMixin, TestCase):
+    """Индекс событий городов и лента по городам."""
+
+    client_class = JWTClient
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.moscow = City.objects.create(name='Москва')
+        cls.volgograd = City.objects.create(name='Волгоград')
+        cls.moscow_tag = Tags.objects.create(name='В Москве',
+                                             city=cls.moscow)
+        cls.sport = Tags.objects.create(name='Спорт')
+        start = timezone.now() + datetime.timedelta(days=1)
+        cls.moscow_event = Event.objects.create(title='Московское',
+                                                start_date=start)
+        cls.moscow_event.tags.add(cls.moscow_tag, cls.sport)
+        cls.sport_event = Event.objects.create(title='Спортивное',
+                                               start_date=start)
+        cls.sport_event.tags.add(cls.sport)
+        cls.user = User.objects.create(phone='+74444444444',
+                                       username='+74444444444')
+
+    def setUp(self) -> None:
+        self.client.force_login(self.user)
+
+    def get_titles(self, url, data=None):
+        response = self.client.get(url, data)
+        return sorted(event['title'] for event in response.json()['results'])
+
+    def index(self):
+        return set(CityEvent.objects.values_list('city__name',
+                                                 'event__title'))
+
+    def test_index_on_tags_change(self):
+        """Индекс обновляется при изменении тегов события и города тега."""
+        assert self.index() == {('Москва', 'Московское')}
+        self.sport_event.tags.add(self.moscow_tag)
+        assert ('Москва', 'Спортивное') in self.index()
+        self.sport.city = self.volgograd
+        self.sport.save()
+        assert self.index() == {('Москва', 'Московское'),
+                                ('Москва', 'Спортивное'),
+                                ('Волгоград', 'Московское'),
+                                ('Волгоград', 'Спортивное')}
+        self.moscow_tag.event_set.clear()
+        assert self.index() == {('Волгоград', 'Московское'),
+                                ('Волгоград', 'Спортивное')}
+        self.sport.delete()
+        assert self.index() == set()
+
+    def test_index_start_date(self):
+        """Дата начала в индексе следует за событием."""
+        self.moscow_event.start_date -= datetime.timedelta(days=10)
+        self.moscow_event.save()
+        assert CityEvent.objects.get().start_date == (
+            self.moscow_event.start_date)
+        assert self.get_titles('/api/events/', {'city': 'Москва'}) == []
+
+    def test_filter_by_city(self):
+        """Фильтрация ленты по городу."""
+        assert self.get_titles('/api/events/', {'city': 'Москва'}) == [
+            'Московское']
+        assert self.get_titles('/api/events/',
+                               {'city': 'Москва', 'tags': 'Спорт'}) == [
+            'Московское']
+        assert self.get_titles('/api/events/', {'city': 'Волгоград'}) == []
+
+    def test_feed_by_user_cities(self):
+        """Лента по городам пользователя, без городов - все события."""
+        assert self.get_titles('/api/events/feed/') == [
+            'Московское', 'Спортивное']
+        self.user.city.add(self.moscow)
+        assert self.get_titles('/api/events/feed/') == ['Московское']
+        assert self.get_titles('/api/events/feed/',
+                               {'city': 'Волгоград'}) == []
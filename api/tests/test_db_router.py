@@ -0,0 +1,124 @@
+"""Тесты чтения из реплик."""
+import os
+import subprocess
+import sys
+from unittest import skipUnless
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, connections
+from django.test import TransactionTestCase, override_settings
+
+from api.db_router import pin_key, replica_lag
+from api.models import Event, User
+from api.tests.conftest import JWTClient
+
+REPLICA = 'replica_test'
+
+
+class QueryLog:
+    """execute_wrapper: SQL запросы соединения."""
+
+    def __init__(self) -> None:
+        """Инициализатор класса."""
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        """Запись запроса."""
+        self.queries.append(sql)
+        return execute(sql, params, many, context)
+
+
+@override_settings(DATABASE_REPLICAS=[REPLICA], REPLICA_LAG_CHECK_SECONDS=0)
+@skipUnless(connection.vendor == 'postgresql', 'реплики postgres')
+class TestReplicaRouter(TransactionTestCase):
+    """Реплика - второе соединение с тестовой базой, поэтому без TestCase.
+
+    Для проверки с двумя локальными базами достаточно копии основной базы
+    (createdb -T app app_replica) и POSTGRES_REPLICAS=localhost/app_replica.
+    """
+
+    databases = {'default', REPLICA}
+
+    @classmethod
+    def setUpClass(cls):
+        connections.databases[REPLICA] = dict(connections.databases['default'])
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        connections[REPLICA].close()
+        del connections.databases[REPLICA]
+
+    def setUp(self):
+        replica_lag.clear()
+        self.user = User.objects.create(phone='+79990000000',
+                                        username='+79990000000')
+        self.event = Event.objects.create(title='Форум',
+                                          start_date='2030-01-01T10:00Z')
+        self.client = JWTClient()
+        self.client.force_login(self.user)
+
+    def request(self, method, path):
+        primary, replica = QueryLog(), QueryLog()
+        with connections['default'].execute_wrapper(primary), \
+                connections[REPLICA].execute_wrapper(replica):
+            response = getattr(self.client, method)(path)
+        return response, primary.queries, replica.queries
+
+    def test_reads(self):
+        """Чтения api идут в реплику, вне api - в основную базу."""
+        response, primary, replica = self.request('get', '/api/events/')
+        assert response.status_code == 200
+        assert primary == []
+        assert any('"api_event"' in sql for sql in replica)
+        _, primary, replica = self.request('get', '/metrics')
+        assert replica == []
+
+    def test_write_stickiness(self):
+        """После записи чтения пользователя закреплены за основной базой."""
+        response, primary, _ = self.request(
+            'post', f'/api/events/{self.event.pk}/')
+        assert response.status_code == 201
+        assert any('INSERT INTO "api_participation"' in sql
+                   for sql in primary)
+        _, primary, replica = self.request('get', f'/api/users/'
+                                                  f'{self.user.pk}/events/')
+        assert replica == []
+        assert any('"api_participation"' in sql for sql in primary)
+        cache.delete(pin_key(self.user.pk))
+        _, primary, replica = self.request('get', f'/api/users/'
+                                                  f'{self.user.pk}/events/')
+        assert any('"api_participation"' in sql for sql in replica)
+
+    @override_settings(REPLICA_MAX_LAG=-1)
+    def test_lag_fallback(self):
+        """Реплика с отставанием больше порога не используется."""
+        response, primary, replica = self.request('get', '/api/events/')
+        assert response.status_code == 200
+        assert any('"api_event"' in sql for sql in primary)
+        # в реплику уходят только проверки отставания
+        assert all('pg_is_in_recovery' in sql for sql in replica)
+
+    @override_settings(DATABASE_REPLICAS=[])
+    def test_disabled(self):
+        """Без реплик все запросы идут в основную базу."""
+        _, primary, replica = self.request('get', '/api/events/')
+        assert primary and replica == []
+
+
+def test_replicas_need_shared_cache():
+    """С репликами и локальным кэшем настройки не загружаются."""
+    env = {name: value for name, value in os.environ.items()
+           if name not in ('CACHE_BACKEND', 'DB_ENGINE')}
+    env |= {'POSTGRES_REPLICAS': 'replica', 'DJANGO_SETTINGS_MODULE':
+            'app.settings'}
+    script = 'import django; django.setup()'
+    result = subprocess.run([sys.executable, '-c', script], env=env,
+                            cwd=settings.BASE_DIR, capture_output=True,
+                            text=True)
+    assert 'ImproperlyConfigured' in result.stderr
+    env['CACHE_BACKEND'] = 'django.core.cache.backends.db.DatabaseCache'
+    subprocess.run([sys.executable, '-c', script], env=env, check=True,
+                   cwd=settings.BASE_DIR)
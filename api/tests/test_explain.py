@@ -0,0 +1,93 @@
+"""Тесты аудита планов SQL запросов."""
+import json
+from io import StringIO
+from unittest import skipUnless
+
+import pytest
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test import TestCase
+
+from api.benchmark import Sample
+from api.explain import (Catalog, audit_targets, compare_audits, plan_issues,
+                         run_audit)
+from api.models import Event, Participation, SMSAuth, Tags, User
+from api.tests.conftest import ResetSequencesMixin
+
+
+@skipUnless(connection.vendor == 'postgresql', 'EXPLAIN в формате postgres')
+class TestExplain(ResetSequencesMixin, TestCase):
+    """Планы запросов маршрутов, проблемы и сравнение с базовой линией."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(phone='+79990000000',
+                                       username='+79990000000')
+        cls.event = Event.objects.create(title='Форум',
+                                         start_date='2030-01-01T10:00Z')
+        cls.event.tags.add(Tags.objects.create(name='ит'))
+        Participation.objects.create(user=cls.user, event=cls.event)
+
+    def audit(self, *routes):
+        sample = Sample(self.user)
+        targets = [target for target in audit_targets(sample)
+                   if target.route in routes]
+        return run_audit(sample, targets, min_rows=0)
+
+    def test_audit(self):
+        """Запросы view с планами, изменения данных откатываются."""
+        result = self.audit('events/', 'send-sms/')
+        paths = {query['path'] for query in result['queries']}
+        assert '/api/events/?tags=ит&ordering=-start_date' in paths
+        sms = [query for query in result['queries']
+               if query['route'] == 'send-sms/']
+        assert any('"api_smsauth"' in query['shape'] for query in sms)
+        assert all(query['execution_ms'] is not None
+                   for query in result['queries'])
+        assert not SMSAuth.objects.exists()
+        issues = [issue for query in result['queries']
+                  for issue in query['issues']]
+        assert {'seq_scan'} <= {issue['kind'] for issue in issues}
+
+    def test_plan_issues(self):
+        """Подсказка индекса для фильтра и сортировки без индекса."""
+        plan = {'Plan': {
+            'Node Type': 'Sort', 'Sort Key': ['api_user.about DESC'],
+            'Actual Rows': 10, 'Actual Loops': 1, 'Plans': [{
+                'Node Type': 'Seq Scan', 'Relation Name': 'api_user',
+                'Filter': "((profession)::text = 'врач'::text)",
+                'Actual Rows': 10, 'Actual Loops': 1}]}}
+        issues = {issue['kind']: issue
+                  for issue in plan_issues(plan, Catalog(), min_rows=0)}
+        seq_scan_issue, sort_issue = issues['seq_scan'], issues['sort']
+        assert seq_scan_issue['columns'] == ['profession']
+        assert (seq_scan_issue['suggestion']
+                == 'CREATE INDEX ON api_user (profession)')
+        assert sort_issue['columns'] == ['about']
+        plan['Plan']['Sort Key'] = ['api_user.phone']
+        sort_issue = plan_issues(plan, Catalog(), min_rows=0)[0]
+        assert 'index' in sort_issue
+
+    def test_compare(self):
+        """Новая проблема плана относительно базовой линии."""
+        result = self.audit('events/')
+        assert compare_audits(result, result) == []
+        baseline = json.loads(json.dumps(result))
+        for query in baseline['queries']:
+            query['issues'] = []
+        regressions = compare_audits(baseline, result)
+        assert regressions
+        assert regressions[0]['issues'][0][0] in ('seq_scan', 'sort',
+                                                  'hash_join')
+
+    def test_command(self):
+        """JSON результат и ошибка при проблеме без индекса."""
+        out = StringIO()
+        call_command('explain_api', route=['tags/'], json=True, stdout=out,
+                     stderr=StringIO())
+        result = json.loads(out.getvalue())
+        assert {query['route'] for query in result['queries']} == {'tags/'}
+        with pytest.raises(CommandError, match='seq_scan'):
+            call_command('explain_api', route=['users/'], min_rows=0,
+                         fail_on=['seq_scan'], stdout=StringIO(),
+                         stderr=StringIO())
@@ -0,0 +1,81 @@
+"""Тесты потоковых выгрузок."""
+import csv
+import datetime
+import os
+import tempfile
+from io import BytesIO, StringIO
+
+import openpyxl
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils import timezone
+
+from api.models import Event, Favorite, Participation, User
+from api.tests.conftest import ResetSequencesMixin
+
+
+class TestExports(ResetSequencesMixin, TestCase):
+    """Выгрузки в админке и командой."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser(phone='+70000000000',
+                                                  username='+70000000000',
+                                                  password='admin')
+        cls.start = timezone.make_aware(datetime.datetime(2030, 1, 1, 10))
+        cls.event = Event.objects.create(title='Форум', start_date=cls.start)
+        cls.other = Event.objects.create(title='Встреча',
+                                         start_date=cls.start)
+        cls.user = User.objects.create(phone='+79990000000',
+                                       username='+79990000000',
+                                       first_name='Иван', last_name='Иванов',
+                                       subscription_expiration_date=cls.start)
+        Participation.objects.create(user=cls.user, event=cls.event)
+        Participation.objects.create(user=cls.admin, event=cls.other)
+        Favorite.objects.create(user=cls.user, event=cls.other)
+
+    def setUp(self) -> None:
+        self.client.force_login(self.admin)
+
+    def action(self, url, action, pks):
+        return self.client.post(url, {'action': action,
+                                      '_selected_action': pks})
+
+    def test_users_csv_action(self):
+        """CSV пользователей отдается потоком."""
+        response = self.action('/admin/api/user/', 'export_users_csv',
+                               [self.user.pk])
+        assert response.streaming
+        content = b''.join(response.streaming_content).decode('utf-8-sig')
+        rows = list(csv.reader(StringIO(content)))
+        assert rows[0][:4] == ['Телефон', 'Фамилия', 'Имя', 'Подписка']
+        assert rows[1][:4] == ['+79990000000', 'Иванов', 'Иван',
+                               '2030-01-01 10:00:00']
+        assert len(rows) == 2
+
+    def test_participants_xlsx_action(self):
+        """XLSX участников выбранных событий."""
+        response = self.action('/admin/api/event/',
+                               'export_participants_xlsx', [self.event.pk])
+        book = openpyxl.load_workbook(BytesIO(b''.join(response)))
+        rows = list(book.active.values)
+        event_id, title, start, *user = rows[1]
+        assert (event_id, title) == (self.event.pk, 'Форум')
+        # Excel хранит даты числом, точность до миллисекунд
+        assert abs(start - datetime.datetime(2030, 1, 1, 10)) < (
+            datetime.timedelta(seconds=1))
+        assert user == ['+79990000000', 'Иванов', 'Иван']
+        assert len(rows) == 2
+
+    def test_command(self):
+        """Команда пишет CSV в stdout и XLSX в файл."""
+        out = StringIO()
+        call_command('export_data', 'favorites', stdout=out)
+        rows = list(csv.reader(StringIO(out.getvalue())))
+        assert [row[1] for row in rows[1:]] == ['Встреча']
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'participants.xlsx')
+            call_command('export_data', 'participants', '--format', 'xlsx',
+                         '--output', path, '--event', str(self.other.pk))
+            rows = list(openpyxl.load_workbook(path).active.values)
+        assert [row[3] for row in rows[1:]] == ['+70000000000']
@@ -0,0 +1,190 @@
+"""Тесты фоновых загрузок файлов из админки."""
+import datetime
+import shutil
+import tempfile
+from io import BytesIO, StringIO
+from unittest import mock
+
+import openpyxl
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from api.imports import ImportRunner, UsersImport, claim_job
+from api.models import City, Competence, CrmSync, Event, ImportJob, User
+from api.tests.conftest import ResetSequencesMixin
+from api.tests.test_user_import import make_file, make_rows
+
+EVENTS_HEAD = ('Название', 'Описание', 'Дата начала события',
+               'Дата окончания события')
+
+
+def make_workbook(rows) -> bytes:
+    """XLSX файл из строк."""
+    book = openpyxl.Workbook()
+    for row in rows:
+        book.active.append(row)
+    file = BytesIO()
+    book.save(file)
+    return file.getvalue()
+
+
+class TestImportJobs(ResetSequencesMixin, TestCase):
+    """Очередь загрузок, прогресс и продолжение после падения."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.media_root = tempfile.mkdtemp()
+        cls.media = override_settings(MEDIA_ROOT=cls.media_root)
+        cls.media.enable()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.media.disable()
+        shutil.rmtree(cls.media_root, ignore_errors=True)
+        super().tearDownClass()
+
+    def create_job(self, kind, content, name='file.xlsx'):
+        return ImportJob.objects.create(
+            kind=kind, file=SimpleUploadedFile(name, content))
+
+    def run_jobs(self, chunk_size=2):
+        call_command('run_import_jobs', '--once', '--chunk-size',
+                     str(chunk_size), stdout=StringIO())
+
+    def test_admin_queues_file(self):
+        """Форма загрузки сохраняет файл в очередь без обработки."""
+        admin = User.objects.create_superuser(phone='+70000000000',
+                                              username='+70000000000',
+                                              password='admin')
+        self.client.force_login(admin)
+        response = self.client.post(
+            '/admin/api/user/import-users/',
+            {'xlsx_file': SimpleUploadedFile('users.xlsx',
+                                             make_file(make_rows(3)).read())})
+        assert response.status_code == 302
+        job = ImportJob.objects.get()
+        assert (job.kind, job.status) == ('users', ImportJob.PENDING)
+        assert User.objects.count() == 1
+        response = self.client.get(f'/admin/api/importjob/{job.pk}/change/')
+        assert response.status_code == 200
+
+    def test_users(self):
+        """Загрузка пользователей пачками с ошибками строк."""
+        rows = make_rows(4) + [(7999000000012345, 'Длинный', 'Номер', None)]
+        job = self.create_job('users', make_file(rows).read())
+        self.run_jobs()
+        job.refresh_from_db()
+        assert job.status == ImportJob.DONE
+        assert (job.total_rows, job.processed_rows, job.error_count) == (
+            5, 5, 1)
+        assert job.errors[0]['row'] == 6
+        assert job.rows_per_second > 0
+        assert User.objects.count() == 4
+
+    @override_settings(AUTH_TOKEN_CQ='token')
+    def test_users_crm_sync(self):
+        """Пользователи пачки в очереди CRM, воркер отправляет очередь."""
+        self.create_job('users', make_file(make_rows(3)).read())
+        with mock.patch('api.management.commands.run_import_jobs.'
+                        'process_sync_queue') as process:
+            process.return_value = {'sent': 0, 'failed': 0}
+            self.run_jobs()
+        assert CrmSync.objects.count() == 3
+        with mock.patch('api.user_import.requests.Session') as session:
+            self.run_jobs()
+        posts = session.return_value.__enter__.return_value.post
+        assert posts.call_count == 3
+        assert not CrmSync.objects.exists()
+
+    def test_events_all_rows(self):
+        """Загружаются все строки файла, а не первые 25."""
+        start = datetime.datetime(2030, 1, 1)
+        rows = [EVENTS_HEAD] + [
+            (f'Событие {index}', None, start, None) for index in range(30)]
+        self.create_job('events', make_workbook(rows))
+        self.create_job('events', make_workbook(rows))
+        self.run_jobs(chunk_size=7)
+        assert Event.objects.count() == 30
+        assert Event.objects.first().start_date == timezone.make_aware(start)
+        assert Event.objects.filter(description='').count() == 30
+
+    def test_references(self):
+        """Города из текста и компетенции из первого столбца."""
+        City.objects.create(name='Москва')
+        cities = self.create_job('cities',
+                                 'Москва\nКазань\n\nТверь\n'.encode(),
+                                 name='cities.txt')
+        self.create_job('competences',
+                        make_workbook([('Python',), ('Go',), ('Python',)]))
+        self.run_jobs()
+        assert sorted(City.objects.values_list('name', flat=True)) == [
+            'Казань', 'Москва', 'Тверь']
+        assert Competence.objects.count() == 2
+        cities.refresh_from_db()
+        assert (cities.total_rows, cities.processed_rows) == (3, 3)
+        assert set(ImportJob.objects.values_list('status', flat=True)) == {
+            ImportJob.DONE}
+
+    def test_resume(self):
+        """После падения загрузка продолжается с незакоммиченной пачки."""
+        job = self.create_job('users', make_file(make_rows(5)).read())
+        save = UsersImport.save
+        chunks = []
+
+        def crash_second_chunk(kind, items):
+            chunks.append(len(items))
+            if len(chunks) == 2:
+                raise RuntimeError('crash')
+            save(kind, items)
+
+        with mock.patch.object(UsersImport, 'save', crash_second_chunk):
+            ImportRunner(claim_job(), chunk_size=2).run()
+        job.refresh_from_db()
+        assert (job.status, job.processed_rows) == (ImportJob.FAILED, 2)
+        assert job.error == 'crash'
+        assert User.objects.count() == 2
+        ImportJob.objects.filter(pk=job.pk).update(
+            status=ImportJob.RUNNING,
+            updated_at=timezone.now() - datetime.timedelta(hours=1))
+        chunks.clear()
+        with mock.patch.object(UsersImport, 'save', crash_second_chunk):
+            self.run_jobs(chunk_size=3)
+        job.refresh_from_db()
+        assert (job.status, job.processed_rows) == (ImportJob.DONE, 5)
+        assert chunks == [3]
+        assert User.objects.count() == 5
+
+    def test_lease_lost(self):
+        """Воркер, у которого забрали зависшую задачу, не пишет пачки."""
+        job = self.create_job('users', make_file(make_rows(5)).read())
+        first = claim_job()
+        ImportJob.objects.filter(pk=job.pk).update(
+            updated_at=timezone.now() - datetime.timedelta(hours=1))
+        second = claim_job()
+        assert first.owner != second.owner
+        ImportRunner(first, chunk_size=2).run()
+        job.refresh_from_db()
+        assert (job.status, job.processed_rows) == (ImportJob.RUNNING, 0)
+        assert job.owner == second.owner
+        assert User.objects.count() == 0
+        ImportRunner(second, chunk_size=2).run()
+        job.refresh_from_db()
+        assert (job.status, job.processed_rows) == (ImportJob.DONE, 5)
+        assert User.objects.count() == 5
+
+    @override_settings(IMPORT_JOB_STALE_SECONDS=0)
+    def test_heartbeat(self):
+        """Аренда продлевается во время чтения строк файла."""
+        job = self.create_job('users', make_file(make_rows(3)).read())
+        runner = ImportRunner(claim_job(), chunk_size=10)
+        with mock.patch.object(ImportRunner, 'update',
+                               autospec=True,
+                               side_effect=ImportRunner.update) as update:
+            runner.run()
+        # total_rows, продление на каждой строке и итоговый статус
+        assert update.call_count == 5
+        job.refresh_from_db()
+        assert job.status == ImportJob.DONE
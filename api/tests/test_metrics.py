@@ -0,0 +1,123 @@
+"""Тесты метрик Prometheus."""
+import os
+import runpy
+import subprocess
+import sys
+import tempfile
+from unittest import mock
+
+from django.conf import settings
+from django.test import Client, TestCase, override_settings
+from prometheus_client import CollectorRegistry, REGISTRY, multiprocess
+
+from api.carrot_crm_service import CarrotQuest
+from api.models import City, ImportJob, User
+from api.provider_stub import Profile, ProviderStub
+from api.tests.conftest import JWTClient, ResetSequencesMixin
+
+
+def sample(name, **labels):
+    """Значение метрики процесса, 0 если серии еще нет."""
+    return REGISTRY.get_sample_value(name, labels) or 0
+
+
+@override_settings(METRICS_ENABLED=True, METRICS_TOKEN='secret')
+class TestMetrics(ResetSequencesMixin, TestCase):
+    """Эндпоинт /metrics и метрики запросов."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(phone='+79990000000',
+                                       username='+79990000000')
+        City.objects.create(name='Москва')
+        ImportJob.objects.create(kind='users', file='imports/users.xlsx')
+
+    def setUp(self):
+        self.client = JWTClient()
+        self.client.force_login(self.user)
+
+    def test_requests(self):
+        """Время, статус и SQL запросов по шаблону маршрута."""
+        labels = {'route': 'api/users/<int:pk>/', 'method': 'GET'}
+        count = sample('api_request_duration_seconds_count', **labels)
+        self.client.get(f'/api/users/{self.user.pk}/')
+        self.client.get('/api/users/0/')
+        assert sample('api_request_duration_seconds_count',
+                      **labels) == count + 2
+        assert sample('api_request_db_queries_sum',
+                      route=labels['route']) > 0
+        response = Client().get('/metrics',
+                                HTTP_AUTHORIZATION='Bearer secret')
+        assert response.status_code == 200
+        text = response.content.decode()
+        assert 'api_requests_total{method="GET",route="api/users/<int:pk>/"' \
+               ',status="404"}' in text
+        assert 'api_import_jobs{status="pending"} 1.0' in text
+
+    def test_outbound_and_cache(self):
+        """Ошибки провайдеров и попадания в кэш справочников."""
+        self.client.get('/api/autocomplete/cities/?q=мо')
+        hits = sample('api_cache_requests_total', cache='autocomplete',
+                      result='hit')
+        self.client.get('/api/autocomplete/cities/?q=мо')
+        assert sample('api_cache_requests_total', cache='autocomplete',
+                      result='hit') == hits + 1
+        errors = sample('api_outbound_errors_total', provider='carrot')
+        with ProviderStub(carrot=Profile(error_rate=1)) as stub, \
+                override_settings(**stub.settings()):
+            CarrotQuest(self.user.pk).send_event('событие')
+        assert sample('api_outbound_errors_total',
+                      provider='carrot') == errors + 1
+
+    def test_token(self):
+        """Без токена доступ закрыт, без METRICS_TOKEN - кроме DEBUG."""
+        client = Client()
+        assert client.get('/metrics').status_code == 403
+        response = client.get('/metrics', HTTP_AUTHORIZATION='Bearer other')
+        assert response.status_code == 403
+        response = client.get('/metrics', HTTP_AUTHORIZATION='Bearer secret')
+        assert response.status_code == 200
+        with override_settings(METRICS_TOKEN=None):
+            assert client.get('/metrics').status_code == 403
+            with override_settings(DEBUG=True):
+                assert client.get('/metrics').status_code == 200
+
+    @override_settings(METRICS_ENABLED=False)
+    def test_disabled(self):
+        """Без METRICS_ENABLED эндпоинта нет."""
+        assert self.client.get('/metrics').status_code == 404
+
+
+def test_multiprocess():
+    """Значения процессов суммируются через файлы каталога."""
+    script = ('import django; django.setup(); '
+              'from api import metrics; '
+              'metrics.listener.cache("reference", True)')
+    with tempfile.TemporaryDirectory() as directory:
+        env = os.environ | {'PROMETHEUS_MULTIPROC_DIR': directory,
+                            'DJANGO_SETTINGS_MODULE': 'app.settings'}
+        for _ in range(2):
+            subprocess.run([sys.executable, '-c', script], env=env,
+                           check=True, cwd=settings.BASE_DIR)
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry, path=directory)
+        assert registry.get_sample_value(
+            'api_cache_requests_total',
+            {'cache': 'reference', 'result': 'hit'}) == 2
+
+
+def test_gunicorn_hooks():
+    """Каталог метрик очищается при запуске, воркер помечается при выходе."""
+    hooks = runpy.run_path(os.path.join(settings.BASE_DIR,
+                                        'gunicorn.conf.py'))
+    with tempfile.TemporaryDirectory() as directory:
+        stale = os.path.join(directory, 'counter_1.db')
+        gauge = os.path.join(directory, 'gauge_livesum_2.db')
+        with mock.patch.dict(os.environ,
+                             {'PROMETHEUS_MULTIPROC_DIR': directory}):
+            open(stale, 'w').close()
+            hooks['on_starting'](None)
+            assert not os.path.exists(stale)
+            open(gauge, 'w').close()
+            hooks['child_exit'](None, mock.Mock(pid=2))
+            assert not os.path.exists(gauge)
@@ -0,0 +1,104 @@
+"""Тесты расчета возможных знакомых."""
+import datetime
+from unittest import mock
+
+from django.test import TestCase
+from django.utils import timezone
+
+from api.models import Competence, Event, Participation, PeopleSuggestion, User
+from api.recommendations import PeopleSuggestionBuilder
+from api.tests.conftest import JWTClient, ResetSequencesMixin
+
+
+class TestPeopleSuggestions(ResetSequencesMixin, TestCase):
+    """Граф совместных участий и компетенций."""
+
+    client_class = JWTClient
+
+    @classmethod
+    def setUpTestData(cls):
+        start = timezone.now() + datetime.timedelta(days=1)
+        cls.small = Event.objects.create(title='Встреча', start_date=start)
+        cls.big = Event.objects.create(title='Форум', start_date=start)
+        cls.python = Competence.objects.create(name='Python')
+        cls.users = [User.objects.create(phone=f'+7999000000{index}',
+                                         username=f'+7999000000{index}',
+                                         photo='photo.jpg')
+                     for index in range(4)]
+        first, second, third, fourth = cls.users
+        for user in cls.users:
+            Participation.objects.create(user=user, event=cls.big)
+        Participation.objects.create(user=first, event=cls.small)
+        Participation.objects.create(user=second, event=cls.small)
+        first.competences.add(cls.python)
+        third.competences.add(cls.python)
+
+    def suggested(self, user):
+        users = PeopleSuggestion.objects.get(user=user).users
+        return [self.users.index(User.objects.get(pk=pk)) for pk in users]
+
+    def test_build(self):
+        """Редкие общие события и компетенции весят больше."""
+        stats = PeopleSuggestionBuilder(top_k=10).build()
+        assert stats == {**stats, 'users': 4, 'refreshed': 4, 'stored': 4}
+        assert self.suggested(self.users[0]) == [1, 2, 3]
+        assert self.suggested(self.users[3]) == [0, 1, 2]
+        PeopleSuggestionBuilder(top_k=1, chunk_size=1).build()
+        assert self.suggested(self.users[0]) == [1]
+
+    def test_chunks_by_nnz(self):
+        """Пачки ограничены оценкой размера матрицы близости."""
+        stats = PeopleSuggestionBuilder(top_k=10).build()
+        assert stats['chunks'] == 1
+        builder = PeopleSuggestionBuilder(top_k=10)
+        # у каждого пользователя в строке близости не меньше 4 элементов
+        builder.max_nnz = 4
+        assert builder.build()['chunks'] == 4
+        assert self.suggested(self.users[0]) == [1, 2, 3]
+        assert self.suggested(self.users[3]) == [0, 1, 2]
+
+    def test_incremental(self):
+        """Пересчет пользователя с новым участием и его соседей."""
+        PeopleSuggestionBuilder(top_k=10).build()
+        first, _, third, fourth = self.users
+        Participation.objects.create(user=fourth, event=self.small)
+        stats = PeopleSuggestionBuilder(top_k=10).build(incremental=True)
+        assert stats['refreshed'] == 4
+        assert self.suggested(fourth)[:2] == [0, 1]
+        stats = PeopleSuggestionBuilder(top_k=10).build(incremental=True)
+        assert stats['refreshed'] == 0
+        third.competences.remove(self.python)
+        newcomer = User.objects.create(phone='+79990000009',
+                                       username='+79990000009')
+        stats = PeopleSuggestionBuilder(top_k=10).build(incremental=True)
+        assert stats['refreshed'] == 5
+        assert PeopleSuggestion.objects.get(user=newcomer).users == []
+
+    def test_changed_rows_chunked(self):
+        """Соседи изменившихся пользователей считаются пачками по max_nnz."""
+        PeopleSuggestionBuilder(top_k=10).build()
+        Participation.objects.create(user=self.users[3], event=self.small)
+        self.users[2].competences.remove(self.python)
+        builder = PeopleSuggestionBuilder(top_k=10)
+        builder.load()
+        builder.max_nnz = 1
+        with mock.patch.object(builder, 'chunks',
+                               wraps=builder.chunks) as chunks:
+            assert builder.changed_rows().tolist() == [0, 1, 2, 3]
+        changed, = chunks.call_args.args
+        assert changed.tolist() == [2, 3]
+        assert len(list(builder.chunks(changed))) == 2
+
+    def test_view(self):
+        """Выдача знакомых только среди активных пользователей."""
+        PeopleSuggestionBuilder(top_k=10).build()
+        User.objects.filter(pk=self.users[2].pk).update(is_active=False)
+        self.client.force_login(self.users[0])
+        response = self.client.get('/api/users/suggested/')
+        assert response.status_code == 200
+        assert [user['phone'] for user in response.json()['results']] == [
+            '+79990000001', '+79990000003']
+        self.client.force_login(User.objects.create(phone='+79990000009',
+                                                    username='+79990000009'))
+        assert self.client.get('/api/users/suggested/').json()[
+            'results'] == []
@@ -0,0 +1,199 @@
+"""Тесты пула соединений с базой."""
+import asyncio
+import os
+import subprocess
+import sys
+import threading
+from unittest import skipUnless
+
+import pytest
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import DatabaseError, connection, connections
+from django.test import TransactionTestCase, override_settings
+from psycopg2 import OperationalError, extensions
+
+from api.db_benchmark import ConnectionBench
+from api.models import Event
+from api.pool.base import ConnectionPool, close_pools, pools
+
+POOLED = 'pooled_test'
+
+
+class FakeConnection:
+    """Соединение psycopg2 без базы."""
+
+    class Info:
+        transaction_status = extensions.TRANSACTION_STATUS_IDLE
+
+    def __init__(self) -> None:
+        """Инициализатор класса."""
+        self.closed = 0
+        self.info = self.Info()
+        self.broken = False
+
+    def cursor(self):
+        if self.broken:
+            raise OperationalError('server closed the connection')
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+    def execute(self, sql):
+        pass
+
+    def rollback(self):
+        self.info.transaction_status = extensions.TRANSACTION_STATUS_IDLE
+
+    def close(self):
+        self.closed = 1
+
+
+def fake_pool(size=2, timeout=0.05, check_after=0):
+    return ConnectionPool(FakeConnection, size, timeout, max_idle=300,
+                          check_after=check_after)
+
+
+def test_reuse_and_limit():
+    """Возвращенное соединение выдается снова, сверх размера - ошибка."""
+    pool = fake_pool()
+    first, second = pool.acquire(), pool.acquire()
+    with pytest.raises(OperationalError, match='Нет свободного соединения'):
+        pool.acquire()
+    pool.release(first)
+    assert pool.acquire() is first
+    assert pool.stats['opened'] == 2 and pool.stats['timeouts'] == 1
+    assert second.closed == 0
+
+
+def test_wait_for_release():
+    """Поток ждет соединение, возвращенное другим потоком."""
+    pool = fake_pool(size=1, timeout=5)
+    connection = pool.acquire()
+    timer = threading.Timer(0.05, pool.release, args=(connection,))
+    timer.start()
+    assert pool.acquire() is connection
+    timer.join()
+    assert pool.stats['waits'] >= 1
+
+
+def test_health_check():
+    """Неисправное свободное соединение заменяется новым."""
+    pool = fake_pool(size=1)
+    connection = pool.acquire()
+    pool.release(connection)
+    connection.broken = True
+    replacement = pool.acquire()
+    assert replacement is not connection
+    assert connection.closed
+    assert pool.stats['discarded'] == 1
+
+
+def test_release_rollback():
+    """Открытая транзакция откатывается при возврате, закрытое - удаляется."""
+    pool = fake_pool()
+    connection = pool.acquire()
+    connection.info.transaction_status = extensions.TRANSACTION_STATUS_INERROR
+    pool.release(connection)
+    assert connection.info.transaction_status == (
+        extensions.TRANSACTION_STATUS_IDLE)
+    assert pool.acquire() is connection
+    connection.close()
+    pool.release(connection)
+    assert pool.opened == 0
+
+
+@override_settings(DB_POOL_SIZE=2, DB_POOL_TIMEOUT=5)
+@skipUnless(connection.vendor == 'postgresql', 'пул соединений psycopg2')
+class TestPoolBackend(TransactionTestCase):
+    """Бэкенд api.pool: второе соединение с тестовой базой."""
+
+    databases = {'default', POOLED}
+
+    @classmethod
+    def setUpClass(cls):
+        connections.databases[POOLED] = {
+            **connections.databases['default'], 'ENGINE': 'api.pool',
+            'CONN_MAX_AGE': 0,
+            'OPTIONS': {'options': '-c statement_timeout=500'}}
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        connections[POOLED].close()
+        del connections.databases[POOLED]
+        close_pools()
+
+    def pool(self):
+        return next(pool for key, pool in pools.items() if key[0] == POOLED)
+
+    def test_close_returns_to_pool(self):
+        """После закрытия обертки соединение с сервером остается прежним."""
+        connection = connections[POOLED]
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_backend_pid()')
+            pid = cursor.fetchone()[0]
+        connection.close()
+        assert connection.connection is None
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_backend_pid()')
+            assert cursor.fetchone()[0] == pid
+
+    def test_statement_timeout(self):
+        """Запрос дольше statement_timeout прерывается сервером."""
+        with pytest.raises(DatabaseError, match='statement timeout'):
+            with connections[POOLED].cursor() as cursor:
+                cursor.execute('SELECT pg_sleep(2)')
+        connections[POOLED].close()
+        with connections[POOLED].cursor() as cursor:
+            cursor.execute('SELECT 1')
+
+    def test_sync_to_async_threads(self):
+        """Много потоков sync_to_async держат не больше 2 соединений."""
+        Event.objects.create(title='Форум', start_date='2030-01-01T10:00Z')
+
+        def count():
+            try:
+                return Event.objects.using(POOLED).count()
+            finally:
+                connections[POOLED].close()
+
+        async def run():
+            return await asyncio.gather(*[
+                sync_to_async(count, thread_sensitive=False)()
+                for _ in range(20)])
+
+        assert asyncio.run(run()) == [1] * 20
+        assert self.pool().opened <= 2
+
+    @override_settings(DB_POOL_SIZE=1)
+    def test_bench(self):
+        """Замер: новое соединение на запрос против пула при смене потоков."""
+        connect = ConnectionBench('connect', 2, 10, churn=True).run()
+        pool = ConnectionBench('pool', 2, 10, churn=True).run()
+        assert connect['errors'] == pool['errors'] == 0
+        assert connect['connections'] == 10
+        assert pool['connections'] == 1
+        assert pool['pool']['reused'] >= 9
+        close_pools()
+
+
+def test_statement_timeout_web_only():
+    """Предел времени запроса задается в веб процессе, но не в командах."""
+    env = {name: value for name, value in os.environ.items()
+           if name not in ('DB_ENGINE', 'WEB_PROCESS')}
+    env |= {'DB_STATEMENT_TIMEOUT': '500',
+            'DJANGO_SETTINGS_MODULE': 'app.settings'}
+    script = ('import {}; from django.conf import settings; '
+              'print(settings.DATABASES["default"]["OPTIONS"])')
+    outputs = [subprocess.run(
+        [sys.executable, '-c', script.format(module)], env=env,
+        cwd=settings.BASE_DIR, check=True, capture_output=True,
+        text=True).stdout for module in ('app.wsgi', 'django; django.setup()')]
+    assert 'statement_timeout=500' in outputs[0]
+    assert outputs[1].strip() == '{}'
@@ -0,0 +1,74 @@
+"""Тесты профилирования запросов."""
+import os
+import pstats
+import tempfile
+
+from django.test import TestCase, override_settings
+
+from api.instrumentation import RequestProfile, current_profile, phase
+from api.models import Event, User
+from api.tests.conftest import JWTClient, ResetSequencesMixin
+
+
+def test_phase_without_profile():
+    """Вне профилируемого запроса фаза ничего не записывает."""
+    with phase('db'):
+        pass
+    profile = RequestProfile()
+    token = current_profile.set(profile)
+    try:
+        with phase('db'):
+            pass
+        with phase('db'):
+            pass
+    finally:
+        current_profile.reset(token)
+    assert profile.phases['db'][1] == 2
+    assert 'db;dur=' in profile.server_timing()
+
+
+class TestProfilingMiddleware(ResetSequencesMixin, TestCase):
+    """Server-Timing, лог фаз и дампы профилей."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(phone='+79990000000',
+                                       username='+79990000000')
+        Event.objects.create(title='Форум', start_date='2030-01-01T10:00Z')
+
+    def get(self, path, **extra):
+        client = JWTClient()
+        client.force_login(self.user)
+        return client.get(path, **extra)
+
+    def test_disabled(self):
+        """Без PROFILING_ENABLED обработчик не подключен."""
+        response = self.get('/api/events/')
+        assert not response.has_header('Server-Timing')
+
+    @override_settings(PROFILING_ENABLED=True)
+    def test_server_timing(self):
+        """Фазы SQL, сериализации и рендеринга в заголовке и логе."""
+        with self.assertLogs('api.profiling') as logs:
+            response = self.get('/api/events/')
+        timing = response['Server-Timing']
+        for name in ('db', 'serialize', 'render', 'total'):
+            assert f'{name};dur=' in timing
+        assert '"view": "EventListView"' in logs.output[0]
+
+    def test_dumps(self):
+        """Дамп cProfile по заголовку и tracemalloc по выборке."""
+        with tempfile.TemporaryDirectory() as directory, override_settings(
+                PROFILING_ENABLED=True, PROFILING_ALLOW_HEADER=True,
+                PROFILING_DIR=directory):
+            self.get('/api/events/', HTTP_X_PROFILE='cprofile')
+            with override_settings(PROFILING_SAMPLE_RATE=1,
+                                   PROFILING_MODE='tracemalloc'):
+                self.get('/api/events/')
+            files = sorted(os.listdir(os.path.join(directory,
+                                                   'EventListView')))
+            assert [name.rsplit('.', 1)[1] for name in files] == ['prof',
+                                                                  'txt']
+            stats = pstats.Stats(os.path.join(directory, 'EventListView',
+                                              files[0]))
+            assert stats.total_calls > 0
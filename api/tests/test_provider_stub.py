@@ -0,0 +1,77 @@
+"""Тесты заглушки провайдеров и обработки их отказов."""
+import datetime
+import random
+
+import pytest
+from django.core.management import CommandError, call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework import status
+
+from api.carrot_crm_service import CarrotQuest
+from api.models import Event, User
+from api.provider_stub import Profile, ProviderStub
+from api.sms_service import SmsException, SmsTraffic
+from api.tests.conftest import JWTClient, ResetSequencesMixin
+
+
+def test_profile_parse():
+    """Профиль из строки и его распределение задержек."""
+    profile = Profile.parse('uniform:100:200,errors=0.5,timeouts=0.1,hang=3')
+    assert (profile.error_rate, profile.timeout_rate, profile.hang) == (
+        0.5, 0.1, 3)
+    rng = random.Random(1)
+    outcomes = [profile.outcome(rng) for _ in range(1000)]
+    assert {outcome for outcome, _ in outcomes} == {'ok', 'error',
+                                                    'timeout'}
+    assert all(0.1 <= delay <= 0.2 for outcome, delay in outcomes
+               if outcome != 'timeout')
+    assert Profile.parse('').latency(rng) == 0
+    with pytest.raises(ValueError):
+        Profile.parse('pareto:1')
+    with pytest.raises(ValueError):
+        Profile.parse('fixed:1,latency=2')
+    for spec in ('fixed', 'fixed:1:2', 'uniform:100', 'lognormal:200',
+                 'none:1', 'lognormal:0:0.5', 'fixed:-1', 'uniform:a:b'):
+        with pytest.raises(ValueError):
+            Profile.parse(spec)
+    with pytest.raises(CommandError, match='uniform'):
+        call_command('run_provider_stub', '--port', '0',
+                     '--sms', 'uniform:100')
+
+
+class TestProviderStub(ResetSequencesMixin, TestCase):
+    """Запросы к провайдерам через заглушку."""
+
+    client_class = JWTClient
+
+    def test_sms(self):
+        """Доставленная смс запоминается, ошибка и таймаут - SmsException."""
+        with ProviderStub() as stub, override_settings(**stub.settings()):
+            SmsTraffic().send_sms('+79990000000', 'Код для авторизации: 4321')
+            assert stub.code('+79990000000') == '4321'
+            stub.profiles['sms'] = Profile(error_rate=1)
+            with pytest.raises(SmsException):
+                SmsTraffic().send_sms('+79990000000', 'Код: 1234')
+            stub.profiles['sms'] = Profile(timeout_rate=1, hang=1)
+            with override_settings(PROVIDER_TIMEOUT=0.1), \
+                    pytest.raises(SmsException):
+                SmsTraffic().send_sms('+79990000000', 'Код: 1234')
+        assert stub.sent('+79990000000') == 1
+
+    def test_carrot_failures(self):
+        """Отказ Carrot quest не ломает просмотр события."""
+        user = User.objects.create(phone='+79990000001',
+                                   username='+79990000001')
+        event = Event.objects.create(title='Форум', start_date=timezone.now()
+                                     + datetime.timedelta(days=1))
+        self.client.force_login(user)
+        carrot = Profile(error_rate=0.5, timeout_rate=0.5, hang=1)
+        with ProviderStub(carrot=carrot, seed=1) as stub, override_settings(
+                PROVIDER_TIMEOUT=0.1, **stub.settings()):
+            for _ in range(4):
+                response = self.client.get(f'/api/events/{event.pk}/')
+                assert response.status_code == status.HTTP_200_OK
+            CarrotQuest(user.pk).send_event('событие')
+        assert stub.outcomes['carrot', 'ok'] == 0
+        assert sum(stub.outcomes.values()) >= 5
@@ -0,0 +1,86 @@
+"""Тесты журнала медленных SQL запросов и N+1."""
+import json
+
+from django.test import TestCase, override_settings
+
+from api.models import Event, Participation, Tags, User
+from api.querylog import query_shape
+from api.tests.conftest import JWTClient, ResetSequencesMixin
+
+
+def test_query_shape():
+    """Списки IN и VALUES разной длины дают одну форму."""
+    assert (query_shape('SELECT * FROM t WHERE id IN (%s, %s, %s)')
+            == query_shape('SELECT *  FROM t\nWHERE id IN (%s)'))
+    assert (query_shape('INSERT INTO t VALUES (%s, %s), (%s, %s)')
+            == query_shape('INSERT INTO t VALUES (%s, %s), (%s, %s), '
+                           '(%s, %s)'))
+
+
+@override_settings(SLOW_QUERY_LOG_ENABLED=True, NPLUSONE_THRESHOLD=3)
+class TestQueryLog(ResetSequencesMixin, TestCase):
+    """Привязка запросов к view, полям сериализатора и связям."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.event = Event.objects.create(title='Форум',
+                                         start_date='2030-01-01T10:00Z')
+        cls.event.tags.add(Tags.objects.create(name='ит'))
+        cls.users = []
+        for number in range(3):
+            phone = f'+7999000000{number}'
+            user = User.objects.create(phone=phone, username=phone)
+            event = Event.objects.create(title=f'Встреча {number}',
+                                         start_date='2030-01-01T10:00Z')
+            Participation.objects.create(user=user, event=cls.event)
+            Participation.objects.create(user=cls.users[0] if cls.users
+                                         else user, event=event)
+            cls.users.append(user)
+
+    def get(self, path):
+        client = JWTClient()
+        client.force_login(self.users[0])
+        with self.assertLogs('api.sql', 'WARNING') as logs:
+            response = client.get(path)
+        assert response.status_code == 200
+        return [json.loads(record.getMessage()) for record in logs.records]
+
+    def test_repeated_related_access(self):
+        """Ленивая загрузка пользователя участия в цикле view."""
+        records = self.get(f'/api/events/{self.event.pk}/users/')
+        repeated = [record for record in records
+                    if record['kind'] == 'repeated']
+        assert len(repeated) == 1
+        record = repeated[0]
+        assert record['view'] == 'ParticipantsListView'
+        # та же форма у загрузки пользователя при авторизации
+        assert record['count'] == 4
+        assert record['attribute'] == 'Participation.user'
+        assert record['field'] is None
+        assert record['stack'][0].startswith('api/views.py:')
+        assert '"api_user"' in record['shape']
+
+    def test_serializer_field(self):
+        """Запросы при сериализации привязываются к полю."""
+        records = self.get(f'/api/users/{self.users[0].pk}/events/')
+        fields = {record['field'] for record in records
+                  if record['kind'] == 'repeated'}
+        assert {'EventSerializer.tags', 'EventSerializer.photos'} <= fields
+
+    @override_settings(SLOW_QUERY_MS=0)
+    def test_slow(self):
+        """Медленные запросы пишутся каждый с текстом SQL."""
+        records = self.get(f'/api/events/{self.event.pk}/users/')
+        slow = [record for record in records if record['kind'] == 'slow']
+        assert len(slow) >= 4
+        assert all(record['view'] == 'ParticipantsListView'
+                   for record in slow)
+        assert all(record['sql'].startswith('SELECT') for record in slow)
+
+    @override_settings(SLOW_QUERY_LOG_ENABLED=False)
+    def test_disabled(self):
+        """Без SLOW_QUERY_LOG_ENABLED в лог ничего не пишется."""
+        client = JWTClient()
+        client.force_login(self.users[0])
+        with self.assertNoLogs('api.sql', 'WARNING'):
+            client.get(f'/api/events/{self.event.pk}/users/')
@@ -0,0 +1,105 @@
+"""Тесты пакетных рекомендаций событий."""
+import datetime
+from io import StringIO
+from unittest import mock
+
+import numpy as np
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils import timezone
+
+from api.models import (City, Competence, Event, EventRecommendation,
+                        Favorite, Tags, User)
+from api.recommendations import RecommendationBuilder
+from api.tests.conftest import JWTClient, ResetSequencesMixin
+
+
+class TestRecommendations(ResetSequencesMixin, TestCase):
+    """Расчет рекомендаций и выдача рекомендованных событий."""
+
+    client_class = JWTClient
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.moscow = City.objects.create(name='Москва')
+        cls.sport = Tags.objects.create(name='Спорт')
+        cls.music = Tags.objects.create(name='Музыка')
+        cls.moscow_tag = Tags.objects.create(name='В Москве',
+                                             city=cls.moscow)
+        start = timezone.now() + datetime.timedelta(days=1)
+        cls.past = Event.objects.create(
+            title='Прошедшее',
+            start_date=start - datetime.timedelta(days=10))
+        cls.past.tags.add(cls.sport)
+        cls.football = Event.objects.create(title='Футбол', start_date=start)
+        cls.football.tags.add(cls.sport)
+        cls.concert = Event.objects.create(title='Концерт', start_date=start)
+        cls.concert.tags.add(cls.music)
+        cls.festival = Event.objects.create(title='Фестиваль',
+                                            start_date=start)
+        cls.festival.tags.add(cls.music, cls.moscow_tag)
+        cls.user = User.objects.create(phone='+74444444444',
+                                       username='+74444444444')
+        Favorite.objects.create(user=cls.user, event=cls.past)
+        cls.musician = User.objects.create(phone='+75555555555',
+                                           username='+75555555555')
+        cls.musician.competences.add(
+            Competence.objects.create(name='музыка'))
+        cls.musician.city.add(cls.moscow)
+        Favorite.objects.create(user=cls.musician, event=cls.concert)
+
+    def get_titles(self):
+        response = self.client.get('/api/events/recommended/')
+        assert response.status_code == 200
+        return [event['title'] for event in response.json()['results']]
+
+    def recommended(self, user):
+        events = EventRecommendation.objects.get(user=user).events
+        return list(Event.objects.filter(pk__in=events)
+                    .values_list('title', flat=True))
+
+    def test_build(self):
+        """Рекомендации по тегам истории, компетенциям и городам."""
+        stats = RecommendationBuilder(top_n=10).build()
+        assert stats['users'] == 2
+        assert stats['events'] == 3
+        assert stats['stored'] == 2
+        assert self.recommended(self.user) == ['Футбол']
+        events = EventRecommendation.objects.get(user=self.musician).events
+        assert events == [self.festival.pk]
+
+    def test_top_n_and_chunks(self):
+        """Ограничение числа событий и расчет пачками по одному."""
+        builder = RecommendationBuilder(top_n=1, memory_mb=0)
+        assert builder.build()['chunk_size'] == 1
+        builder.load()
+        assert builder.score(np.arange(2)).dtype == np.float32
+        assert len(EventRecommendation.objects.get(
+            user=self.musician).events) == 1
+
+    def test_rebuild_replaces(self):
+        """Повторный расчет заменяет устаревшие рекомендации."""
+        call_command('build_recommendations', '--top-n', '10',
+                     stdout=StringIO())
+        Favorite.objects.filter(user=self.user).delete()
+        RecommendationBuilder(top_n=10).build()
+        assert not EventRecommendation.objects.filter(
+            user=self.user).exists()
+        User.objects.filter(pk=self.musician.pk).update(is_active=False)
+        RecommendationBuilder(top_n=10).build()
+        assert not EventRecommendation.objects.exists()
+
+    def test_view(self):
+        """Выдача рекомендаций, без расчета - ближайшие события."""
+        self.client.force_login(self.user)
+        assert sorted(self.get_titles()) == ['Концерт', 'Фестиваль',
+                                             'Футбол']
+        RecommendationBuilder(top_n=10).build()
+        assert self.get_titles() == ['Футбол']
+        # событие удалено между выборкой id и загрузкой страницы
+        with mock.patch('django.db.models.query.QuerySet.in_bulk',
+                        return_value={}):
+            assert self.get_titles() == []
+        self.football.start_date -= datetime.timedelta(days=10)
+        self.football.save()
+        assert self.get_titles() == []
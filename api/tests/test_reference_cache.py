@@ -0,0 +1,64 @@
+"""Тесты кэширования справочников."""
+from unittest import mock
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase
+from rest_framework import status
+
+from api.models import City, User
+from api.tests.conftest import JWTClient, ResetSequencesMixin
+
+
+class TestReferenceCache(ResetSequencesMixin, TestCase):
+    """Условные запросы к спискам городов, компетенций и тегов."""
+
+    client_class = JWTClient
+
+    @classmethod
+    def setUpTestData(cls):
+        call_command('seed')
+
+    def setUp(self) -> None:
+        cache.clear()
+        self.client.force_login(User.objects.first())
+
+    def test_etag_and_cache_control(self):
+        """Ответ содержит ETag и заголовок кэширования."""
+        for url in ('/api/cities/', '/api/competence/', '/api/tags/'):
+            response = self.client.get(url)
+            assert response.status_code == status.HTTP_200_OK
+            assert response['ETag'].startswith('"')
+            assert 'private' in response['Cache-Control']
+            assert len(response.json()) > 0
+
+    def test_not_modified(self):
+        """Повторный запрос с If-None-Match получает 304 без тела."""
+        response = self.client.get('/api/cities/')
+        # остается только запрос пользователя при авторизации
+        with self.assertNumQueries(1):
+            repeated = self.client.get('/api/cities/',
+                                       HTTP_IF_NONE_MATCH=response['ETag'])
+        assert repeated.status_code == status.HTTP_304_NOT_MODIFIED
+        assert repeated['ETag'] == response['ETag']
+        assert not repeated.content
+
+    def test_payload_is_cached(self):
+        """Собранный ответ берется из кэша без запроса к таблице."""
+        response = self.client.get('/api/competence/')
+        with self.assertNumQueries(1):
+            cached = self.client.get('/api/competence/')
+        assert cached.content == response.content
+
+    def test_invalidate_on_change(self):
+        """Изменение таблицы меняет версию и содержимое ответа."""
+        response = self.client.get('/api/cities/')
+        # в TestCase транзакция не фиксируется, вызываем on_commit сразу
+        with mock.patch('api.cache_service.transaction.on_commit',
+                        lambda func: func()):
+            City.objects.create(name='Казань')
+        changed = self.client.get('/api/cities/',
+                                  HTTP_IF_NONE_MATCH=response['ETag'])
+        assert changed.status_code == status.HTTP_200_OK
+        assert changed['ETag'] != response['ETag']
+        assert {'name': 'Казань'} in changed.json()
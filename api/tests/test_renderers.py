@@ -0,0 +1,107 @@
+"""Тесты рендерера JSON и сжатия ответов."""
+import datetime
+import decimal
+import gzip
+
+import brotli
+import orjson
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase
+from django.utils.translation import gettext_lazy
+from rest_framework import serializers
+from rest_framework.generics import GenericAPIView
+from rest_framework.test import APIRequestFactory
+
+from api.middleware import CompressionMiddleware, choose_encoding
+from api.renderers import ORJSONParser, ORJSONRenderer
+
+
+class ListSerializer(serializers.Serializer):
+    """Сериализатор со списком чисел."""
+
+    numbers = serializers.ListField(child=serializers.IntegerField())
+
+
+class ListView(GenericAPIView):
+    """Представление, проверяющее список."""
+
+    authentication_classes = ()
+    permission_classes = ()
+    serializer_class = ListSerializer
+
+    def post(self, request):
+        self.get_serializer(data=request.data).is_valid(raise_exception=True)
+
+
+class TestORJSONRenderer(SimpleTestCase):
+    """Рендерер и парсер на orjson."""
+
+    def test_render_types(self):
+        """Даты, Decimal и ленивые строки сериализуются как в DRF."""
+        data = {'date': datetime.datetime(2021, 5, 1, 10, 30,
+                                          tzinfo=datetime.timezone.utc),
+                'price': decimal.Decimal('10.5'),
+                'text': gettext_lazy('Город'), 'empty': None}
+        content = ORJSONRenderer().render(data)
+        assert content == ('{"date":"2021-05-01T10:30:00Z","price":10.5,'
+                           '"text":"Город","empty":null}').encode()
+
+    def test_render_none(self):
+        """Пустой ответ без тела."""
+        assert ORJSONRenderer().render(None) == b''
+
+    def test_parse(self):
+        """Разбор тела запроса."""
+        stream = type('Stream', (), {'read': lambda self: b'{"phone": "+7"}'})
+        assert ORJSONParser().parse(stream()) == {'phone': '+7'}
+
+    def test_list_field_error(self):
+        """Ошибка элемента списка с ключом int отдается как 400."""
+        request = APIRequestFactory().post(
+            '/', {'numbers': [1, 'x']}, format='json')
+        response = ListView.as_view()(request).render()
+        assert response.status_code == 400
+        assert list(orjson.loads(response.content)['numbers']) == ['1']
+
+
+class TestCompressionMiddleware(SimpleTestCase):
+    """Сжатие ответов api."""
+
+    content = '{"title": "Событие"}'.encode() * 200
+
+    def get_response(self, path='/api/events/', encoding='gzip, br',
+                     content=content):
+        request = RequestFactory().get(path, HTTP_ACCEPT_ENCODING=encoding)
+        middleware = CompressionMiddleware(
+            lambda request: HttpResponse(content))
+        return middleware(request)
+
+    def test_choose_encoding(self):
+        """Выбор кодировки по весам Accept-Encoding."""
+        assert choose_encoding('gzip, deflate, br') == 'br'
+        assert choose_encoding('gzip, br;q=0') == 'gzip'
+        assert choose_encoding('br;q=0.5, gzip;q=0.8') == 'gzip'
+        assert choose_encoding('identity') is None
+        assert choose_encoding('*') == 'br'
+
+    def test_brotli(self):
+        """Brotli при поддержке клиентом."""
+        response = self.get_response()
+        assert response['Content-Encoding'] == 'br'
+        assert brotli.decompress(response.content) == self.content
+        assert 'Accept-Encoding' in response['Vary']
+
+    def test_gzip(self):
+        """Gzip, если brotli не поддерживается."""
+        response = self.get_response(encoding='gzip')
+        assert response['Content-Encoding'] == 'gzip'
+        assert gzip.decompress(response.content) == self.content
+
+    def test_skip(self):
+        """Маленькие ответы и пути вне api не сжимаются."""
+        assert not self.get_response(content=b'{}').has_header(
+            'Content-Encoding')
+        assert not self.get_response(path='/admin/').has_header(
+            'Content-Encoding')
+        assert not self.get_response(encoding='').has_header(
+            'Content-Encoding')
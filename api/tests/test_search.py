@@ -0,0 +1,82 @@
+"""Тесты поиска событий."""
+import datetime
+from unittest import skipUnless
+
+from django.db import connection
+from django.test import TestCase
+from django.utils import timezone
+from rest_framework import status
+
+from api.models import Event, User
+from api.tests.conftest import JWTClient, ResetSequencesMixin
+
+
+class TestEventSearch(ResetSequencesMixin, TestCase):
+    """Полнотекстовый поиск по событиям."""
+
+    client_class = JWTClient
+
+    @classmethod
+    def setUpTestData(cls):
+        start = timezone.now() + datetime.timedelta(days=1)
+        Event.objects.create(title='Концерт джазовой музыки',
+                             address='Москва, Тверская', start_date=start)
+        Event.objects.create(title='Лекция', address='Волгоград',
+                             description='После лекции небольшой концерт',
+                             start_date=start)
+        Event.objects.create(title='Прошедший концерт', address='Москва',
+                             start_date=start - datetime.timedelta(days=10))
+        for number in range(7):
+            Event.objects.create(title=f'Кинопоказ {number}',
+                                 address='Краснодар', start_date=start)
+        cls.user = User.objects.create(phone='+71111111111',
+                                       username='+71111111111')
+
+    def setUp(self) -> None:
+        self.client.force_login(self.user)
+
+    @skipUnless(connection.vendor == 'postgresql', 'морфология в postgres')
+    def test_search_ranked(self):
+        """Поиск учитывает словоформы и сортирует по релевантности."""
+        response = self.client.get('/api/events/search/',
+                                   {'q': 'концерты'})
+        assert response.status_code == status.HTTP_200_OK
+        titles = [event['title'] for event in response.json()['results']]
+        # прошедшие события не попадают в выдачу
+        assert titles == ['Концерт джазовой музыки', 'Лекция']
+        assert 'search_vector' not in response.json()['results'][0]
+
+    def test_search_by_address(self):
+        """Поиск по адресу."""
+        response = self.client.get('/api/events/search/',
+                                   {'q': 'Волгоград'})
+        titles = [event['title'] for event in response.json()['results']]
+        assert titles == ['Лекция']
+
+    def test_search_keyset_pagination(self):
+        """Постраничный вывод результатов по курсору."""
+        response = self.client.get('/api/events/search/',
+                                   {'q': 'Кинопоказ'})
+        first_page = response.json()
+        assert len(first_page['results']) == 5
+        next_page = self.client.get(first_page['next']).json()
+        assert len(next_page['results']) == 2
+        assert next_page['next'] is None
+        ids = {event['id'] for event in first_page['results']}
+        assert not ids & {event['id'] for event in next_page['results']}
+
+    def test_search_updates_on_change(self):
+        """Поисковый индекс обновляется при изменении события."""
+        event = Event.objects.get(title='Лекция')
+        event.description = 'Выставка картин'
+        event.save()
+        response = self.client.get('/api/events/search/',
+                                   {'q': 'Выставка'})
+        assert [item['id'] for item in response.json()['results']] == [
+            event.pk]
+
+    def test_search_without_query(self):
+        """Запрос без строки поиска."""
+        response = self.client.get('/api/events/search/',
+                                   {'q': ''})
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
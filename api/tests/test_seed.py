@@ -0,0 +1,92 @@
+"""Тесты генерации данных по масштабу."""
+import datetime
+from io import StringIO
+from unittest import mock
+
+from django.core.management import CommandError, call_command
+from django.test import TestCase, override_settings
+
+from api.models import (CityEvent, Event, EventPhoto, Participation, SMSAuth,
+                        User)
+from api.seeding import SEED_PHOTO, ScaleSeeder
+from api.tests.conftest import ResetSequencesMixin
+
+TODAY = datetime.date(2030, 1, 1)
+
+
+def snapshot():
+    """Данные без id для сравнения прогонов."""
+    return (
+        sorted(User.objects.filter(is_superuser=False).values_list(
+            'phone', 'first_name', 'last_name',
+            'subscription_expiration_date', 'search_document')),
+        sorted(Event.objects.values_list('title', 'start_date',
+                                         'tags__name')),
+        sorted(Participation.objects.values_list('user__phone',
+                                                 'event__title')),
+        sorted(SMSAuth.objects.values_list('phone', 'code', 'send_at')))
+
+
+class TestScaleSeed(ResetSequencesMixin, TestCase):
+    """Детерминированная генерация пачками."""
+
+    def seed(self, **kwargs):
+        return ScaleSeeder(0.01, today=TODAY, log=lambda message: None,
+                           **kwargs).run()
+
+    def test_deterministic(self):
+        """Одинаковый seed дает одинаковые данные при любой записи."""
+        admin = User.objects.create_superuser(phone='+70000000000',
+                                              username='+70000000000',
+                                              password='admin')
+        stats = self.seed(seed=1)
+        assert stats['api_user'] == User.objects.count() - 1 == 100
+        assert stats['api_event'] == 20
+        assert stats['api_participation'] == Participation.objects.count()
+        assert SMSAuth.objects.filter(send_at__year=2029).exists()
+        # фото без файла, чтобы пользователи попадали в списки api
+        assert 80 <= User.objects.filter(photo=SEED_PHOTO).count() < 100
+        first = snapshot()
+        self.seed(seed=1, use_copy=True, batch_size=7)
+        assert snapshot() == first
+        self.seed(seed=2)
+        assert snapshot() != first
+        assert User.objects.filter(pk=admin.pk).exists()
+        assert CityEvent.objects.exists()
+
+    def test_on_delete(self):
+        """Очистка по правилам on_delete: фото события остается без него."""
+        self.seed()
+        photo = EventPhoto.objects.create(photo='photo.jpg',
+                                          event=Event.objects.first())
+        self.seed()
+        photo.refresh_from_db()
+        assert photo.event is None
+
+    @override_settings(DEBUG=True)
+    def test_command(self):
+        """Без --scale команда работает как раньше."""
+        call_command('seed', stdout=StringIO())
+        assert User.objects.count() == 5
+        out = StringIO()
+        call_command('seed', '--scale', '0.01', '--today', '2030-01-01',
+                     '--flush', '--no-input', stdout=out)
+        assert 'api_user: 100 rows' in out.getvalue()
+        assert User.objects.count() == 100
+
+    def test_command_flush(self):
+        """Перегенерация только при DEBUG, с --flush и подтверждением."""
+        call_command('seed', stdout=StringIO())
+        args = ('seed', '--scale', '0.01', '--today', '2030-01-01')
+        with self.assertRaisesMessage(CommandError, 'DEBUG'):
+            call_command(*args, '--flush', '--no-input')
+        with override_settings(DEBUG=True):
+            with self.assertRaisesMessage(CommandError, '--flush'):
+                call_command(*args, '--no-input')
+            with mock.patch('builtins.input', return_value='no'), \
+                    self.assertRaisesMessage(CommandError, 'Отменено'):
+                call_command(*args, '--flush')
+            assert User.objects.count() == 5
+            with mock.patch('builtins.input', return_value='yes'):
+                call_command(*args, '--flush', stdout=StringIO())
+        assert User.objects.count() == 100
@@ -0,0 +1,44 @@
+"""Тесты нагрузочной проверки входа по смс."""
+from unittest import skipUnless
+
+from django.conf import settings
+from django.db import connection
+from django.test import TransactionTestCase, override_settings
+
+from api.models import SMSAuth, User
+from api.provider_stub import ProviderStub
+from api.stress import LoginStress, stress_phones
+
+
+@skipUnless(connection.vendor == 'postgresql', 'pg_stat_activity в postgres')
+class TestLoginStress(TransactionTestCase):
+    """Параллельные входы в отдельных соединениях, поэтому без TestCase."""
+
+    def test_invariants(self):
+        """Одновременные запросы кода одного номера не нарушают лимиты."""
+        phones = stress_phones(4)
+        report = LoginStress(phones, concurrency=8, burst=2,
+                             typo_rate=0.5).run()
+        assert report['violations'] == []
+        assert report['steps']['send-sms']['requests'] == 8
+        assert report['logins'] >= 1
+        assert User.objects.filter(phone__in=phones).count() == 4
+
+    def test_attempts_limit(self):
+        """После CODE_COUNT неверных кодов верный код не принимается."""
+        phone = stress_phones(1, start=100)[0]
+        with ProviderStub() as stub, override_settings(
+                DEBUG=False, SMS_TRAFFIC_API=stub.sms_url):
+            assert self.client.post('/api/send-sms/',
+                                    {'phone': phone}).status_code == 200
+            code = stub.code(phone)
+            assert stub.sent(phone) == 1
+            wrong = str(int(code) % 9000 + 1001)
+            for _ in range(settings.CODE_COUNT + 1):
+                response = self.client.post('/api/token/', {
+                    'phone': phone, 'password': wrong})
+                assert response.status_code == 400
+            response = self.client.post('/api/token/', {'phone': phone,
+                                                        'password': code})
+        assert response.status_code == 400
+        assert SMSAuth.objects.get(phone=phone).attempts == settings.CODE_COUNT
@@ -0,0 +1,109 @@
+"""Тесты трассировки запросов."""
+import os
+import tempfile
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+
+from api.models import Event, User
+from api.provider_stub import Profile, ProviderStub
+from api.tests.conftest import JWTClient, ResetSequencesMixin
+from api.tracing import memory_exporter
+
+TRACEPARENT = '00-0af7651916cd43dd8448eb211c80319c-b7ad6b7169203331-01'
+
+
+@override_settings(TRACING_ENABLED=True, TRACING_EXPORTER='memory')
+class TestTracing(ResetSequencesMixin, TestCase):
+    """Span view, SQL, сериализаторов, провайдеров и сигналов."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(phone='+79990000000',
+                                       username='+79990000000')
+        cls.event = Event.objects.create(title='Форум',
+                                         start_date='2030-01-01T10:00Z')
+
+    def setUp(self):
+        self.client = JWTClient()
+        self.client.force_login(self.user)
+        memory_exporter.clear()
+
+    def request(self, method, path, carrot=None, **extra):
+        with ProviderStub(carrot=carrot) as stub, \
+                override_settings(**stub.settings()):
+            response = getattr(self.client, method)(path, **extra)
+        trace, = memory_exporter.traces
+        assert response['X-Trace-Id'] == trace['trace_id']
+        return response, trace
+
+    def test_event_detail(self):
+        """Carrot quest, SQL и сериализатор внутри span view."""
+        response, trace = self.request('get', f'/api/events/{self.event.pk}/')
+        assert response.status_code == 200
+        assert trace['name'] == 'GET api/events/<int:pk>/'
+        root, = [item for item in trace['spans']
+                 if item['parent_id'] is None]
+        assert root['attributes']['view'] == 'EventDetailView'
+        assert root['attributes']['http.status_code'] == 200
+        names = {item['name'] for item in trace['spans']}
+        assert {'db', 'serialize', 'carrot'} <= names
+        carrot, = [item for item in trace['spans']
+                   if item['name'] == 'carrot']
+        assert carrot['parent_id'] == root['span_id']
+        assert carrot['attributes'] == {'carrot.uri': 'events'}
+        assert any(item['attributes'].get('serializer') == 'EventSerializer'
+                   for item in trace['spans'])
+        assert any('"api_event"' in item['attributes'].get('db.statement', '')
+                   for item in trace['spans'])
+
+    def test_signal_and_log_context(self):
+        """Span обработчиков сигналов и trace_id в записях логов."""
+        with self.assertLogs('api.carrot_crm_service', 'WARNING') as logs:
+            response, trace = self.request(
+                'post', f'/api/events/{self.event.pk}/',
+                carrot=Profile(error_rate=1))
+        assert response.status_code == 201
+        signal, = [item for item in trace['spans']
+                   if item['attributes'].get('code.function')
+                   == 'create_new_participation']
+        carrot = [item for item in trace['spans']
+                  if item['parent_id'] == signal['span_id']
+                  and item['name'] == 'carrot']
+        assert carrot[0]['status'] == 'error'
+        assert logs.records[0].trace_id == trace['trace_id']
+        assert logs.records[0].span_id == signal['span_id']
+
+    def test_traceparent(self):
+        """Входящий traceparent продолжает трассу вызывающей стороны."""
+        _, trace = self.request('get', '/api/events/0/',
+                                HTTP_TRACEPARENT=TRACEPARENT)
+        assert trace['trace_id'] == '0af7651916cd43dd8448eb211c80319c'
+        root, = [item for item in trace['spans']
+                 if item['parent_id'] == 'b7ad6b7169203331']
+        assert root['attributes']['http.status_code'] == 404
+
+    def test_file_exporter(self):
+        """Трассы в файле и их просмотр командой show_traces."""
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'traces.jsonl')
+            with override_settings(TRACING_EXPORTER='file', TRACING_FILE=path):
+                client = JWTClient()
+                client.force_login(self.user)
+                client.get(f'/api/events/{self.event.pk}/')
+                client.get(f'/api/users/{self.user.pk}/')
+            out = StringIO()
+            call_command('show_traces', file=path, view='EventDetailView',
+                         stdout=out)
+        lines = out.getvalue().splitlines()
+        assert 'GET api/events/<int:pk>/' in lines[0]
+        assert any(line.split()[2] == 'db' for line in lines[1:])
+        assert not any('api/users' in line for line in lines)
+
+    @override_settings(TRACING_ENABLED=False)
+    def test_disabled(self):
+        """Без TRACING_ENABLED трассы не пишутся."""
+        response = self.client.get(f'/api/events/{self.event.pk}/')
+        assert not response.has_header('X-Trace-Id')
+        assert memory_exporter.traces == []
@@ -0,0 +1,119 @@
+"""Тесты потоковой загрузки пользователей."""
+import datetime
+from io import BytesIO
+from unittest import mock
+
+import openpyxl
+from django.db import connection
+import requests
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from api.models import CrmSync, User
+from api.tests.conftest import ResetSequencesMixin
+from api.user_import import UserImporter, process_sync_queue, read_rows
+
+HEAD = ('Телефон', 'Фамилия', 'Имя', 'Подписка')
+
+
+def make_file(rows) -> BytesIO:
+    """XLSX файл с заголовком и строками."""
+    book = openpyxl.Workbook()
+    book.active.append(HEAD)
+    for row in rows:
+        book.active.append(row)
+    file = BytesIO()
+    book.save(file)
+    file.seek(0)
+    return file
+
+
+def make_rows(count, start=0):
+    """Строки пользователей с разными телефонами."""
+    return [(79990000000 + index, 'Иванов', f'Иван{index}',
+             datetime.datetime(2030, 1, 1)) for index in range(start,
+                                                               start + count)]
+
+
+class TestUserImport(ResetSequencesMixin, TestCase):
+    """Загрузка пачками без сигналов на каждую строку."""
+
+    def import_file(self, rows, chunk_size=100):
+        return UserImporter(chunk_size).import_rows(read_rows(make_file(rows)))
+
+    def test_import(self):
+        """Создание, обновление, нормализация телефона и поиск."""
+        User.objects.create(phone='+79990000001', username='+79990000001')
+        stats = self.import_file(make_rows(3) + [
+            ('+79990000002', 'Петров', 'Петр', None), (None, None, None)])
+        assert stats == {**stats, 'rows': 4, 'created': 2, 'updated': 1}
+        assert stats['rows_per_second'] > 0
+        user = User.objects.get(phone='+79990000002')
+        assert (user.username, user.last_name) == ('+79990000002', 'Петров')
+        assert user.subscription_expiration_date is None
+        user = User.objects.get(phone='+79990000001')
+        assert user.first_name == 'Иван1'
+        assert user.subscription_expiration_date == timezone.make_aware(
+            datetime.datetime(2030, 1, 1))
+        assert user.search_document == 'иван1 иванов'
+        stats = self.import_file(make_rows(3))
+        assert stats == {**stats, 'created': 0, 'updated': 1}
+
+    def test_queries_per_chunk(self):
+        """Число запросов зависит от числа пачек, а не строк."""
+        with CaptureQueriesContext(connection) as small:
+            self.import_file(make_rows(5))
+        with CaptureQueriesContext(connection) as large:
+            self.import_file(make_rows(40, start=10))
+        assert len(small) == len(large)
+        with CaptureQueriesContext(connection) as chunked:
+            self.import_file(make_rows(40, start=100), chunk_size=20)
+        assert len(chunked) == 2 * len(large)
+        assert User.objects.count() == 85
+
+    @override_settings(AUTH_TOKEN_CQ='token')
+    def test_crm_sync(self):
+        """Пользователи в очереди CRM, очередь уходит одной сессией."""
+        self.import_file(make_rows(3))
+        self.import_file(make_rows(1))
+        assert CrmSync.objects.count() == 3
+        User.objects.filter(phone='+79990000000').update(first_name='Петр')
+        self.import_file(make_rows(1))
+        assert CrmSync.objects.count() == 4
+        with mock.patch('api.user_import.requests.Session') as session:
+            assert process_sync_queue() == {'sent': 3, 'failed': 0}
+        session.assert_called_once()
+        posts = session.return_value.__enter__.return_value.post
+        assert posts.call_count == 3
+        assert posts.call_args.kwargs['json']['auth_token'] == 'token'
+        assert not CrmSync.objects.exists()
+
+    @override_settings(AUTH_TOKEN_CQ='token')
+    def test_crm_sync_on_save(self):
+        """Сохранение пользователя ставит его в очередь, кроме пароля."""
+        user = User.objects.create(phone='+79990000099',
+                                   username='+79990000099')
+        assert CrmSync.objects.filter(user=user).count() == 1
+        user.set_password('secret')
+        user.save(update_fields=['password'])
+        assert CrmSync.objects.filter(user=user).count() == 1
+        user.first_name = 'Петр'
+        user.save()
+        assert CrmSync.objects.filter(user=user).count() == 2
+
+    @override_settings(AUTH_TOKEN_CQ='token', CRM_SYNC_MAX_ATTEMPTS=2)
+    def test_crm_sync_failure(self):
+        """Ошибка CRM сохраняется, отправка повторяется после паузы."""
+        self.import_file(make_rows(1))
+        with mock.patch('api.user_import.requests.Session') as session:
+            session.return_value.__enter__.return_value.post.side_effect = (
+                requests.ConnectionError('down'))
+            assert process_sync_queue() == {'sent': 0, 'failed': 1}
+            assert process_sync_queue() == {'sent': 0, 'failed': 0}
+            CrmSync.objects.update(locked_until=timezone.now())
+            assert process_sync_queue() == {'sent': 0, 'failed': 1}
+            CrmSync.objects.update(locked_until=timezone.now())
+            assert process_sync_queue() == {'sent': 0, 'failed': 0}
+        task = CrmSync.objects.get()
+        assert (task.attempts, task.error) == (2, 'down')
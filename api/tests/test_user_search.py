@@ -0,0 +1,91 @@
+"""Тесты поиска пользователей."""
+from unittest import mock, skipUnless
+
+from django.core.files.base import ContentFile
+from django.db import connection
+from django.test import TestCase
+from rest_framework import status
+
+from api.models import Competence, User
+from api.tests.conftest import JWTClient, ResetSequencesMixin
+
+
+class TestUserSearch(ResetSequencesMixin, TestCase):
+    """Поиск по справочнику пользователей."""
+
+    client_class = JWTClient
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.design = Competence.objects.create(name='Дизайн')
+        users = (('Фёдор', 'Ковалёв', 'Архитектор'),
+                 ('Ольга', 'Орлова', 'Маркетолог'),
+                 ('Константин', 'Константинов', 'Программист'))
+        for number, (first_name, last_name, profession) in enumerate(users):
+            phone = f'+7222222222{number}'
+            User.objects.create(phone=phone, username=phone,
+                                first_name=first_name, last_name=last_name,
+                                profession=profession,
+                                photo=ContentFile('text', 'name'))
+        cls.user = User.objects.get(first_name='Ольга')
+
+    def setUp(self) -> None:
+        self.client.force_login(self.user)
+
+    def search(self, query):
+        response = self.client.get('/api/users/search/', {'q': query})
+        assert response.status_code == status.HTTP_200_OK
+        return [user['last_name'] for user in response.json()['results']]
+
+    def test_search_document(self):
+        """Поисковый текст обновляется при сохранении и смене компетенций."""
+        self.user.competences.add(self.design)
+        self.user.refresh_from_db()
+        assert self.user.search_document == 'ольга орлова маркетолог дизайн'
+        self.design.name = 'Графический дизайн'
+        self.design.save()
+        self.user.refresh_from_db()
+        assert 'графический дизайн' in self.user.search_document
+
+    def test_search_document_stale(self):
+        """Очистка владельцев и удаление компетенции убирают ее из поиска."""
+        self.user.competences.add(self.design)
+        self.design.user_set.clear()
+        self.user.refresh_from_db()
+        assert self.user.search_document == 'ольга орлова маркетолог'
+        self.user.competences.add(self.design)
+        self.design.delete()
+        self.user.refresh_from_db()
+        assert self.user.search_document == 'ольга орлова маркетолог'
+
+    def test_search_document_skipped(self):
+        """Сохранение пароля и названия без изменений не трогает поиск."""
+        self.user.competences.add(self.design)
+        self.design.refresh_from_db()
+        with mock.patch('api.signals.update_user_search_document') as user, \
+                mock.patch('api.signals.update_user_search_documents') \
+                as users:
+            self.user.set_password('secret')
+            self.user.save(update_fields=['password'])
+            self.design.save()
+        user.assert_not_called()
+        users.assert_not_called()
+
+    def test_search(self):
+        """Поиск по имени, профессии и компетенциям без учета регистра и ё."""
+        self.user.competences.add(self.design)
+        assert self.search('федор') == ['Ковалёв']
+        assert self.search('ОРЛОВА дизайн') == ['Орлова']
+        assert self.search('программист') == ['Константинов']
+        assert self.search('дизайн архитектор') == []
+
+    @skipUnless(connection.vendor == 'postgresql', 'триграммы в postgres')
+    def test_search_typo(self):
+        """Поиск с опечаткой."""
+        assert self.search('Констнтинов') == ['Константинов']
+        assert self.search('маркетолк') == ['Орлова']
+
+    def test_search_without_query(self):
+        """Запрос без строки поиска."""
+        response = self.client.get('/api/users/search/', {'q': ' '})
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
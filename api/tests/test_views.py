@@ -432,6 +432,17 @@ class TestAuth(TestCase):
         repeated_request = self.anon_client.post('/api/send-sms/', data=data)
         assert repeated_request.status_code == status.HTTP_400_BAD_REQUEST
 
+    def test_limited_sms_without_user(self):
+        """Запрос сверх лимита не создает пользователя."""
+        phone = '+7111111116'
+        SMSAuth.objects.bulk_create(SMSAuth(phone=phone, code=1111,
+                                            is_used=True)
+                                    for _ in range(settings.SMS_COUNT))
+        response = self.anon_client.post('/api/send-sms/',
+                                         data={'phone': phone})
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert not User.objects.filter(phone=phone).exists()
+
     def test_get_auth_token(self):
         """Получение токена."""
         data = {'phone': '+7111111113', "password": "1111"}
@@ -0,0 +1,231 @@
+"""Трассировка запросов в стиле OpenTelemetry без внешних зависимостей.
+
+Корневой span открывает TracingMiddleware, вложенные создают фазы
+instrumentation.phase: SQL, сериализация, smstraffic, Carrot quest и
+обработчики сигналов. Законченная трасса целиком уходит в экспортер:
+в память процесса или строкой JSON в файл. Идентификаторы совместимы с
+W3C traceparent, входящий заголовок продолжает трассу вызывающей стороны.
+"""
+import contextvars
+import json
+import logging
+import os
+import re
+import secrets
+import threading
+import time
+from contextlib import contextmanager
+
+# текущий span, None вне трассируемого запроса
+current_span = contextvars.ContextVar('current_span', default=None)
+re_traceparent = re.compile(
+    r'^[0-9a-f]{2}-(?P<trace_id>[0-9a-f]{32})-(?P<span_id>[0-9a-f]{16})'
+    r'-[0-9a-f]{2}$')
+
+
+class Trace:
+    """Законченные span одной трассы."""
+
+    def __init__(self, exporter, trace_id: str = None) -> None:
+        """Инициализатор класса."""
+        self.trace_id = trace_id or secrets.token_hex(16)
+        self.exporter = exporter
+        self.spans = []
+
+
+class Span:
+    """Отрезок времени трассы с атрибутами и статусом."""
+
+    def __init__(self, name: str, trace: Trace, parent_id: str = None,
+                 attributes: dict = None) -> None:
+        """Инициализатор класса, время отсчитывается с создания."""
+        self.name = name
+        self.trace = trace
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.attributes = dict(attributes or {})
+        self.status = 'ok'
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+
+    def fail(self, error: BaseException) -> None:
+        """Отметка ошибки span."""
+        self.status = 'error'
+        self.attributes['exception.type'] = type(error).__name__
+
+    def end(self) -> None:
+        """Завершение span, запись в трассу."""
+        self.end_ns = time.time_ns()
+        self.trace.spans.append(self)
+
+    def as_dict(self, length: int) -> dict:
+        """Span для экспорта, строковые атрибуты обрезаются до length."""
+        return {
+            'name': self.name, 'span_id': self.span_id,
+            'parent_id': self.parent_id, 'status': self.status,
+            'start_ns': self.start_ns,
+            'ms': round((self.end_ns - self.start_ns) / 1e6, 3),
+            'attributes': {key: value[:length] if isinstance(value, str)
+                           else value
+                           for key, value in self.attributes.items()},
+        }
+
+
+@contextmanager
+def span(name: str, attributes: dict = None):
+    """Вложенный span текущей трассы, вне трассы ничего не делает."""
+    parent = current_span.get()
+    if parent is None:
+        yield None
+        return
+    child = Span(name, parent.trace, parent.span_id, attributes)
+    token = current_span.set(child)
+    try:
+        yield child
+    except BaseException as error:
+        child.fail(error)
+        raise
+    finally:
+        current_span.reset(token)
+        child.end()
+
+
+@contextmanager
+def start_trace(name: str, exporter, traceparent: str = None):
+    """Корневой span новой трассы или продолжение входящего traceparent."""
+    match = re_traceparent.match(traceparent or '')
+    trace = Trace(exporter, match and match.group('trace_id'))
+    root = Span(name, trace, match and match.group('span_id'))
+    token = current_span.set(root)
+    try:
+        yield root
+    except BaseException as error:
+        root.fail(error)
+        raise
+    finally:
+        current_span.reset(token)
+        root.end()
+        exporter.export(trace, root)
+
+
+def log_context() -> dict:
+    """trace_id и span_id текущего span для структурных логов."""
+    current = current_span.get()
+    if current is None:
+        return {}
+    return {'trace_id': current.trace.trace_id, 'span_id': current.span_id}
+
+
+def install_log_context() -> None:
+    """Атрибуты trace_id и span_id у всех записей логов.
+
+    Формат логов может выводить %(trace_id)s, вне трассы значение '-'.
+    Повторный вызов ничего не меняет.
+    """
+    factory = logging.getLogRecordFactory()
+    if getattr(factory, 'traced', False):
+        return
+
+    def record_factory(*args, **kwargs):
+        record = factory(*args, **kwargs)
+        context = log_context()
+        record.trace_id = context.get('trace_id', '-')
+        record.span_id = context.get('span_id', '-')
+        return record
+    record_factory.traced = True
+    logging.setLogRecordFactory(record_factory)
+
+
+def trace_dict(trace: Trace, root: Span, length: int) -> dict:
+    """Трасса для экспорта: корневой span и все span по времени начала."""
+    return {'trace_id': trace.trace_id, 'name': root.name,
+            'ms': round((root.end_ns - root.start_ns) / 1e6, 3),
+            'spans': [item.as_dict(length) for item in
+                      sorted(trace.spans, key=lambda item: item.start_ns)]}
+
+
+class InMemoryExporter:
+    """Последние трассы в памяти процесса, для тестов и отладки."""
+
+    def __init__(self, limit: int = 1000, length: int = 1000) -> None:
+        """Инициализатор класса."""
+        self.limit = limit
+        self.length = length
+        self.traces = []
+        self.lock = threading.Lock()
+
+    def export(self, trace: Trace, root: Span) -> None:
+        """Сохранение трассы, старые вытесняются."""
+        with self.lock:
+            self.traces.append(trace_dict(trace, root, self.length))
+            del self.traces[:-self.limit]
+
+    def clear(self) -> None:
+        """Удаление сохраненных трасс."""
+        with self.lock:
+            self.traces.clear()
+
+
+class FileExporter:
+    """Трассы строками JSON в файл."""
+
+    def __init__(self, path: str, length: int = 1000) -> None:
+        """Инициализатор класса, каталог файла создается."""
+        self.path = path
+        self.length = length
+        self.lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+
+    def export(self, trace: Trace, root: Span) -> None:
+        """Дозапись трассы в файл."""
+        line = json.dumps(trace_dict(trace, root, self.length),
+                          ensure_ascii=False)
+        with self.lock, open(self.path, 'a', encoding='utf-8') as file:
+            file.write(line + '\n')
+
+
+memory_exporter = InMemoryExporter()
+
+
+def get_exporter(settings):
+    """Экспортер по настройкам TRACING_EXPORTER и TRACING_FILE."""
+    if settings.TRACING_EXPORTER == 'memory':
+        memory_exporter.length = settings.TRACING_ATTRIBUTE_LENGTH
+        return memory_exporter
+    if settings.TRACING_EXPORTER == 'file':
+        return FileExporter(settings.TRACING_FILE,
+                            settings.TRACING_ATTRIBUTE_LENGTH)
+    raise ValueError(f'Неизвестный экспортер {settings.TRACING_EXPORTER}')
+
+
+def read_traces(path: str):
+    """Трассы из файла FileExporter."""
+    with open(path, encoding='utf-8') as file:
+        for line in file:
+            if line.strip():
+                yield json.loads(line)
+
+
+def format_trace(trace: dict) -> list[str]:
+    """Дерево span трассы: начало от корня и длительность в мс."""
+    spans = trace['spans']
+    children = {}
+    for item in spans:
+        children.setdefault(item['parent_id'], []).append(item)
+    ids = {item['span_id'] for item in spans}
+    roots = [item for item in spans if item['parent_id'] not in ids]
+    started = min(item['start_ns'] for item in spans)
+    lines = [f'{trace["trace_id"]} {trace["name"]} {trace["ms"]:.1f} мс']
+
+    def walk(item, depth):
+        attributes = ' '.join(f'{key}={value}' for key, value
+                              in item['attributes'].items())
+        offset = (item['start_ns'] - started) / 1e6
+        error = ' ERROR' if item['status'] == 'error' else ''
+        lines.append(f'{offset:9.1f} {item["ms"]:9.1f}  {"  " * depth}'
+                     f'{item["name"]}{error} {attributes}'.rstrip())
+        for child in children.get(item['span_id'], []):
+            walk(child, depth + 1)
+    for item in roots:
+        walk(item, 0)
+    return lines
@@ -5,7 +5,9 @@ from api.views import (CurrentUserView, SendSmsView, TokenView, EventListView,
                        UsersListView, EventDetailView, UserDetailView,
                        TagsListView, CompetenceListView, UserFavoriteListView,
                        ParticipantsListView, UserParticipationListView,
-                       CitiesListView, JWTTokenRefreshView)
+                       CitiesListView, JWTTokenRefreshView, EventSearchView,
+                       UserSearchView, AutocompleteView, CityEventListView,
+                       RecommendedEventListView, SuggestedUserListView)
 
 urlpatterns = [
     path('token/', TokenView.as_view(), name='token_obtain_pair'),
@@ -15,15 +17,21 @@ urlpatterns = [
     # Пользователи
     path('user/', CurrentUserView.as_view()),
     path('users/', UsersListView.as_view()),
+    path('users/search/', UserSearchView.as_view()),
+    path('users/suggested/', SuggestedUserListView.as_view()),
     path('users/<int:pk>/', UserDetailView.as_view()),
     # События
     path('events/<int:pk>/', EventDetailView.as_view()),
     path('events/', EventListView.as_view()),
+    path('events/search/', EventSearchView.as_view()),
+    path('events/feed/', CityEventListView.as_view()),
+    path('events/recommended/', RecommendedEventListView.as_view()),
     # Остальное
     path('competence/', CompetenceListView.as_view()),
     path('tags/', TagsListView.as_view()),
     path('favorite/', UserFavoriteListView.as_view()),
     path('cities/', CitiesListView.as_view()),
+    path('autocomplete/<str:kind>/', AutocompleteView.as_view()),
     # Участие
     path('events/<int:pk>/users/', ParticipantsListView.as_view()),
     path('users/<int:pk>/events/', UserParticipationListView.as_view()),
@@ -0,0 +1,191 @@
+"""Потоковая загрузка пользователей из XLSX."""
+import itertools
+import logging
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+import openpyxl
+import requests
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from api.carrot_crm_service import CarrotQuest
+from api.models import CrmSync, User
+from api.search import update_user_search_documents
+from api.serializers import CarrotSerializer
+
+logger = logging.getLogger(__name__)
+
+IMPORT_CHUNK_SIZE = 1000
+CRM_SYNC_BATCH_SIZE = 100
+
+
+def read_numbered_rows(file):
+    """Пары номера строки и словаря по заголовку, лист читается потоком."""
+    book = openpyxl.load_workbook(file, read_only=True, data_only=True)
+    try:
+        rows = book.worksheets[0].iter_rows(values_only=True)
+        head = next(rows, ())
+        for number, row in enumerate(rows, start=2):
+            if any(value is not None for value in row):
+                yield number, dict(zip(head, row))
+    finally:
+        book.close()
+
+
+def read_rows(file):
+    """Строки первого листа словарями по заголовку."""
+    return (row for _, row in read_numbered_rows(file))
+
+
+def prepare_user(item: dict) -> dict:
+    """Поля пользователя из строки файла."""
+    phone = str(item['Телефон'])
+    if not phone.startswith('+'):
+        phone = '+' + phone
+    subscription = item.get('Подписка')
+    if isinstance(subscription, datetime) and timezone.is_naive(subscription):
+        subscription = timezone.make_aware(subscription)
+    return {'phone': phone, 'last_name': item.get('Фамилия') or '',
+            'first_name': item.get('Имя') or '',
+            'subscription_expiration_date': subscription}
+
+
+class UserImporter:
+    """Загрузка пользователей пачками строк.
+
+    На пачку один запрос существующих телефонов и bulk_create/bulk_update
+    в транзакции. Массовые операции не вызывают сигналы сохранения,
+    поэтому поисковый текст пересчитывается пачкой, а пользователи
+    ставятся в очередь отправки в CRM в той же транзакции.
+    """
+
+    fields = ('last_name', 'first_name', 'subscription_expiration_date')
+
+    def __init__(self, chunk_size: int = IMPORT_CHUNK_SIZE) -> None:
+        """Инициализатор класса."""
+        self.chunk_size = chunk_size
+
+    def import_rows(self, rows) -> dict:
+        """Загрузка строк, возвращает статистику со скоростью загрузки."""
+        started = time.perf_counter()
+        stats = {'rows': 0, 'created': 0, 'updated': 0}
+        rows = iter(rows)
+        while chunk := list(itertools.islice(rows, self.chunk_size)):
+            stats['rows'] += len(chunk)
+            self.import_chunk([prepare_user(item) for item in chunk], stats)
+        seconds = time.perf_counter() - started
+        stats['seconds'] = seconds
+        stats['rows_per_second'] = stats['rows'] / seconds if seconds else 0
+        return stats
+
+    def import_chunk(self, items: list[dict], stats: dict) -> None:
+        """Загрузка пачки, повтор телефона в пачке - последняя строка."""
+        items = {item['phone']: item for item in items}
+        with transaction.atomic():
+            existing = User.objects.in_bulk(list(items), field_name='phone')
+            created = [User(username=phone, **item)
+                       for phone, item in items.items()
+                       if phone not in existing]
+            updated = []
+            for phone, user in existing.items():
+                item = items[phone]
+                if any(getattr(user, field) != item[field]
+                       for field in self.fields):
+                    for field in self.fields:
+                        setattr(user, field, item[field])
+                    updated.append(user)
+            User.objects.bulk_create(created)
+            User.objects.bulk_update(updated, self.fields)
+            changed = User.objects.filter(
+                phone__in=[user.phone for user in created + updated])
+            update_user_search_documents(changed)
+            enqueue_sync(changed.values_list('pk', flat=True))
+        stats['created'] += len(created)
+        stats['updated'] += len(updated)
+
+
+# поля пользователя, которые CarrotSerializer отправляет в CRM
+CRM_USER_FIELDS = frozenset((
+    'city', 'profession', 'about', 'website', 'telegram', 'instagram',
+    'subscription_expiration_date', 'date_of_registration', 'email',
+    'phone', 'first_name', 'last_name'))
+
+
+def enqueue_sync(user_ids) -> None:
+    """Постановка пользователей в очередь отправки в CRM.
+
+    Вызывается в транзакции изменения данных: очередь фиксируется вместе
+    с ними, переживает перезапуск процесса и обрабатывается воркером
+    run_import_jobs.
+    """
+    if not settings.AUTH_TOKEN_CQ:
+        return
+    CrmSync.objects.bulk_create(
+        (CrmSync(user_id=user_id) for user_id in user_ids),
+        batch_size=IMPORT_CHUNK_SIZE)
+
+
+def claim_sync(size: int) -> list[CrmSync]:
+    """Пачка очереди, занятая воркером на время отправки.
+
+    Отправка пользователя ждет ответа не дольше PROVIDER_TIMEOUT, после
+    этого срока строки пачки может забрать другой воркер.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        tasks = list(CrmSync.objects.select_for_update(skip_locked=True)
+                     .filter(Q(locked_until__isnull=True)
+                             | Q(locked_until__lt=now),
+                             attempts__lt=settings.CRM_SYNC_MAX_ATTEMPTS)
+                     .order_by('pk')[:size])
+        lease = timedelta(seconds=len(tasks) * settings.PROVIDER_TIMEOUT)
+        CrmSync.objects.filter(pk__in=[task.pk for task in tasks]).update(
+            locked_until=now + lease, attempts=F('attempts') + 1)
+    return tasks
+
+
+def send_user(user, session) -> None:
+    """Отправка данных пользователя в Carrot quest, ошибка пробрасывается."""
+    data = CarrotSerializer(user).get_field_ru_names()
+    data['Компетенции'] = ', '.join(
+        competence.name for competence in user.competences.all())
+    analytics = CarrotQuest(user_id=user.pk, session=session,
+                            raise_errors=True)
+    analytics.send_update(data)
+
+
+def process_sync_queue(size: int = CRM_SYNC_BATCH_SIZE) -> dict:
+    """Отправка пачки очереди в CRM одной сессией.
+
+    Отправленные строки удаляются, у неотправленных сохраняется ошибка,
+    повтор - через CRM_SYNC_RETRY_SECONDS.
+    """
+    task_ids = defaultdict(list)
+    for task in claim_sync(size):
+        task_ids[task.user_id].append(task.pk)
+    users = (User.objects.prefetch_related('city', 'competences')
+             .in_bulk(list(task_ids)))
+    stats = {'sent': 0, 'failed': 0}
+    with requests.Session() as session:
+        for user_id, pks in task_ids.items():
+            # строки удаленного пользователя удалены каскадом
+            if user_id not in users:
+                continue
+            tasks = CrmSync.objects.filter(pk__in=pks)
+            try:
+                send_user(users[user_id], session)
+            except requests.RequestException as error:
+                logger.warning('crm sync of user %s failed', user_id,
+                               exc_info=True)
+                retry = timedelta(seconds=settings.CRM_SYNC_RETRY_SECONDS)
+                tasks.update(error=str(error),
+                             locked_until=timezone.now() + retry)
+                stats['failed'] += 1
+            else:
+                tasks.delete()
+                stats['sent'] += 1
+    return stats
@@ -1,25 +1,40 @@
 """Обработчики запросов."""
+import binascii
 import secrets
 import string
+from base64 import b64decode, b64encode
 from datetime import datetime, timedelta
 
+from asgiref.sync import sync_to_async
 from django.conf import settings
-from django.http import Http404, QueryDict
+from django.db import transaction
+from django.db.models import F, Q
+from django.http import Http404, HttpResponse, QueryDict
+from django.utils.cache import get_conditional_response, patch_cache_control
 from django.utils.timezone import localtime
 from django_filters.rest_framework import DjangoFilterBackend
 from drf_yasg import openapi
 from drf_yasg.utils import swagger_auto_schema
 from rest_framework import generics, permissions, status, filters
-from rest_framework.pagination import PageNumberPagination
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
 from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
 from rest_framework.views import APIView
 from rest_framework_simplejwt.views import (TokenObtainPairView,
                                             TokenRefreshView)
 
+from api.async_views import AsyncAPIView, concurrently, run_sync
+from api.autocomplete import Autocomplete
+from api.cache_service import ReferenceCache
 from api.carrot_crm_service import CarrotQuest
+from api.city_feed import city_event_ids
 from api.filters import CompetenceFilter, TagsFilter
+from api.metrics import render_metrics, token_allowed
 from api.models import (SMSAuth, User, Event, Competence, Tags, Favorite,
-                        Participation, City)
+                        Participation, City, EventRecommendation,
+                        PeopleSuggestion)
+from api.search import search_events, search_users
 from api.serializers import (SMSSerializer, UserSerializer, EventSerializer,
                              TagsSerializer, FavoriteSerializer,
                              UserListSerializer, ChangeUserSerializer,
@@ -41,6 +56,51 @@ class Pagination(PageNumberPagination):
     max_page_size = settings.PAGE_SIZE
 
 
+class SearchPagination(BasePagination):
+    """Пагинация по ключу (rank, id) для результатов поиска."""
+
+    page_size = settings.PAGE_SIZE
+    cursor_query_param = 'cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        """Страница после позиции из курсора без OFFSET."""
+        self.request = request
+        queryset = queryset.order_by('-rank', '-id')
+        cursor = self.decode_cursor(request)
+        if cursor:
+            rank, pk = cursor
+            queryset = queryset.filter(Q(rank__lt=rank)
+                                       | Q(rank=rank, id__lt=pk))
+        page = list(queryset[:self.page_size + 1])
+        self.has_next = len(page) > self.page_size
+        self.page = page[:self.page_size]
+        return self.page
+
+    def get_paginated_response(self, data):
+        """Ответ со ссылкой на следующую страницу."""
+        return Response({'next': self.get_next_link(), 'results': data})
+
+    def get_next_link(self):
+        """Ссылка с курсором по последнему элементу страницы."""
+        if not self.has_next:
+            return None
+        last = self.page[-1]
+        cursor = b64encode(f'{last.rank!r}:{last.pk}'.encode()).decode()
+        return replace_query_param(self.request.build_absolute_uri(),
+                                   self.cursor_query_param, cursor)
+
+    def decode_cursor(self, request):
+        """Позиция (rank, id) из параметра запроса."""
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            rank, pk = b64decode(encoded.encode()).decode().split(':')
+            return float(rank), int(pk)
+        except (binascii.Error, UnicodeDecodeError, ValueError):
+            raise NotFound('Неверный курсор')
+
+
 class AuthMixin:
     """Общие методы для авторизации."""
 
@@ -64,19 +124,64 @@ class AuthMixin:
         return response
 
 
-class SendSmsView(AuthMixin, APIView):
+class SendSmsView(AuthMixin, AsyncAPIView):
     """Обработчик отправки смс для авторизации."""
 
     permission_classes = [permissions.AllowAny]
 
     @swagger_auto_schema(request_body=SMSSerializer)
-    def post(self, request):
+    async def post(self, request):
         """Отправка смс с кодом."""
+        result = await run_sync(self.create_code)(request)
+        if isinstance(result, Response):
+            return result
+        user, phone, code = result
+        try:
+            if user.password:
+                await self.send_sms(phone, code)
+            else:
+                # пароль нового пользователя хешируется, пока ждем провайдера
+                await concurrently(self.set_secret_password(user),
+                                   self.send_sms(phone, code))
+        except SmsException:
+            return self.get_error('Невозможно отправить смс. Попробуйте позже')
+
+        return Response(status=status.HTTP_200_OK)
+
+    def create_code(self, request):
+        """Новый код с учетом лимитов или ответ с ошибкой."""
         serializer = SMSSerializer(data=request.data)
         if not serializer.is_valid():
             return Response(serializer.errors,
                             status=status.HTTP_400_BAD_REQUEST)
         phone = serializer.data['phone']
+        # лимиты проверяются до создания пользователя, чтобы отклоненные
+        # запросы не заводили пользователей
+        error = self.check_limits(phone)
+        if error:
+            return error
+
+        user, _ = User.objects.get_or_create(phone=phone, username=phone)
+        with transaction.atomic():
+            # блокировка пользователя упорядочивает параллельные запросы
+            # кода по одному номеру, повторная проверка и новый код атомарны
+            User.objects.select_for_update().get(pk=user.pk)
+            error = self.check_limits(phone)
+            if error:
+                return error
+
+            # отключаем старые коды
+            SMSAuth.objects.filter(phone=phone).update(is_used=True)
+
+            code = 1111
+            if not settings.DEBUG:
+                code = 1000 + secrets.randbelow(8999)
+
+            SMSAuth.objects.create(phone=phone, code=code)
+        return user, phone, code
+
+    def check_limits(self, phone):
+        """Ответ с ошибкой, если лимит запросов кода исчерпан."""
         # проверяем кол-во попыток запроса
         total_send_border = (datetime.now()
                              - timedelta(minutes=settings.SMS_LIMIT))
@@ -88,34 +193,26 @@ class SendSmsView(AuthMixin, APIView):
         last_sms = self.get_last_sms(phone)
         if last_sms:
             return self.get_error('код можно запросить через минуту')
+        return None
 
-        # отключаем старые коды
-        SMSAuth.objects.filter(phone=phone).update(is_used=True)
-
-        code = 1111
-        if not settings.DEBUG:
-            code = 1000 + secrets.randbelow(8999)
-
-        SMSAuth.objects.create(phone=phone, code=code)
-
-        user, _ = User.objects.get_or_create(phone=phone, username=phone)
-        if not user.password:
-            secret_password = make_secret_password()
-            user.set_password(str(secret_password))
-            user.save()
-        try:
-            self.send_sms(phone, code)
-        except SmsException:
-            return self.get_error('Невозможно отправить смс. Попробуйте позже')
+    @staticmethod
+    async def set_secret_password(user):
+        """Случайный пароль пользователя, вход только по коду.
 
-        return Response(status=status.HTTP_200_OK)
+        Хеширование не обращается к базе и идет в общем пуле потоков, чтобы
+        не занимать поток Django.
+        """
+        secret_password = make_secret_password()
+        await sync_to_async(user.set_password,
+                            thread_sensitive=False)(str(secret_password))
+        await run_sync(user.save)(update_fields=['password'])
 
-    def send_sms(self, phone, code):
+    async def send_sms(self, phone, code):
         """Метод отправки смс через сервис."""
         message = f'Код для авторизации: {code}'
         if settings.DEBUG:
             return
-        SmsTraffic().send_sms(phone, message)
+        await SmsTraffic().send_sms_async(phone, message)
 
 
 class TokenView(AuthMixin, TokenObtainPairView):
@@ -135,26 +232,32 @@ class TokenView(AuthMixin, TokenObtainPairView):
             return self.get_error('время кода истекло')
 
         last_sms = last_sms.first()
-        if last_sms.attempts >= settings.CODE_COUNT:
+        # попытка засчитывается одним UPDATE с условием, поэтому
+        # параллельные запросы не дают перебрать больше CODE_COUNT кодов
+        counted = (SMSAuth.objects
+                   .filter(pk=last_sms.pk, attempts__lt=settings.CODE_COUNT)
+                   .update(attempts=F('attempts') + 1))
+        if not counted:
             return self.get_error('кол-во попыток ввода превышено, запросите'
                                   ' код еще раз')
 
-        last_sms.attempts += 1
         if last_sms.code != request.data['password']:
-            last_sms.save()
             return self.get_error('код введен неверно')
 
-        last_sms.is_used = True
-        last_sms.save()
+        # код используется один раз, даже при параллельном вводе
+        used = (SMSAuth.objects.filter(pk=last_sms.pk, is_used=False)
+                .update(is_used=True))
+        if not used:
+            return self.get_error('время кода истекло')
 
         user = User.objects.get(phone=phone)
         password = user.password
         user.set_password(str(last_sms.code))
-        user.save()
+        user.save(update_fields=['password'])
 
         response = self._set_cookie(request, *args, **kwargs)
         user.password = password
-        user.save()
+        user.save(update_fields=['password'])
         return response
 
 
@@ -216,6 +319,46 @@ class UsersListView(generics.ListAPIView):
                 .filter(is_active=True).exclude(photo=''))
 
 
+class UserSearchView(UsersListView):
+    """Поиск по справочнику пользователей с учетом опечаток."""
+
+    @swagger_auto_schema(manual_parameters=[
+        openapi.Parameter('q', openapi.IN_QUERY, type=openapi.TYPE_STRING,
+                          description='Поиск по имени, фамилии, роду '
+                                      'деятельности, компетенциям и о себе')])
+    def get(self, request, *args, **kwargs):
+        """Get запрос поиска пользователей."""
+        if not request.query_params.get('q', '').strip():
+            return Response({'detail': 'Не задан поисковый запрос'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        return super().get(request, *args, **kwargs)
+
+    def get_queryset(self):
+        """Активные пользователи с фото по релевантности."""
+        queryset = search_users(super().get_queryset(),
+                                self.request.query_params['q'])
+        return queryset.order_by('-rank', 'id')
+
+
+class SuggestedUserListView(APIView):
+    """Возможные знакомые пользователя из пакетного расчета."""
+
+    @swagger_auto_schema(responses={200: UserSerializer(many=True)})
+    def get(self, request):
+        """Get запрос возможных знакомых."""
+        suggestion = (PeopleSuggestion.objects
+                      .filter(user_id=request.user.id).first())
+        user_ids = suggestion.users if suggestion else []
+        paginator = Pagination()
+        page_ids = paginator.paginate_queryset(user_ids, request)
+        users = (User.objects.prefetch_related('competences')
+                 .filter(is_active=True).in_bulk(page_ids))
+        serializer = UserSerializer([users[pk] for pk in page_ids
+                                     if pk in users],
+                                    context={'request': request}, many=True)
+        return paginator.get_paginated_response(serializer.data)
+
+
 class UserDetailView(generics.RetrieveAPIView):
     """Получение пользователя."""
 
@@ -240,19 +383,93 @@ class EventListView(generics.ListAPIView):
                 .filter(start_date__gte=today).distinct())
 
 
-class EventDetailView(APIView):
+class CityEventListView(EventListView):
+    """Лента событий городов, по умолчанию городов пользователя."""
+
+    def get_queryset(self):
+        """События городов пользователя, если город не указан явно."""
+        queryset = super().get_queryset()
+        if 'city' in self.request.query_params:
+            return queryset
+        city_ids = list(self.request.user.city.values_list('pk', flat=True))
+        if not city_ids:
+            return queryset
+        return queryset.filter(pk__in=city_event_ids(city_ids, localtime()))
+
+
+class RecommendedEventListView(APIView):
+    """Рекомендованные пользователю события из пакетного расчета."""
+
+    @swagger_auto_schema(responses={200: EventSerializer(many=True)})
+    def get(self, request):
+        """Get запрос рекомендованных событий, без расчета - ближайшие."""
+        today = localtime()
+        recommendation = (EventRecommendation.objects
+                          .filter(user_id=request.user.id).first())
+        if recommendation:
+            actual = set(Event.objects
+                         .filter(pk__in=recommendation.events,
+                                 start_date__gte=today)
+                         .values_list('pk', flat=True))
+            event_ids = [pk for pk in recommendation.events if pk in actual]
+        else:
+            event_ids = list(Event.objects.filter(start_date__gte=today)
+                             .order_by('start_date')
+                             .values_list('pk', flat=True)
+                             [:settings.RECOMMENDATIONS_TOP_N])
+        paginator = Pagination()
+        page_ids = paginator.paginate_queryset(event_ids, request)
+        events = (Event.objects.prefetch_related('tags', 'photos')
+                  .in_bulk(page_ids))
+        # событие могло быть удалено между запросами
+        serializer = EventSerializer([events[pk] for pk in page_ids
+                                      if pk in events],
+                                     context={'request': request},
+                                     many=True)
+        return paginator.get_paginated_response(serializer.data)
+
+
+class EventSearchView(generics.ListAPIView):
+    """Полнотекстовый поиск по актуальным событиям."""
+
+    serializer_class = EventSerializer
+    filter_backends = ()
+    pagination_class = SearchPagination
+
+    @swagger_auto_schema(manual_parameters=[
+        openapi.Parameter('q', openapi.IN_QUERY, type=openapi.TYPE_STRING,
+                          description='Поиск по названию, описанию и адресу')])
+    def get(self, request, *args, **kwargs):
+        """Get запрос поиска событий."""
+        if not request.query_params.get('q', '').strip():
+            return Response({'detail': 'Не задан поисковый запрос'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        return super().get(request, *args, **kwargs)
+
+    def get_queryset(self):
+        """События по запросу, отсортированные по релевантности."""
+        today = localtime()
+        queryset = (Event.objects.prefetch_related('tags', 'photos')
+                    .filter(start_date__gte=today))
+        return search_events(queryset, self.request.query_params['q'])
+
+
+class EventDetailView(AsyncAPIView):
     """Получение события."""
 
-    def get(self, request, pk):
-        """Get запрос события."""
-        event = Event.objects.filter(pk=pk).prefetch_related('photos').first()
+    async def get(self, request, pk):
+        """Get запрос события, аналитика отправляется во время сериализации."""
+        event = await run_sync(Event.objects.filter(pk=pk)
+                               .prefetch_related('photos').first)()
         if not event:
             return Response({'detail': 'Такого события нет'},
                             status=status.HTTP_404_NOT_FOUND)
         serializer = EventSerializer(event, context={'request': request})
         analytics = CarrotQuest(user_id=request.user.id)
-        analytics.send_event(f'просмотр события {event.title}')
-        return Response(serializer.data)
+        data, _ = await concurrently(
+            run_sync(lambda: serializer.data)(),
+            analytics.send_event_async(f'просмотр события {event.title}'))
+        return Response(data)
 
     def post(self, request, pk):
         """Post запрос на участие в событие."""
@@ -284,27 +501,74 @@ class EventDetailView(APIView):
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
-class CompetenceListView(generics.ListAPIView):
+class ReferenceListMixin:
+    """Отдача справочника из кэша с поддержкой условных запросов."""
+
+    def list(self, request, *args, **kwargs):  # noqa: A003
+        """Предсобранный список с ETag по версии таблицы."""
+        reference = ReferenceCache(self.queryset.model)
+        version = reference.get_version()
+        etag = reference.get_etag(version)
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            payload = reference.get_payload(version, self._get_data)
+            response = HttpResponse(payload, content_type='application/json')
+        response['ETag'] = etag
+        patch_cache_control(response, private=True,
+                            max_age=settings.REFERENCE_CACHE_MAX_AGE)
+        return response
+
+    def _get_data(self):
+        """Сериализованный список справочника."""
+        return self.get_serializer(self.get_queryset(), many=True).data
+
+
+class CompetenceListView(ReferenceListMixin, generics.ListAPIView):
     """Получение списка компетенций."""
 
     queryset = Competence.objects.all()
     serializer_class = CompetenceSerializer
 
 
-class TagsListView(generics.ListAPIView):
+class TagsListView(ReferenceListMixin, generics.ListAPIView):
     """Получение списка тегов."""
 
     queryset = Tags.objects.all()
     serializer_class = TagsSerializer
 
 
-class CitiesListView(generics.ListAPIView):
+class CitiesListView(ReferenceListMixin, generics.ListAPIView):
     """Получение списка городов."""
 
     queryset = City.objects.all()
     serializer_class = CitySerializer
 
 
+class AutocompleteView(APIView):
+    """Подсказки по префиксу для городов, компетенций и тегов."""
+
+    @swagger_auto_schema(manual_parameters=[
+        openapi.Parameter('q', openapi.IN_QUERY, type=openapi.TYPE_STRING,
+                          description='Начало названия'),
+        openapi.Parameter('limit', openapi.IN_QUERY,
+                          type=openapi.TYPE_INTEGER,
+                          description='Количество подсказок')])
+    def get(self, request, kind):
+        """Get запрос подсказок справочника."""
+        if kind not in Autocomplete.models:
+            return Response({'detail': 'Такого справочника нет'},
+                            status=status.HTTP_404_NOT_FOUND)
+        try:
+            limit = int(request.query_params.get(
+                'limit', settings.AUTOCOMPLETE_LIMIT))
+        except ValueError:
+            return Response({'detail': 'limit должен быть числом'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        limit = max(min(limit, settings.AUTOCOMPLETE_MAX_LIMIT), 0)
+        prefix = request.query_params.get('q', '')
+        return Response(Autocomplete.search(kind, prefix, limit))
+
+
 class UserFavoriteListView(APIView):
     """Получение списка избранного."""
 
@@ -375,3 +639,13 @@ class UserParticipationListView(APIView):
         serializer = EventSerializer(result_page, context={'request': request},
                                      many=True)
         return paginator.get_paginated_response(serializer.data)
+
+
+def metrics_view(request):
+    """Метрики Prometheus, без METRICS_ENABLED - 404."""
+    if not settings.METRICS_ENABLED:
+        raise Http404
+    if not token_allowed(request):
+        return HttpResponse(status=status.HTTP_403_FORBIDDEN)
+    content, content_type = render_metrics()
+    return HttpResponse(content, content_type=content_type)
@@ -13,6 +13,8 @@ import os
 from datetime import timedelta
 from pathlib import Path
 
+from django.core.exceptions import ImproperlyConfigured
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -37,6 +39,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'rest_framework',
     'drf_yasg',
     'django_filters',
@@ -45,7 +48,13 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.middleware.TracingMiddleware',
+    'api.middleware.MetricsMiddleware',
+    'api.middleware.ProfilingMiddleware',
+    'api.middleware.QueryLogMiddleware',
+    'api.middleware.ReplicaMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'api.middleware.CompressionMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -79,17 +88,82 @@ WSGI_APPLICATION = 'app.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/3.1/ref/settings/#databases
 
+# Соединения с базой. При DB_POOL_SIZE > 0 соединения берутся из
+# ограниченного пула процесса (api.pool) и возвращаются в него после
+# запроса, иначе поток держит соединение DB_CONN_MAX_AGE секунд (0 -
+# закрытие после запроса). DB_STATEMENT_TIMEOUT - предел времени запроса
+# в мс только для веб процессов: app.wsgi и app.asgi задают WEB_PROCESS, а
+# команды manage.py, в том числе migrate и загрузки, работают без предела
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', '0'))
+# ожидание свободного соединения в секундах
+DB_POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', '10'))
+# соединение дольше этого простоя в секундах закрывается
+DB_POOL_MAX_IDLE = float(os.environ.get('DB_POOL_MAX_IDLE', '300'))
+# соединение дольше этого простоя проверяется запросом SELECT 1
+DB_POOL_CHECK_AFTER = float(os.environ.get('DB_POOL_CHECK_AFTER', '5'))
+DB_STATEMENT_TIMEOUT = (int(os.environ.get('DB_STATEMENT_TIMEOUT', '0'))
+                        if os.environ.get('WEB_PROCESS') == 'true' else 0)
+
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.postgresql_psycopg2',
+        'ENGINE': ('api.pool' if DB_POOL_SIZE
+                   else 'django.db.backends.postgresql_psycopg2'),
         'NAME': os.environ.get('POSTGRES_DB'),
         'USER': os.environ.get('POSTGRES_USER'),
         'PASSWORD': os.environ.get('POSTGRES_PASSWORD'),
         'HOST': os.environ.get('POSTGRES_HOST', 'db'),
         'PORT': os.environ.get('POSTGRES_PORT', 5432),
+        'CONN_MAX_AGE': (0 if DB_POOL_SIZE
+                         else int(os.environ.get('DB_CONN_MAX_AGE', '0'))),
+        'OPTIONS': ({'options': f'-c statement_timeout={DB_STATEMENT_TIMEOUT}'}
+                    if DB_STATEMENT_TIMEOUT else {}),
     }
 }
 
+# Локальный запуск тестов без postgres, поиск работает через icontains
+if os.environ.get('DB_ENGINE') == 'sqlite':
+    DATABASES['default'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'db.sqlite3',
+    }
+
+# Реплики для чтения запросов api: POSTGRES_REPLICAS=host[:port][/name],...
+# остальные параметры подключения как у default
+DATABASE_REPLICAS = []
+for number, replica in enumerate(
+        filter(None, os.environ.get('POSTGRES_REPLICAS', '').split(',')), 1):
+    address, _, name = replica.strip().partition('/')
+    host, _, port = address.partition(':')
+    alias = f'replica{number}'
+    DATABASES[alias] = {**DATABASES['default'], 'HOST': host,
+                        'PORT': port or DATABASES['default']['PORT'],
+                        'NAME': name or DATABASES['default']['NAME'],
+                        'TEST': {'MIRROR': 'default'}}
+    DATABASE_REPLICAS.append(alias)
+DATABASE_ROUTERS = ['api.db_router.ReplicaRouter']
+REPLICA_PATH_PREFIX = '/api/'
+# чтения пользователя идут в основную базу столько секунд после его записи
+REPLICA_STICKY_SECONDS = int(os.environ.get('REPLICA_STICKY_SECONDS', '10'))
+# реплика с большим отставанием в секундах не используется
+REPLICA_MAX_LAG = float(os.environ.get('REPLICA_MAX_LAG', '5'))
+REPLICA_LAG_CHECK_SECONDS = 5
+
+# Версии справочников хранятся в кэше, при нескольких процессах
+# нужен общий бэкенд (memcached, redis), иначе сброс виден только локально
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get(
+            'CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('CACHE_LOCATION', ''),
+    }
+}
+# закрепление чтений за основной базой должно быть видно всем процессам
+if DATABASE_REPLICAS and CACHES['default']['BACKEND'] in (
+        'django.core.cache.backends.locmem.LocMemCache',
+        'django.core.cache.backends.dummy.DummyCache'):
+    raise ImproperlyConfigured('POSTGRES_REPLICAS требует общий бэкенд кэша '
+                               'в CACHE_BACKEND')
+
 
 # Password validation
 # https://docs.djangoproject.com/en/3.1/ref/settings/#auth-password-validators
@@ -121,6 +195,15 @@ REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticated',
     ),
+    'DEFAULT_RENDERER_CLASSES': (
+        'api.renderers.ORJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
+    'DEFAULT_PARSER_CLASSES': (
+        'api.renderers.ORJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ),
     'DEFAULT_FILTER_BACKENDS':
         ['django_filters.rest_framework.DjangoFilterBackend'],
     'TEST_REQUEST_DEFAULT_FORMAT': 'json'
@@ -202,14 +285,92 @@ SECURE_PROXY_SSL_HEADER = ('HTTP_X_FORWARDED_PROTO', 'https')
 
 SMS_TRAFFIC_LOGIN = os.environ.get('SMS_TRAFFIC_LOGIN')
 SMS_TRAFFIC_PASSWORD = os.environ.get('SMS_TRAFFIC_PASSWORD')
-SMS_TRAFFIC_API = 'http://api.smstraffic.ru/multi.php'
+SMS_TRAFFIC_API = os.environ.get('SMS_TRAFFIC_API',
+                                 'http://api.smstraffic.ru/multi.php')
 SMS_TRAFFIC_ORIGINATOR = os.environ.get('ORIGINATOR', 'App')
 
 DATA_UPLOAD_MAX_NUMBER_FIELDS = 2000
 
 AUTH_TOKEN_CQ = os.environ.get('AUTH_TOKEN_CQ')
+CARROT_API = os.environ.get('CARROT_API', 'https://api.carrotquest.io/v1')
+# таймаут запросов к smstraffic и Carrot quest в секундах
+PROVIDER_TIMEOUT = float(os.environ.get('PROVIDER_TIMEOUT', '10'))
+# соединений с провайдерами у async view одного процесса, остальные
+# запросы ждут свободное соединение в пределах PROVIDER_TIMEOUT
+PROVIDER_MAX_CONNECTIONS = int(os.environ.get('PROVIDER_MAX_CONNECTIONS',
+                                              '100'))
+
+# Профилирование запросов: Server-Timing и лог фаз, выборочные дампы
+PROFILING_ENABLED = (os.environ.get('PROFILING_ENABLED', 'False').lower()
+                     == 'true')
+# доля запросов с полным профилем в режиме PROFILING_MODE
+PROFILING_SAMPLE_RATE = float(os.environ.get('PROFILING_SAMPLE_RATE', '0'))
+PROFILING_MODE = os.environ.get('PROFILING_MODE', 'cprofile')
+# профиль по заголовку X-Profile: cprofile или tracemalloc
+PROFILING_ALLOW_HEADER = DEBUG
+PROFILING_DIR = os.environ.get('PROFILING_DIR',
+                               os.path.join(BASE_DIR, 'profiles'))
+PROFILING_TRACEMALLOC_FRAMES = 10
+PROFILING_TRACEMALLOC_TOP = 50
+
+# Метрики Prometheus на /metrics, для нескольких процессов задается
+# PROMETHEUS_MULTIPROC_DIR; вне DEBUG нужен Bearer токен METRICS_TOKEN
+METRICS_ENABLED = (os.environ.get('METRICS_ENABLED', 'False').lower()
+                   == 'true')
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+
+# Лог api.sql: медленные запросы и повторы одной формы запроса (N+1)
+SLOW_QUERY_LOG_ENABLED = (os.environ.get('SLOW_QUERY_LOG_ENABLED',
+                                         'False').lower() == 'true')
+SLOW_QUERY_MS = float(os.environ.get('SLOW_QUERY_MS', '100'))
+NPLUSONE_THRESHOLD = int(os.environ.get('NPLUSONE_THRESHOLD', '10'))
+SLOW_QUERY_STACK_DEPTH = 8
+SLOW_QUERY_SQL_LENGTH = 1000
+
+# Трассировка запросов: span view, SQL, сериализаторов, провайдеров и
+# сигналов; экспорт в память процесса (memory) или строками JSON в файл
+TRACING_ENABLED = (os.environ.get('TRACING_ENABLED', 'False').lower()
+                   == 'true')
+TRACING_EXPORTER = os.environ.get('TRACING_EXPORTER', 'file')
+TRACING_FILE = os.environ.get('TRACING_FILE',
+                              os.path.join(BASE_DIR, 'traces',
+                                           'traces.jsonl'))
+TRACING_ATTRIBUTE_LENGTH = 1000
 CARROT_ID_PREFIX = os.environ.get('CARROT_ID_PREFIX')
 TEST_USER_NUMBER = '+71234567890'
 TEST_USER_CODE = '9854'
 
 PAGE_SIZE = 5
+
+# Кэш справочников: время жизни ответа у клиента и собранного ответа в кэше
+REFERENCE_CACHE_MAX_AGE = 60 * 60
+REFERENCE_CACHE_TIMEOUT = 60 * 60 * 24
+
+# Сжатие ответов api: префикс пути, минимальный размер тела, качество brotli
+COMPRESSION_PATH_PREFIX = '/api/'
+COMPRESSION_MIN_SIZE = 1024
+BROTLI_QUALITY = 5
+
+# Подсказки по справочникам: количество по умолчанию и максимальное
+AUTOCOMPLETE_LIMIT = 10
+AUTOCOMPLETE_MAX_LIMIT = 50
+
+# Количество рекомендованных событий на пользователя
+RECOMMENDATIONS_TOP_N = 100
+
+# Количество возможных знакомых на пользователя
+PEOPLE_SUGGESTIONS_TOP_K = 50
+
+# Загрузка в статусе выполнения без обновлений дольше этого времени
+# считается упавшей и продолжается другим воркером, секунды
+IMPORT_JOB_STALE_SECONDS = 300
+
+# Очередь отправки в CRM: попыток на пользователя и пауза перед повтором
+CRM_SYNC_MAX_ATTEMPTS = 5
+CRM_SYNC_RETRY_SECONDS = 60
+
+# Список таблицы без фильтров больше этого числа строк в админке
+# показывает оценку из статистики postgres вместо COUNT(*)
+ADMIN_ESTIMATED_COUNT_THRESHOLD = 100000
+# Максимум записей справочника в результатах поиска админки
+ADMIN_REFERENCE_SEARCH_LIMIT = 1000
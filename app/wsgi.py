@@ -12,5 +12,7 @@ import os
 from django.core.wsgi import get_wsgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'app.settings')
+# DB_STATEMENT_TIMEOUT действует только в веб процессах
+os.environ.setdefault('WEB_PROCESS', 'true')
 
 application = get_wsgi_application()
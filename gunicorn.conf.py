@@ -0,0 +1,28 @@
+"""Настройки gunicorn, файл подхватывается из рабочего каталога.
+
+Хуки обслуживают каталог PROMETHEUS_MULTIPROC_DIR метрик нескольких
+процессов: файлы прошлого запуска удаляются до старта воркеров, файлы
+остановленного воркера помечаются через mark_process_dead.
+"""
+import os
+
+from prometheus_client import multiprocess
+
+wsgi_app = 'app.wsgi:application'
+
+
+def on_starting(server):
+    """Очистка каталога метрик до запуска воркеров."""
+    directory = os.environ.get('PROMETHEUS_MULTIPROC_DIR')
+    if not directory:
+        return
+    os.makedirs(directory, exist_ok=True)
+    for name in os.listdir(directory):
+        if name.endswith('.db'):
+            os.remove(os.path.join(directory, name))
+
+
+def child_exit(server, worker):
+    """Метрики остановленного воркера."""
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        multiprocess.mark_process_dead(worker.pid)